@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0038_remove_patientprofile_accounts_pa_blood_g_af6665_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', '-timestamp', '-id'], name='chat_message_room_idx'),
+        ),
+    ]
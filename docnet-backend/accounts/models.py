@@ -179,6 +179,11 @@ class Message(models.Model):
     file = models.FileField(upload_to='chat_uploads/', null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', '-timestamp', '-id'], name='chat_message_room_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender.username} at {self.timestamp}"        
     
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import authenticate
 from .models import User,  PatientProfile, Appointment
 from doctor.models import DoctorProfile, DoctorSlot,ContactMessage
+from doctor.serializers import DoctorProfileSerializer as BaseDoctorProfileSerializer
 from cloudinary.uploader import upload
 from datetime import datetime,timedelta
 from django.utils import timezone
@@ -17,6 +18,7 @@ from rest_framework import serializers
 from .models import Payment, Appointment,EmergencyPayment
 from django.db import transaction
 from django.conf import settings
+from core.utils import DoctorStatsManager
 from decimal import Decimal
 import razorpay
 
@@ -216,84 +218,71 @@ class UserProfileUpdateSerializer(serializers.Serializer):
             'is_verified': user.is_verified
         }
 
-class DoctorProfileSerializer(serializers.ModelSerializer):
-    username = serializers.CharField(source='user.username', read_only=True)
-    email = serializers.EmailField(source='user.email', read_only=True)
-    phone = serializers.CharField(source='user.phone', read_only=True, required=False)
+class DoctorProfileSerializer(BaseDoctorProfileSerializer):
+    """
+    Patient-facing directory representation. Expects the queryset to carry the
+    ``next_slot_date``/``next_slot_time`` annotations from DoctorListView and
+    only falls back to a per-doctor query when they are missing.
+    """
     rating = serializers.SerializerMethodField()
     total_reviews = serializers.SerializerMethodField()
     availability_status = serializers.SerializerMethodField()
     next_available_slot = serializers.SerializerMethodField()
     available_today = serializers.BooleanField(read_only=True)
     
-    class Meta:
-        model = DoctorProfile
-        fields = [
-            'id', 'username', 'email', 'phone', 'registration_id',
-            'hospital', 'languages', 'age', 'gender', 'experience',
-            'specialization', 'slug', 'rating', 'total_reviews',
-            'availability_status', 'next_available_slot', 'available_today'
+    class Meta(BaseDoctorProfileSerializer.Meta):
+        fields = ['id'] + BaseDoctorProfileSerializer.Meta.fields + [
+            'rating', 'total_reviews', 'availability_status',
+            'next_available_slot', 'available_today'
         ]
     
     def get_rating(self, obj):
-        
-        return 4.5  
+        return round(obj.rating_avg, 1)
     
     def get_total_reviews(self, obj): 
-        return 10 
+        return obj.rating_count
+
+    def _get_next_slot(self, obj):
+        if hasattr(obj, 'next_slot_date'):
+            return obj.next_slot_date, obj.next_slot_time
+
+        next_slot = DoctorSlot.objects.filter(
+            doctor=obj,
+            date__gte=timezone.now().date(),
+            is_booked=False
+        ).order_by('date', 'start_time').values_list('date', 'start_time').first()
+        return next_slot or (None, None)
     
     def get_next_available_slot(self, obj):
-        try:
-            today = timezone.now().date()
-            
-           
-            next_slot = DoctorSlot.objects.filter(
-                doctor=obj,
-                date__gte=today,
-                is_booked=False
-            ).order_by('date', 'start_time').first()
-            
-            if next_slot:
-                is_today = next_slot.date == today
-                days_from_now = (next_slot.date - today).days
-                
-                return {
-                    'date': next_slot.date.isoformat(),
-                    'time': next_slot.start_time.strftime('%I:%M %p'),
-                    'is_today': is_today,
-                    'days_from_now': days_from_now,
-                    'has_available_slots': True
-                }
-            
-            return {
-            'has_available_slots': False
-        }
-            
-        except Exception as e:
+        slot_date, slot_time = self._get_next_slot(obj)
+        if slot_date is None:
             return {
                 'has_available_slots': False
             }
+
+        today = timezone.now().date()
+        return {
+            'date': slot_date.isoformat(),
+            'time': slot_time.strftime('%I:%M %p'),
+            'is_today': slot_date == today,
+            'days_from_now': (slot_date - today).days,
+            'has_available_slots': True
+        }
     
     def get_availability_status(self, obj):
-        try:
-            next_slot_info = self.get_next_available_slot(obj)
-            
-            if not next_slot_info:
-                return 'No Available Slots'
-            
-            days_from_now = next_slot_info['days_from_now']
-            
-            if days_from_now == 0:
-                return 'Available Today'
-            elif days_from_now == 1:
-                return 'Available Tomorrow'
-            elif days_from_now <= 7:
-                return f'Available in {days_from_now} days'
-            else:
-                return 'Available Soon'
-                
-        except Exception as e:
-            return 'Check Availability'  
+        slot_date, slot_time = self._get_next_slot(obj)
+        if slot_date is None:
+            return 'No Available Slots'
+
+        days_from_now = (slot_date - timezone.now().date()).days
+        if days_from_now == 0:
+            return 'Available Today'
+        elif days_from_now == 1:
+            return 'Available Tomorrow'
+        elif days_from_now <= 7:
+            return f'Available in {days_from_now} days'
+        else:
+            return 'Available Soon'
 
 
 class DoctorSlotViewSerializer(serializers.ModelSerializer):
@@ -325,19 +314,21 @@ class CreatePaymentSerializer(serializers.ModelSerializer):
             }
         })
 
-        payment = Payment.objects.create(
-            slot=slot,
-            patient=patient,
-            amount=amount,
-            payment_status='pending',
-            payment_id=razorpay_order['id']
-        )
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                slot=slot,
+                patient=patient,
+                amount=amount,
+                payment_status='pending',
+                payment_id=razorpay_order['id']
+            )
 
-        appointment = Appointment.objects.create(
-            payment=payment,
-            reason=reason,
-            status='scheduled'
-        )
+            appointment = Appointment.objects.create(
+                payment=payment,
+                reason=reason,
+                status='scheduled'
+            )
+            DoctorStatsManager.appointment_booked(slot.doctor_id)
 
         return {
             "payment": payment,
@@ -739,12 +730,10 @@ class EmergencyDoctorSerializer(serializers.ModelSerializer):
         ]
     
     def get_rating(self, obj):
-        
-        return 4.5  
+        return round(obj.rating_avg, 1)
     
     def get_total_reviews(self, obj):
-       
-        return 150 
+        return obj.rating_count
     
     def get_consultation_fee(self, obj):
       
@@ -888,6 +877,7 @@ class VerifyEmergencyPaymentSerializer(serializers.Serializer):
             
             payment.start_consultation()
             payment.save()
+            DoctorStatsManager.emergency_payment_succeeded(payment.doctor_id, payment.amount)
 
             doctor = payment.doctor
             wallet, created = Wallet.objects.get_or_create(
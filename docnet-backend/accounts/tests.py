@@ -1,3 +1,508 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import StringIO
+from datetime import time, timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django_redis import get_redis_connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from accounts.models import User, DoctorReview, ChatRoom, Message, EmergencyPayment, Payment, Appointment, Notification
+from accounts.tasks import send_appointment_day_notifications
+from channels.layers import get_channel_layer
+from doctor.models import DoctorProfile, DoctorSlot
+from core.cache import TaggedResponseCache
+from core.emails import EmailDispatcher
+from core.otp import OTPStore
+from core.utils import OTPManager
+from config.consumers import ChatConsumer, VideoCallConsumer
+from core.video import VideoRoomRegistry, VideoRoomTicket
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+INMEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DoctorListViewQueryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.doctor_count = 0
+
+    def create_doctors(self, count):
+        today = timezone.now().date()
+        for _ in range(count):
+            self.doctor_count += 1
+            n = self.doctor_count
+            user = User.objects.create(username=f'doctor{n}', email=f'doctor{n}@example.com', role='doctor')
+            doctor = DoctorProfile.objects.create(
+                user=user, registration_id=f'REG{n}', is_approved=True, experience=n
+            )
+            for day in range(3):
+                DoctorSlot.objects.create(
+                    doctor=doctor, date=today + timedelta(days=day), start_time=time(10, 0),
+                    duration=30, consultation_type='video', max_patients=1, is_booked=(day == 0)
+                )
+            DoctorReview.objects.create(patient=self.patient, doctor=doctor, rating=4, comment='Good')
+
+    def count_list_queries(self):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('doctors-list'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def test_query_count_is_independent_of_page_size(self):
+        self.create_doctors(2)
+        small_page_queries, small_page = self.count_list_queries()
+
+        self.create_doctors(13)
+        full_page_queries, full_page = self.count_list_queries()
+
+        self.assertEqual(len(small_page['results']), 2)
+        self.assertEqual(len(full_page['results']), 15)
+        self.assertEqual(small_page_queries, full_page_queries)
+
+    def test_next_available_slot_comes_from_annotation(self):
+        self.create_doctors(1)
+        _, data = self.count_list_queries()
+
+        doctor = data['results'][0]
+        tomorrow = timezone.now().date() + timedelta(days=1)
+        self.assertEqual(doctor['next_available_slot']['date'], tomorrow.isoformat())
+        self.assertEqual(doctor['next_available_slot']['days_from_now'], 1)
+        self.assertEqual(doctor['availability_status'], 'Available Tomorrow')
+        self.assertFalse(doctor['available_today'])
+        self.assertEqual(doctor['average_rating'], 4.0)
+
+
+class DoctorRatingAggregateTests(TestCase):
+    def setUp(self):
+        user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=user, registration_id='REG1', is_approved=True)
+        self.patients = [
+            User.objects.create(username=f'patient{n}', email=f'patient{n}@example.com', role='patient')
+            for n in range(3)
+        ]
+
+    def test_reviews_update_rating_columns(self):
+        reviews = [
+            DoctorReview.objects.create(patient=patient, doctor=self.doctor, rating=rating, comment='ok')
+            for patient, rating in zip(self.patients, [5, 4, 3])
+        ]
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.rating_count, 3)
+        self.assertAlmostEqual(self.doctor.rating_avg, 4.0)
+
+        reviews[0].delete()
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.rating_count, 2)
+        self.assertAlmostEqual(self.doctor.rating_avg, 3.5)
+
+        DoctorReview.objects.all().delete()
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.rating_count, 0)
+        self.assertEqual(self.doctor.rating_avg, 0)
+
+    def test_editing_a_review_updates_rating_columns(self):
+        reviews = [
+            DoctorReview.objects.create(patient=patient, doctor=self.doctor, rating=rating, comment='ok')
+            for patient, rating in zip(self.patients, [5, 4])
+        ]
+        reviews[1].rating = 1
+        reviews[1].save()
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.rating_count, 2)
+        self.assertAlmostEqual(self.doctor.rating_avg, 3.0)
+
+    def test_rebuild_corrects_drift(self):
+        DoctorReview.objects.create(patient=self.patients[0], doctor=self.doctor, rating=2, comment='meh')
+        DoctorProfile.objects.filter(id=self.doctor.id).update(rating_avg=5, rating_count=9)
+
+        call_command('rebuild_doctor_ratings', stdout=StringIO())
+        self.doctor.refresh_from_db()
+        self.assertEqual(self.doctor.rating_count, 1)
+        self.assertAlmostEqual(self.doctor.rating_avg, 2.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DoctorSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        doctors = [
+            ('Anita', 'Rao', 'Cardiology', 'City Hospital'),
+            ('Rahul', 'Menon', 'Dermatology', 'Cardio Care Clinic'),
+            ('Meera', 'Nair', 'Neurology', 'General Hospital'),
+        ]
+        for n, (first, last, specialization, hospital) in enumerate(doctors):
+            user = User.objects.create(
+                username=f'doctor{n}', email=f'doctor{n}@example.com', role='doctor',
+                first_name=first, last_name=last
+            )
+            DoctorProfile.objects.create(
+                user=user, registration_id=f'REG{n}', is_approved=True,
+                specialization=specialization, hospital=hospital
+            )
+
+    def test_search_ranks_specialization_above_hospital(self):
+        response = self.client.get(reverse('doctors-list'), {'search': 'cardio'})
+        names = [doctor['username'] for doctor in response.json()['results']]
+        self.assertEqual(names, ['doctor0', 'doctor1'])
+
+    def test_search_matches_a_partially_typed_word(self):
+        response = self.client.get(reverse('doctors-list'), {'search': 'card'})
+        names = [doctor['username'] for doctor in response.json()['results']]
+        self.assertEqual(names, ['doctor0', 'doctor1'])
+
+        response = self.client.get(reverse('doctors-list'), {'search': 'anita ca'})
+        self.assertEqual([doctor['username'] for doctor in response.json()['results']], ['doctor0'])
+
+    def test_search_vector_follows_user_name_changes(self):
+        user = User.objects.get(username='doctor2')
+        user.last_name = 'Kurian'
+        user.save()
+
+        response = self.client.get(reverse('doctors-list'), {'search': 'kurian'})
+        self.assertEqual([d['username'] for d in response.json()['results']], ['doctor2'])
+
+    def test_autocomplete_matches_prefixes(self):
+        response = self.client.get(reverse('doctors-autocomplete'), {'q': 'card'})
+        results = response.json()['results']
+        self.assertEqual([r['name'] for r in results], ['Dr. Anita Rao', 'Dr. Rahul Menon'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DoctorDirectoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=self.user, registration_id='REG1', is_approved=True)
+        self.slot = DoctorSlot.objects.create(
+            doctor=self.doctor, date=timezone.now().date() + timedelta(days=1), start_time=time(10, 0),
+            duration=30, consultation_type='video', max_patients=1
+        )
+
+    def get_slot_ids(self):
+        response = self.client.get(reverse('doctor-slots', args=[self.user.username]))
+        return [slot['id'] for slots in response.json()['data'].values() for slot in slots]
+
+    def test_booking_a_slot_invalidates_cached_slots(self):
+        self.assertEqual(self.get_slot_ids(), [self.slot.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_slot_ids(), [self.slot.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.slot.is_booked = True
+            self.slot.save()
+
+        self.assertEqual(self.get_slot_ids(), [])
+
+    def test_cached_entries_vary_on_accept(self):
+        url = reverse('doctor-slots', args=[self.user.username])
+        html = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertTrue(html['Content-Type'].startswith('text/html'))
+
+        response = self.client.get(url)
+        self.assertTrue(response['Content-Type'].startswith('application/json'))
+        self.assertEqual(self.get_slot_ids(), [self.slot.id])
+
+    def test_expired_entry_is_served_stale_while_another_request_rebuilds(self):
+        self.get_slot_ids()
+        key = TaggedResponseCache._response_key(
+            RequestFactory().get(reverse('doctor-slots', args=[self.user.username]))
+        )
+        entry = cache.get(key)
+        entry['fresh_until'] = 0
+        cache.set(key, entry)
+        cache.add(f'{key}:lock', 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_slot_ids(), [self.slot.id])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CHANNEL_LAYERS=INMEMORY_CHANNEL_LAYERS, CHAT_HISTORY_PAGE_SIZE=3)
+class ChatConsumerTests(TransactionTestCase):
+    # Consumers close the connection between database_sync_to_async calls, which
+    # a TestCase transaction would not survive.
+
+    def setUp(self):
+        self.doctor = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.room = ChatRoom.objects.create(doctor=self.doctor, patient=self.patient)
+        self.messages = [
+            Message.objects.create(room=self.room, sender=self.patient if n % 2 else self.doctor, content=f'msg {n}')
+            for n in range(7)
+        ]
+
+    async def connect(self):
+        token = AccessToken.for_user(self.patient)
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f'/ws/chat/?room_id={self.room.id}&token={token}')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    @async_to_sync
+    async def fetch_history(self):
+        communicator = await self.connect()
+        pages = [await communicator.receive_json_from()]
+        while pages[-1]['has_more']:
+            await communicator.send_json_to({'type': 'load_before', 'before': pages[-1]['before']})
+            pages.append(await communicator.receive_json_from())
+        await communicator.disconnect()
+        return pages
+
+    def test_history_is_sent_newest_page_first_and_loaded_backwards(self):
+        pages = self.fetch_history()
+
+        self.assertEqual([page['type'] for page in pages], ['history', 'history_page', 'history_page'])
+        self.assertEqual([m['message'] for m in pages[0]['messages']], ['msg 4', 'msg 5', 'msg 6'])
+        loaded = [m['id'] for page in reversed(pages) for m in page['messages']]
+        self.assertEqual(loaded, [m.id for m in self.messages])
+
+    def test_malformed_history_cursor_is_rejected(self):
+        for before in ('e30=', 'WyIyMDI0LTAxLTAxVDAwOjAwOjAwKzAwOjAwIiwgIngiXQ==', 12):
+            self.assertEqual(self.send_message({'type': 'load_before', 'before': before}), {'error': 'Invalid history cursor.'})
+
+    @async_to_sync
+    async def send_message(self, payload):
+        communicator = await self.connect()
+        await communicator.receive_json_from()
+        await communicator.send_json_to(payload)
+        reply = await communicator.receive_json_from()
+        await communicator.disconnect()
+        return reply
+
+    def test_attachments_are_uploaded_over_http_and_referenced_over_the_socket(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        upload = SimpleUploadedFile('scan.pdf', b'%PDF-1.4 test', content_type='application/pdf')
+
+        with self.settings(MEDIA_ROOT=media_root):
+            response = client.post(
+                reverse('chat-attachment-upload', args=[self.room.id]), {'file': upload}, format='multipart'
+            )
+            self.assertEqual(response.status_code, 201)
+            reply = self.send_message({'message': 'report', 'file_ref': response.json()['file_ref']})
+
+        self.assertEqual(reply['type'], 'chat_message')
+        self.assertTrue(reply['file'].endswith('.pdf'))
+        self.assertTrue(Message.objects.get(id=reply['id']).file.name.startswith('chat_uploads/'))
+
+        forged = self.send_message({'message': 'x', 'file_ref': response.json()['file_ref'] + 'x'})
+        self.assertEqual(forged, {'error': 'Invalid or expired attachment.'})
+
+
+@override_settings(CHANNEL_LAYERS=INMEMORY_CHANNEL_LAYERS)
+class VideoCallConsumerTests(TransactionTestCase):
+    def setUp(self):
+        try:
+            VideoRoomRegistry.members('ticket_test')
+        except Exception as e:
+            self.skipTest(f'Redis is not available: {e}')
+        doctor_user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        self.patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.emergency = EmergencyPayment.objects.create(doctor=doctor, patient=self.patient, payment_status='success')
+
+    def communicator(self, room_name, query):
+        communicator = WebsocketCommunicator(VideoCallConsumer.as_asgi(), f'/ws/emergency/{room_name}/?{query}')
+        communicator.scope['url_route'] = {'kwargs': {'room_name': room_name}}
+        return communicator
+
+    @async_to_sync
+    async def connect(self, room_name, query):
+        communicator = self.communicator(room_name, query)
+        connected, code = await communicator.connect()
+        result = (await communicator.receive_json_from()) if connected else code
+        await communicator.disconnect()
+        return connected, result
+
+    def test_validate_endpoint_issues_a_ticket_the_consumer_accepts(self):
+        client = APIClient()
+        client.force_authenticate(self.patient)
+        data = client.get(reverse('validate-emergency-video-call', args=[self.emergency.id])).json()
+
+        connected, joined = self.connect(data['room_name'], f"ticket={data['ticket']}")
+        self.assertTrue(connected)
+        self.assertEqual((joined['type'], joined['userId']), ('joined', self.patient.id))
+
+    def test_ticket_is_bound_to_its_room(self):
+        ticket, _ = VideoRoomTicket.issue('emergency_999', self.patient.id)
+        self.assertEqual(VideoRoomTicket.verify(ticket, 'emergency_999'), self.patient.id)
+        self.assertIsNone(VideoRoomTicket.verify(ticket, f'emergency_{self.emergency.id}'))
+
+        connected, code = self.connect(f'emergency_{self.emergency.id}', f'ticket={ticket}')
+        self.assertFalse(connected)
+        self.assertEqual(code, 4001)
+
+    def test_signals_go_only_to_the_peer_with_ice_candidates_batched(self):
+        room_name = f'emergency_{self.emergency.id}'
+        doctor_ticket, _ = VideoRoomTicket.issue(room_name, self.emergency.doctor.user_id)
+        patient_ticket, _ = VideoRoomTicket.issue(room_name, self.patient.id)
+        self.addCleanup(get_redis_connection('default').delete, VideoRoomRegistry._stats_key(room_name))
+
+        @async_to_sync
+        async def call():
+            doctor = self.communicator(room_name, f'ticket={doctor_ticket}')
+            patient = self.communicator(room_name, f'ticket={patient_ticket}')
+            await doctor.connect()
+            self.assertTrue((await doctor.receive_json_from())['isOfferer'])
+            await patient.connect()
+            self.assertFalse((await patient.receive_json_from())['isOfferer'])
+            self.assertEqual((await doctor.receive_json_from())['type'], 'user_joined')
+
+            for n in range(2):
+                await doctor.send_json_to({'type': 'ice', 'candidate': {'n': n}})
+            await doctor.send_json_to({'type': 'offer', 'sdp': 'v=0'})
+            received = [await patient.receive_json_from() for _ in range(3)]
+            self.assertTrue(await doctor.receive_nothing())
+
+            await doctor.disconnect()
+            await patient.disconnect()
+            return received
+
+        received = call()
+        self.assertEqual([m['type'] for m in received], ['ice', 'ice', 'offer'])
+        self.assertEqual(VideoRoomRegistry.stats(room_name), {'messages': 3, 'channel_sends': 2})
+
+
+@override_settings(CACHES=LOCMEM_CACHE, CHANNEL_LAYERS=INMEMORY_CHANNEL_LAYERS, APPOINTMENT_REMINDER_BATCH_SIZE=2)
+class AppointmentDayNotificationTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        self.patients = []
+        for n, day in enumerate([0, 0, 0, 1]):
+            patient = User.objects.create(username=f'patient{n}', email=f'patient{n}@example.com', role='patient')
+            slot = DoctorSlot.objects.create(
+                doctor=doctor, date=timezone.localdate() + timedelta(days=day), start_time=time(9 + n, 0),
+                duration=30, consultation_type='video', max_patients=1
+            )
+            payment = Payment.objects.create(slot=slot, patient=patient, payment_status='success')
+            Appointment.objects.create(payment=payment)
+            self.patients.append(patient)
+
+    def test_reminders_are_created_and_pushed_in_batches(self):
+        channel_layer = get_channel_layer()
+        channel = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'notifications_{self.patients[0].id}', channel)
+
+        # Two chunks of savepoint, select, insert, update, release plus the final empty select.
+        with self.assertNumQueries(13):
+            self.assertEqual(send_appointment_day_notifications(), 3)
+
+        self.assertEqual(
+            sorted(Notification.objects.values_list('receiver__username', flat=True)),
+            ['patient0', 'patient1', 'patient2']
+        )
+        self.assertFalse(Appointment.objects.filter(payment__slot__date=timezone.localdate(), notification_sent=False).exists())
+        event = async_to_sync(channel_layer.receive)(channel)
+        self.assertEqual((event['sender'], event['message']), ('doctor', 'Reminder: You have an appointment today at 09:00:00.'))
+        self.assertEqual(send_appointment_day_notifications(), 0)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OTPStoreTests(TestCase):
+    def setUp(self):
+        try:
+            self.redis = get_redis_connection('default')
+            self.clear_keys()
+        except Exception as e:
+            self.skipTest(f'Redis is not available: {e}')
+        self.addCleanup(self.clear_keys)
+        # OTP mail goes through the outbox; the tests flush it themselves instead of scheduling a task.
+        schedule = mock.patch('accounts.tasks.flush_email_outbox.apply_async')
+        schedule.start()
+        self.addCleanup(schedule.stop)
+        self.user = User.objects.create(username='patient', email='Patient@example.com', role='patient')
+
+    def clear_keys(self):
+        for pattern in ('otp:*', 'otp_send:*'):
+            keys = self.redis.keys(pattern)
+            if keys:
+                self.redis.delete(*keys)
+        outbox = EmailDispatcher.OTP
+        self.redis.delete(
+            EmailDispatcher.outbox_key(outbox), EmailDispatcher.processing_key(outbox), EmailDispatcher.failures_key(outbox)
+        )
+        cache.delete_many([EmailDispatcher.flush_scheduled_key(outbox), EmailDispatcher.flush_lock_key(outbox)])
+
+    def test_code_is_burned_after_max_attempts(self):
+        otp = OTPManager.create_otp_verification(self.user)
+        for _ in range(4):
+            self.assertEqual(OTPManager.verify_otp(self.user, '000000')['error'], 'Invalid OTP')
+        self.assertEqual(
+            OTPManager.verify_otp(self.user, '000000')['error'], 'Too many incorrect attempts, please request a new OTP'
+        )
+        self.assertEqual(OTPManager.verify_otp(self.user, otp)['error'], 'OTP expired, please request a new one')
+
+    def test_code_expires_with_its_key_and_is_consumed_on_use(self):
+        otp = OTPManager.create_otp_verification(self.user)
+        ttl = self.redis.ttl(OTPStore._key(self.user.id, 'registration'))
+        self.assertTrue(0 < ttl <= 120)
+        self.assertTrue(OTPManager.verify_otp(self.user, otp)['success'])
+        self.assertTrue(OTPManager.verify_otp(self.user, otp, consume=True)['success'])
+        self.assertFalse(OTPManager.verify_otp(self.user, otp)['success'])
+
+    @override_settings(OTP_RESEND_COOLDOWN=0, OTP_EMAIL_SEND_LIMIT=2)
+    def test_password_reset_sends_are_throttled_per_email(self):
+        client = APIClient()
+        url = reverse('send_password_reset_otp')
+        for _ in range(2):
+            self.assertEqual(client.post(url, {'email': 'Patient@example.com'}).status_code, 200)
+        response = client.post(url, {'email': 'Patient@example.com'})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(response.data['details']['retry_after'], int(response['Retry-After']))
+        self.assertEqual(EmailDispatcher.flush(EmailDispatcher.OTP), 2)
+        self.assertEqual([m.subject for m in mail.outbox], ['DOCNET – Your Password Reset Code'] * 2)
+
+    def test_resend_is_throttled_per_ip(self):
+        others = [
+            User.objects.create(username=f'other{n}', email=f'other{n}@example.com', role='patient') for n in range(2)
+        ]
+        client = APIClient(HTTP_X_FORWARDED_FOR='203.0.113.7')
+        with self.settings(OTP_IP_SEND_LIMIT=2, TRUSTED_PROXY_COUNT=1):
+            for user in others:
+                self.assertEqual(client.post('/api/resend-otp/', {'user_id': user.id}).status_code, 200)
+            self.assertEqual(client.post('/api/resend-otp/', {'user_id': self.user.id}).status_code, 429)
+            # Another client behind the same proxy has its own count.
+            response = APIClient(HTTP_X_FORWARDED_FOR='203.0.113.8').post('/api/resend-otp/', {'user_id': self.user.id})
+            self.assertEqual(response.status_code, 200)
+        # A repeat request for the same email is held back by the cooldown.
+        self.assertEqual(client.post('/api/resend-otp/', {'user_id': others[0].id}).status_code, 429)
+
+    @override_settings(TRUSTED_PROXY_COUNT=None, OTP_UNKNOWN_IP_SEND_LIMIT=2, OTP_IP_SEND_LIMIT=1)
+    def test_unknown_client_ips_share_a_global_limit(self):
+        others = [
+            User.objects.create(username=f'other{n}', email=f'other{n}@example.com', role='patient') for n in range(2)
+        ]
+        for user in others:
+            response = APIClient(REMOTE_ADDR=f'203.0.113.{user.id % 250}').post('/api/resend-otp/', {'user_id': user.id})
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(APIClient().post('/api/resend-otp/', {'user_id': self.user.id}).status_code, 429)
+
+    def test_client_ip_only_trusts_configured_proxy_hops(self):
+        request = RequestFactory().post(
+            '/', REMOTE_ADDR='10.0.0.1', HTTP_X_FORWARDED_FOR='1.2.3.4, 203.0.113.7, 10.0.0.2'
+        )
+        cases = [(None, None), (0, '10.0.0.1'), (1, '10.0.0.2'), (2, '203.0.113.7'), (4, None)]
+        for proxies, expected in cases:
+            with self.settings(TRUSTED_PROXY_COUNT=proxies):
+                self.assertEqual(OTPManager.client_ip(request), expected)
@@ -1,8 +1,8 @@
 from django.urls import path
 from .views import UserRegistrationView, UserLoginView, VerifyOTPView, ResendOTPView, PatientProfileView,PatientProfileUpdateView, CheckEmailView,SendPasswordResetOTPView, VerifyPasswordResetOTPView, GoogleLoginView,BookingConfirmationByPaymentView,DoctorReviewListView,SubmitDoctorReviewView
 from .views import ResetPasswordView, ChangePasswordView, UserLogoutView, DoctorListView, DoctorDetailView, DoctorSlotsView, CreatePaymentView, VerifyPaymentView, BookingHistoryView,AppointmentDetailView, ValidateVideoCallAPI,EmergencyDoctorListView,EmergencyConsultationListView
-from .views import CreateEmergencyPaymentView, VerifyEmergencyPaymentView, ValidateEmergencyVideoCallAPI,EmergencyConsultationConfirmationView, ValidateChatAccessAPI, MedicalRecordListView, MedicalRecordDetailView,UserNotificationListView,ActiveDoctorsView,EmergencyConsultationDetailView
-from .views import DownloadReceiptView,ContactMessageView,SubmitDoctorReportView,HasConsultedDoctorView,MarkNotificationAsReadView,MarkAllNotificationsReadView,DeleteNotificationView
+from .views import CreateEmergencyPaymentView, VerifyEmergencyPaymentView, ValidateEmergencyVideoCallAPI,EmergencyConsultationConfirmationView, ValidateChatAccessAPI, MedicalRecordListView, MedicalRecordDetailView,UserNotificationListView,ActiveDoctorsView,EmergencyConsultationDetailView, ChatAttachmentUploadView
+from .views import DownloadReceiptView,ContactMessageView,SubmitDoctorReportView,HasConsultedDoctorView,MarkNotificationAsReadView,MarkAllNotificationsReadView,DeleteNotificationView,DoctorSearchAutocompleteView
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='register'),
@@ -19,6 +19,7 @@ urlpatterns = [
     path('google/callback/', GoogleLoginView.as_view(), name='google_login'),
     path('logout/', UserLogoutView.as_view(), name='logout'),
     path('doctors-list/',DoctorListView.as_view(), name='doctors-list' ),
+    path('doctors-list/autocomplete/', DoctorSearchAutocompleteView.as_view(), name='doctors-autocomplete'),
     path('doctor-details/<slug:slug>/', DoctorDetailView.as_view(), name='doctor-details'),
     path('doctor-slots/<slug:slug>/', DoctorSlotsView.as_view(), name='doctor-slots'),
     path('payments/create/', CreatePaymentView.as_view(), name='create-payment'),
@@ -35,6 +36,7 @@ urlpatterns = [
     path('validate-emergency-video-call/<int:emergency_id>/', ValidateEmergencyVideoCallAPI.as_view(), name='validate-emergency-video-call'),
     path('emergency-confirmation/payment/<int:payment_id>/',EmergencyConsultationConfirmationView.as_view(),name='emergency-consultation-confirmation'),
     path('validate-chat/<int:slot_id>/',ValidateChatAccessAPI.as_view(), name='validate-chat'),
+    path('chat/<int:room_id>/attachments/', ChatAttachmentUploadView.as_view(), name='chat-attachment-upload'),
     path('records/', MedicalRecordListView.as_view(), name='medical-records-list'),
     path('records/<int:pk>/', MedicalRecordDetailView.as_view(), name='medical-record-detail'),
     path('user-notifications/', UserNotificationListView.as_view(), name='doctor-notifications'),
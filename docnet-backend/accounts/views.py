@@ -9,7 +9,6 @@ import requests
 from django.http import FileResponse
 from django.http import JsonResponse
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.contrib.contenttypes.models import ContentType
@@ -21,12 +20,17 @@ from django.utils.timezone import localtime
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 from core.models import SiteSetting
+from core.search import DoctorSearchFilter, DoctorSearchManager
+from core.cache import tagged_cache_page, DoctorDirectoryCache
+from core.otp import OTPRateLimited
+from core.video import VideoRoomTicket
 from .models import OTPVerification, PatientProfile, Appointment, Payment,EmergencyPayment, ChatRoom, Message,MedicalRecord, Notification,DoctorReview,DoctorReport
 from doctor.models import DoctorProfile
 from doctor.serializers import DoctorProfileSerializer
 from rest_framework import generics, filters, permissions
+from rest_framework.parsers import MultiPartParser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Exists, OuterRef
+from django.db.models import Exists, OuterRef, Subquery
 from doctor.models import DoctorProfile, DoctorSlot
 from django.shortcuts import get_object_or_404
 from doctor.serializers import DoctorProfileSerializer
@@ -49,6 +53,7 @@ from .serializers import (
     NotificationSerializer,DoctorReviewSerializer,
     ContactMessageSerializer,DoctorReportSerializer
 )
+from .serializers import DoctorProfileSerializer as DoctorDirectorySerializer
 from core.utils import (
     OTPManager, 
     EmailManager, 
@@ -56,7 +61,8 @@ from core.utils import (
     PasswordManager, 
     GoogleAuthManager, 
     UserManager, 
-    ResponseManager
+    ResponseManager,
+    ChatAttachmentManager
 )
 user_logger = logging.getLogger('accounts')
 auth_logger = logging.getLogger('authentication')
@@ -79,22 +85,25 @@ class UserRegistrationView(APIView):
         serializer = UserRegistrationSerializer(data=data)
         
         if serializer.is_valid():
-            with transaction.atomic():
-                user = serializer.save()
-                otp = OTPManager.create_otp_verification(user)
-
-                email_queued = EmailManager.send_registration_otp(user.email, otp, 'patient')
-                if not email_queued:
-                    user_logger.error(f"Failed to queue OTP email for {user.email}")
-
-                return ResponseManager.success_response(
-                    data={
-                        'user_id': user.id,
-                        'email': user.email,
-                    },
-                    message='User registered successfully. Please verify your email with the OTP sent.',
-                    status_code=status.HTTP_201_CREATED
-                )
+            try:
+                with transaction.atomic():
+                    user = serializer.save()
+                    otp = OTPManager.create_otp_verification(user, client_ip=OTPManager.client_ip(request))
+
+                    email_queued = EmailManager.send_registration_otp(user.email, otp, 'patient')
+                    if not email_queued:
+                        user_logger.error(f"Failed to queue OTP email for {user.email}")
+
+                    return ResponseManager.success_response(
+                        data={
+                            'user_id': user.id,
+                            'email': user.email,
+                        },
+                        message='User registered successfully. Please verify your email with the OTP sent.',
+                        status_code=status.HTTP_201_CREATED
+                    )
+            except OTPRateLimited as e:
+                return ResponseManager.rate_limited_response(e)
         
         return ResponseManager.validation_error_response(serializer.errors)
 
@@ -118,15 +127,13 @@ class VerifyOTPView(APIView):
         try:
             user = User.objects.get(id=user_id)
             
-            result = OTPManager.verify_otp(user, entered_otp, 'registration', expiry_minutes=settings.OTP_EXPIRY_MINUTES)
+            result = OTPManager.verify_otp(user, entered_otp, 'registration', consume=True)
             
             if result['success']:
                 
                 user.is_verified = True
                 user.save()
                 
-                result['otp_verification'].delete()
-                
                 return ResponseManager.success_response(
                     data={'success': True},
                     message='OTP verified successfully'
@@ -153,7 +160,7 @@ class ResendOTPView(APIView):
         try:
             user = User.objects.get(id=user_id)
             
-            otp = OTPManager.create_otp_verification(user)
+            otp = OTPManager.create_otp_verification(user, client_ip=OTPManager.client_ip(request))
             email_queued = EmailManager.send_registration_otp(user.email, otp, 'patient')
             if not email_queued:
                 user_logger.error(f"Failed to queue OTP email for {user.email}")
@@ -162,6 +169,8 @@ class ResendOTPView(APIView):
                 message='OTP resent successfully'
             )
             
+        except OTPRateLimited as e:
+            return ResponseManager.rate_limited_response(e)
         except User.DoesNotExist:
             return ResponseManager.error_response(
                 'User not found',
@@ -272,9 +281,9 @@ class SendPasswordResetOTPView(APIView):
                     'No patient account found with this email address'
                 )
             
-            otp = OTPManager.create_otp_verification(user, 'password_reset')
+            otp = OTPManager.create_otp_verification(user, 'password_reset', OTPManager.client_ip(request))
             
-            email_queued = EmailManager.send_registration_otp(user.email, otp, 'patient')
+            email_queued = EmailManager.send_password_reset_otp(user.email, otp, 'patient')
             if not email_queued:
                 user_logger.error(f"Failed to queue OTP email for {user.email}")
             
@@ -283,6 +292,8 @@ class SendPasswordResetOTPView(APIView):
                 message='OTP sent successfully'
             )
             
+        except OTPRateLimited as e:
+            return ResponseManager.rate_limited_response(e)
         except Exception as e:
             return ResponseManager.error_response(
                 f'An error occurred: {str(e)}',
@@ -491,7 +502,7 @@ class UserLogoutView(APIView):
                 message='Logged out with warnings',
                 status_code=status.HTTP_200_OK
             )
-@method_decorator(cache_page(60 * 10), name='dispatch')        
+@method_decorator(tagged_cache_page(60 * 10, lambda: [DoctorDirectoryCache.DIRECTORY_TAG]), name='dispatch')
 class ActiveDoctorsView(APIView):
     def get(self, request):
         doctors = DoctorProfile.objects.filter(
@@ -501,21 +512,28 @@ class ActiveDoctorsView(APIView):
         serializer = DoctorProfileSerializer(doctors, many=True)
         return Response(serializer.data)  
           
-@method_decorator(cache_page(60 * 5), name='dispatch')      
+@method_decorator(tagged_cache_page(60 * 5, lambda: [DoctorDirectoryCache.DIRECTORY_TAG]), name='dispatch')
 class DoctorListView(generics.ListAPIView):
-    serializer_class = DoctorProfileSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    serializer_class = DoctorDirectorySerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, DoctorSearchFilter]
     filterset_fields = ['specialization', 'gender', 'experience']
-    search_fields = ['user__first_name', 'user__last_name', 'specialization', 'hospital']  
-    ordering_fields = ['experience', 'created_at']
+    ordering_fields = ['experience', 'created_at', 'rating_avg', 'rating_count']
     ordering = ['-experience']
 
     def get_queryset(self):
         today = timezone.now().date()
+        next_slot = DoctorSlot.objects.filter(
+            doctor=OuterRef('pk'),
+            date__gte=today,
+            is_booked=False
+        ).order_by('date', 'start_time')
+
+        # Everything the directory serializer needs is resolved here so a page
+        # of doctors costs the same number of queries regardless of its size.
         queryset = DoctorProfile.objects.filter(
             is_approved=True,
             user__is_active=True 
-        ).select_related('user').prefetch_related('slots').annotate(
+        ).select_related('user').annotate(
             available_today = Exists(
                 DoctorSlot.objects.filter(
                     doctor=OuterRef('pk'),
@@ -529,18 +547,11 @@ class DoctorListView(generics.ListAPIView):
                     date__gte=today,
                     is_booked=False
                 )
-            )
+            ),
+            next_slot_date=Subquery(next_slot.values('date')[:1]),
+            next_slot_time=Subquery(next_slot.values('start_time')[:1]),
         )
 
-        search_query = self.request.query_params.get('search', None)
-        if search_query:
-            queryset = queryset.filter(
-                Q(user__first_name__icontains=search_query) |
-                Q(user__last_name__icontains=search_query) |
-                Q(specialization__icontains=search_query) |
-                Q(hospital__icontains=search_query)
-            )
-        
         availability = self.request.query_params.get('availability',None)
         if availability:
             if availability == 'Available today':
@@ -569,7 +580,28 @@ class DoctorListView(generics.ListAPIView):
             
         return queryset  
        
-@method_decorator(cache_page(60 * 10), name='dispatch')
+class DoctorSearchAutocompleteView(APIView):
+    def get(self, request):
+        query = DoctorSearchManager.prefix_query(request.query_params.get('q', ''))
+        if query is None:
+            return Response({'results': []})
+
+        doctors = DoctorSearchManager.rank(
+            DoctorProfile.objects.filter(is_approved=True, user__is_active=True), query
+        ).order_by('-search_rank', '-rating_avg').values(
+            'id', 'slug', 'user__first_name', 'user__last_name', 'specialization', 'hospital'
+        )[:settings.DOCTOR_AUTOCOMPLETE_LIMIT]
+
+        results = [{
+            'id': doctor['id'],
+            'slug': doctor['slug'],
+            'name': f"Dr. {doctor['user__first_name']} {doctor['user__last_name']}".strip(),
+            'specialization': doctor['specialization'],
+            'hospital': doctor['hospital'],
+        } for doctor in doctors]
+        return Response({'results': results})
+
+@method_decorator(tagged_cache_page(60 * 10, lambda slug: [DoctorDirectoryCache.detail_tag(slug)]), name='dispatch')
 class DoctorDetailView(APIView):
     def get(self, request, slug):
         try:
@@ -579,7 +611,8 @@ class DoctorDetailView(APIView):
         except DoctorProfile.DoesNotExist:
             return ResponseManager.error_response(error_message="Doctor not found", status_code=404)
 
-@method_decorator(cache_page(30), name='dispatch')      
+# Slots drop out as their start time passes, so keep the freshness window short
+@method_decorator(tagged_cache_page(30, lambda slug: [DoctorDirectoryCache.slots_tag(slug)], stale_timeout=30), name='dispatch')
 class DoctorSlotsView(APIView):
     def get(self, request, slug):
         now = localtime() 
@@ -766,16 +799,20 @@ class ValidateVideoCallAPI(APIView):
     def get(self, request, slot_id):
         try:
             now = timezone.now()
-            print(request)
-            print(slot_id)
 
-            appointment = Appointment.objects.get(
+            appointment = Appointment.objects.select_related('payment__slot__doctor').get(
                 payment__slot__id=slot_id,
                 status='scheduled',
                 payment__payment_status='success'
             )
 
             slot = appointment.payment.slot
+            if request.user.id not in (slot.doctor.user_id, appointment.payment.patient_id):
+                return Response(
+                    {"error": "You are not authorized to join this video call"},
+                    status=status.HTTP_403_FORBIDDEN
+                )
+
             slot_time = datetime.combine(slot.date, slot.start_time)
             slot_time = timezone.make_aware(slot_time, timezone.get_current_timezone())
 
@@ -788,9 +825,12 @@ class ValidateVideoCallAPI(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
+            ticket, expires_in = VideoRoomTicket.issue(str(slot_id), request.user.id, end_window.timestamp())
             return Response({
                 "valid": True,
                 "room_name": str(slot_id),
+                "ticket": ticket,
+                "ticket_expires_in": expires_in,
             })
 
         except Appointment.DoesNotExist:
@@ -844,13 +884,12 @@ class BookingConfirmationByPaymentView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@method_decorator(cache_page(60 * 10), name='dispatch')
+@method_decorator(tagged_cache_page(60 * 10, lambda: [DoctorDirectoryCache.DIRECTORY_TAG]), name='dispatch')
 class EmergencyDoctorListView(generics.ListAPIView):
     serializer_class = DoctorProfileSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter, DoctorSearchFilter]
     filterset_fields = ['specialization', 'gender']
-    search_fields = ['user__first_name', 'user__last_name', 'specialization', 'hospital']
-    ordering_fields = ['experience', 'created_at']
+    ordering_fields = ['experience', 'created_at', 'rating_avg', 'rating_count']
     ordering = ['-experience']
 
     def get_queryset(self):
@@ -981,9 +1020,13 @@ class ValidateEmergencyVideoCallAPI(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
+            room_name = f"emergency_{emergency_id}"
+            ticket, expires_in = VideoRoomTicket.issue(room_name, user.id)
             return Response({
                 "valid": True,
-                "room_name": f"emergency_{emergency_id}",
+                "room_name": room_name,
+                "ticket": ticket,
+                "ticket_expires_in": expires_in,
                 "is_doctor": is_doctor,
                 "is_patient": is_patient,
                 "doctor_name": emergency_payment.doctor.user.username,
@@ -1142,6 +1185,30 @@ class ValidateChatAccessAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+
+
+class ChatAttachmentUploadView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, room_id):
+        room = get_object_or_404(ChatRoom, id=room_id)
+        if request.user.id not in (room.doctor_id, room.patient_id):
+            return Response({"error": "You are not authorized for this chat"}, status=status.HTTP_403_FORBIDDEN)
+        if not room.is_active:
+            return Response({"error": "Chat period expired."}, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        if not upload:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
+        error = ChatAttachmentManager.validate(upload)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        name, ref = ChatAttachmentManager.store(room, request.user, upload)
+        logger.info(f"Stored chat attachment {name} for room {room.id}")
+        return Response({"file_ref": ref, "name": upload.name}, status=status.HTTP_201_CREATED)
+
         
 class MedicalRecordListView(generics.ListAPIView):
     serializer_class = MedicalRecordSerializer
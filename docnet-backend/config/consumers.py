@@ -1,59 +1,49 @@
+import asyncio
 import json
 import logging
 from django.utils import timezone
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from asgiref.sync import sync_to_async
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from accounts.models import Appointment, EmergencyPayment
 from urllib.parse import parse_qs
-from django.core.files.base import ContentFile
-import base64
 from django.contrib.auth import get_user_model
 import uuid
 from accounts.models import Message,ChatRoom
 from datetime import  datetime
 from django.conf import settings
+from core.pagination import KeysetCursor
+from core.utils import ChatAttachmentManager
+from core.video import VideoRoomRegistry, VideoRoomTicket
 logger = logging.getLogger(__name__)
 
+# The web client sends 'ice'; 'ice-candidate' is kept for older clients.
+ICE_MESSAGE_TYPES = ('ice', 'ice-candidate')
 
-rooms = {}
 
 class VideoCallConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'videocall_{self.room_name}'
         self.user_id = None
+        self.joined = False
+        self.peers = []
+        self.ice_buffer = []
+        self.flush_task = None
+        self.relayed = 0
+        self.channel_sends = 0
         self.is_emergency = self.room_name.startswith('emergency_')
         
         try:
             query_string = self.scope['query_string'].decode()
             query_params = parse_qs(query_string)
-            
-            if 'token' not in query_params:
-                logger.error("No token provided")
-                await self.close(code=4001)
-                return
-                
-            token = query_params['token'][0]
-            
-            try:
-                access_token = AccessToken(token)
-                self.user_id = access_token['user_id']
-                
-                if self.is_emergency:
-                    emergency_id = self.room_name.replace('emergency_', '')
-                    if not await self.validate_emergency_consultation(emergency_id, self.user_id):
-                        await self.close(code=4004)
-                        return
-                else:
-                    if not await self.validate_appointment(self.room_name, self.user_id):
-                        await self.close(code=4004)
-                        return
-                    
-            except (InvalidToken, TokenError) as e:
-                logger.error(f"Invalid token: {e}")
-                await self.close(code=4003)
+
+            if 'ticket' in query_params:
+                self.user_id = VideoRoomTicket.verify(query_params['ticket'][0], self.room_name)
+
+            if self.user_id is None and not await self.authorize_with_token(query_params):
                 return
             
          
@@ -66,13 +56,9 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
                 self.channel_name
             )
             
-           
-            is_offerer = False
-            if self.room_name not in rooms:
-                rooms[self.room_name] = [self.channel_name]
-                is_offerer = True
-            else:
-                rooms[self.room_name].append(self.channel_name)
+            self.peers = await sync_to_async(VideoRoomRegistry.join)(self.room_name, self.channel_name, self.user_id)
+            self.joined = True
+            is_offerer = not self.peers
             
           
             await self.send(text_data=json.dumps({
@@ -97,8 +83,35 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error in connect: {e}")
             await self.close(code=4000)
 
+    async def authorize_with_token(self, query_params):
+        """Fallback for clients without a valid room ticket: JWT plus a database check."""
+        if 'token' not in query_params:
+            logger.error("No token provided")
+            await self.close(code=4001)
+            return False
+
+        try:
+            access_token = AccessToken(query_params['token'][0])
+            self.user_id = access_token['user_id']
+        except (InvalidToken, TokenError) as e:
+            logger.error(f"Invalid token: {e}")
+            await self.close(code=4003)
+            return False
+
+        if self.is_emergency:
+            emergency_id = self.room_name.replace('emergency_', '')
+            allowed = await self.validate_emergency_consultation(emergency_id, self.user_id)
+        else:
+            allowed = await self.validate_appointment(self.room_name, self.user_id)
+        if not allowed:
+            await self.close(code=4004)
+            return False
+        return True
+
     async def disconnect(self, close_code):        
-       
+        if getattr(self, 'ice_buffer', None):
+            await self.flush_ice()
+
         if hasattr(self, 'room_group_name') and hasattr(self, 'user_id'):
             await self.channel_layer.group_send(
                 self.room_group_name,
@@ -117,30 +130,35 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
             )
         
       
-        if hasattr(self, 'room_name') and self.room_name in rooms:
-            if self.channel_name in rooms[self.room_name]:
-                rooms[self.room_name].remove(self.channel_name)
-            if not rooms[self.room_name]:
-                del rooms[self.room_name]
+        if getattr(self, 'joined', False):
+            try:
+                await sync_to_async(VideoRoomRegistry.leave)(self.room_name, self.channel_name)
+                await self.record_stats()
+            except Exception as e:
+                logger.error(f"Failed to leave video room {self.room_name}: {e}")
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             message_type = data.get('type')
                     
-            if message_type in ['offer', 'answer', 'ice-candidate', 'chat']:
-              
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        "type": "signal_message",
-                        "message": data,
-                        "sender_channel": self.channel_name,
-                        "sender_user": self.user_id
-                    }
-                )
+            if message_type in ICE_MESSAGE_TYPES:
+                self.relayed += 1
+                if settings.VIDEO_ICE_BATCH_WINDOW > 0:
+                    self.ice_buffer.append(data)
+                    if self.flush_task is None:
+                        self.flush_task = asyncio.create_task(self.flush_ice_later())
+                else:
+                    await self.relay([data])
+            elif message_type in ['offer', 'answer', 'chat']:
+                self.relayed += 1
+                # Candidates must not overtake the description they belong to.
+                if self.ice_buffer:
+                    await self.flush_ice()
+                await self.relay([data])
             elif message_type == 'ping':
-               
+                if not await sync_to_async(VideoRoomRegistry.heartbeat)(self.room_name, self.channel_name):
+                    await sync_to_async(VideoRoomRegistry.join)(self.room_name, self.channel_name, self.user_id)
                 await self.send(text_data=json.dumps({
                     "type": "pong",
                     "timestamp": data.get('timestamp')
@@ -151,13 +169,50 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error in receive from user {self.user_id}: {e}")
 
+    async def relay(self, messages):
+        """Send signaling messages straight to the other members' channels."""
+        event = {
+            "type": "signal_message",
+            "messages": messages,
+            "sender_channel": self.channel_name,
+            "sender_user": self.user_id
+        }
+        for peer in self.peers:
+            await self.channel_layer.send(peer, event)
+            self.channel_sends += 1
+
+        if self.relayed >= settings.VIDEO_STATS_FLUSH_EVERY:
+            await self.record_stats()
+
+    async def flush_ice_later(self):
+        await asyncio.sleep(settings.VIDEO_ICE_BATCH_WINDOW)
+        self.flush_task = None
+        await self.flush_ice()
+
+    async def flush_ice(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        messages, self.ice_buffer = self.ice_buffer, []
+        if messages:
+            await self.relay(messages)
+
+    async def record_stats(self):
+        relayed, channel_sends = self.relayed, self.channel_sends
+        self.relayed = self.channel_sends = 0
+        if relayed or channel_sends:
+            await sync_to_async(VideoRoomRegistry.record_relay)(self.room_name, relayed, channel_sends)
+
     async def signal_message(self, event):
         if event["sender_channel"] != self.channel_name:
-            await self.send(text_data=json.dumps(event["message"]))
-            logger.debug(f"Forwarded message from user {event.get('sender_user')} to user {self.user_id}")
+            for message in event["messages"]:
+                await self.send(text_data=json.dumps(message))
+            logger.debug(f"Forwarded {len(event['messages'])} messages from user {event.get('sender_user')} to user {self.user_id}")
 
     async def user_joined(self, event):
         if event["sender_channel"] != self.channel_name:
+            if event["sender_channel"] not in self.peers:
+                self.peers.append(event["sender_channel"])
             await self.send(text_data=json.dumps({
                 "type": "user_joined",
                 "userId": event["userId"]
@@ -165,6 +220,8 @@ class VideoCallConsumer(AsyncWebsocketConsumer):
 
     async def user_left(self, event):
         if event["sender_channel"] != self.channel_name:
+            if event["sender_channel"] in self.peers:
+                self.peers.remove(event["sender_channel"])
             await self.send(text_data=json.dumps({
                 "type": "user_left",
                 "userId": event["userId"]
@@ -256,11 +313,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
 
         
-        messages = await self.get_chat_history()
-        await self.send(text_data=json.dumps({
-            'type': 'history',
-            'messages': messages
-        }))
+        history = await self.get_chat_history()
+        await self.send(text_data=json.dumps({'type': 'history', **history}))
 
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
@@ -277,23 +331,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
                     'is_typing': data.get('is_typing', False),
                 }
             )
+        elif data.get('type') == 'load_before':
+            await self.load_before(data)
         else:
             await self.handle_message(data)
 
+    async def load_before(self, data):
+        position = KeysetCursor.decode(data.get('before') or '')
+        if position is None:
+            await self.send(text_data=json.dumps({"error": "Invalid history cursor."}))
+            return
+
+        try:
+            limit = int(data.get('limit', settings.CHAT_HISTORY_PAGE_SIZE))
+        except (TypeError, ValueError):
+            limit = settings.CHAT_HISTORY_PAGE_SIZE
+
+        history = await self.get_chat_history(before=position, limit=limit)
+        await self.send(text_data=json.dumps({'type': 'history_page', **history}))
+
     async def handle_message(self, data):
         content = data.get('message', '')
-        file_data = data.get('file')
+        file_ref = data.get('file_ref')
 
         if not await self.is_chat_allowed():
             await self.send(text_data=json.dumps({"error": "Chat period expired."}))
             return
 
-        message = await self.save_message(content, file_data)
+        file_name = None
+        if file_ref:
+            file_name = ChatAttachmentManager.resolve(file_ref, self.room.id, self.user.id)
+            if file_name is None:
+                await self.send(text_data=json.dumps({"error": "Invalid or expired attachment."}))
+                return
+
+        message = await self.save_message(content, file_name)
 
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message',
+                'id': message.id,
                 'sender': self.user.username,
                 'message': content,
                 'file': get_absolute_url(message.file.url) if message.file else None,
@@ -317,38 +395,51 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def is_valid_user(self):
-        return self.room and self.user in [self.room.doctor, self.room.patient]
+        return self.room and self.user.id in (self.room.doctor_id, self.room.patient_id)
 
     @database_sync_to_async
     def is_chat_allowed(self):
         return timezone.now() <= self.room.created_at + timezone.timedelta(days=7)
 
     @database_sync_to_async
-    def save_message(self, content, file_data):
+    def save_message(self, content, file_name):
         msg = Message(room=self.room, sender=self.user, content=content)
-        if file_data:
-            try:
-                format, imgstr = file_data.split(';base64,')
-                ext = format.split('/')[-1].split('+')[0]
-                file_name = f"{self.user.username}_{timezone.now().timestamp()}.{ext}"
-                msg.file.save(file_name, ContentFile(base64.b64decode(imgstr)), save=True)
-            except Exception as e:
-                pass
-        else:
-            msg.save()
+        if file_name:
+            msg.file.name = file_name
+        msg.save()
         return msg
 
     @database_sync_to_async
-    def get_chat_history(self):
-        return [
-            {
-                'sender': msg.sender.username,
-                'message': msg.content,
-                'file': get_absolute_url(msg.file.url) if msg.file else None,
-                'timestamp': str(msg.timestamp),
-            }
-            for msg in self.room.messages.order_by('timestamp')
-        ]
+    def get_chat_history(self, before=None, limit=None):
+        """
+        Return up to ``limit`` messages older than the ``before`` cursor (or the
+        newest ones) in chronological order, plus the cursor for the next page.
+        """
+        limit = max(1, min(limit or settings.CHAT_HISTORY_PAGE_SIZE, settings.CHAT_HISTORY_MAX_PAGE_SIZE))
+        messages = self.room.messages.select_related('sender')
+        if before:
+            messages = messages.filter(KeysetCursor.before('timestamp', before[0], id_value=before[1]))
+
+        rows = list(messages.order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        oldest = rows[-1] if rows else None
+        rows.reverse()
+
+        return {
+            'messages': [
+                {
+                    'id': msg.id,
+                    'sender': msg.sender.username,
+                    'message': msg.content,
+                    'file': get_absolute_url(msg.file.url) if msg.file else None,
+                    'timestamp': str(msg.timestamp),
+                }
+                for msg in rows
+            ],
+            'has_more': has_more,
+            'before': KeysetCursor.encode(oldest.timestamp, oldest.id) if has_more else None,
+        }
     
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -15,6 +15,8 @@ from pathlib import Path
 import os
 from datetime import timedelta,datetime
 from celery import Celery
+from celery.schedules import crontab
+from kombu import Queue
 from concurrent_log_handler import ConcurrentRotatingFileHandler
 
 
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'rest_framework_simplejwt.token_blacklist',
@@ -168,6 +171,81 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+# Tasks pick their queue in their @shared_task declaration; run one worker per
+# queue (manage.py celery_worker <queue>) so OTP mail never waits behind
+# reminder fan-out or report rendering.
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (
+    Queue('otp'),
+    Queue('notifications'),
+    Queue('reports'),
+    Queue('payouts'),
+    Queue('default'),
+)
+CELERY_WORKER_QUEUES = {
+    'otp': {'concurrency': 4, 'prefetch_multiplier': 1},
+    'notifications': {'concurrency': 4, 'prefetch_multiplier': 4},
+    'reports': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'payouts': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'default': {'concurrency': 2, 'prefetch_multiplier': 4},
+}
+CELERY_BEAT_SCHEDULE = {
+    'rollup-wallet-history': {
+        'task': 'doctor.tasks.rollup_wallet_history',
+        'schedule': crontab(hour=2, minute=0),
+    },
+    'complete-finished-appointments': {
+        'task': 'core.tasks.complete_finished_appointments',
+        'schedule': timedelta(minutes=5),
+    },
+    'reconcile-withdrawal-payouts': {
+        'task': 'core.tasks.reconcile_withdrawal_payouts',
+        'schedule': timedelta(minutes=5),
+    },
+    'flush-otp-email-outbox': {
+        'task': 'accounts.tasks.flush_email_outbox',
+        'schedule': timedelta(minutes=1),
+        'args': ('otp',),
+        'options': {'queue': 'otp'},
+    },
+    'flush-bulk-email-outbox': {
+        'task': 'accounts.tasks.flush_email_outbox',
+        'schedule': timedelta(minutes=1),
+        'args': ('bulk',),
+        'options': {'queue': 'notifications'},
+    },
+    'purge-expired-reports': {
+        'task': 'core.tasks.purge_expired_reports',
+        'schedule': crontab(hour=3, minute=0),
+    },
+}
+
+APPOINTMENT_COMPLETION_BATCH_SIZE = 500
+APPOINTMENT_COMPLETION_MAX_BATCHES = 20
+APPOINTMENT_REMINDER_BATCH_SIZE = 500
+
+CSV_EXPORT_CHUNK_SIZE = 2000
+
+CHAT_HISTORY_PAGE_SIZE = 50
+CHAT_HISTORY_MAX_PAGE_SIZE = 100
+CHAT_ATTACHMENT_MAX_SIZE = 5 * 1024 * 1024
+CHAT_ATTACHMENT_CONTENT_TYPES = ('image/', 'audio/', 'application/pdf')
+CHAT_ATTACHMENT_REF_MAX_AGE = 60 * 60
+
+VIDEO_ROOM_MEMBER_TTL = 90
+VIDEO_ROOM_KEY_TTL = 60 * 60 * 4
+VIDEO_ROOM_TICKET_MAX_AGE = 60 * 30
+VIDEO_ICE_BATCH_WINDOW = 0.05
+VIDEO_STATS_FLUSH_EVERY = 50
+
+PAYOUT_RETRY_BACKOFF = 30
+PAYOUT_REQUEUE_AFTER = 60 * 10
+PAYOUT_RECONCILE_BATCH_SIZE = 100
+
+REPORT_STORAGE_PREFIX = 'reports'
+REPORT_JOB_STALE_AFTER = 60 * 10
+REPORT_RETENTION_DAYS = 7
+REPORT_SPOOL_MAX_SIZE = 5 * 1024 * 1024
 
 
 # Password validation
@@ -192,7 +270,7 @@ AUTH_PASSWORD_VALIDATORS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.RequestScopedJWTAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -286,14 +364,42 @@ SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = env('GOOGLE_CLIENT_SECRET')
 CASHFREE_CLIENT_ID = env("CASHFREE_CLIENT_ID")
 CASHFREE_CLIENT_SECRET = env("CASHFREE_CLIENT_SECRET")
 CASHFREE_PAYOUT_BASE_URL = env("CASHFREE_PAYOUT_BASE_URL")
+CASHFREE_CONNECT_TIMEOUT = 5
 CASHFREE_TIMEOUT = 60
 CASHFREE_MAX_RETRIES = 3
+CASHFREE_RETRY_BACKOFF = 0.5
+CASHFREE_POOL_SIZE = 10
 
 LOGIN_REDIRECT_URL = '/'
 
 REST_USE_JWT = True
 
 OTP_EXPIRY_MINUTES = 2
+PASSWORD_RESET_OTP_EXPIRY_MINUTES = 5
+OTP_MAX_ATTEMPTS = 5
+OTP_RESEND_COOLDOWN = 30
+OTP_SEND_WINDOW = 60 * 60
+OTP_EMAIL_SEND_LIMIT = 5
+OTP_IP_SEND_LIMIT = 20
+# Shared by every request whose client IP is unknown (TRUSTED_PROXY_COUNT unset).
+OTP_UNKNOWN_IP_SEND_LIMIT = 200
+# Reverse proxies in front of Django that append to X-Forwarded-For; 0 means
+# clients connect directly and REMOTE_ADDR is used. Unset, the client IP is
+# unknown: OTP sends fall back to OTP_UNKNOWN_IP_SEND_LIMIT and check
+# core.W001 warns at startup.
+TRUSTED_PROXY_COUNT = env.int('TRUSTED_PROXY_COUNT', default=None)
+
+USER_STATUS_CACHE_TIMEOUT = 60 * 60
+USER_STATUS_LOCAL_CACHE_TTL = 5
+USER_STATUS_LOCAL_CACHE_SIZE = 10000
+
+TAGGED_CACHE_STALE_TIMEOUT = 60 * 5
+TAGGED_CACHE_LOCK_TIMEOUT = 10
+TAGGED_CACHE_WAIT_TIMEOUT = 2
+TAGGED_CACHE_POLL_INTERVAL = 0.05
+
+DOCTOR_SEARCH_CONFIG = 'simple'
+DOCTOR_AUTOCOMPLETE_LIMIT = 8
 
 AVAILABILITY_FILTER_DAYS = {
     'next_3_days': 3,
@@ -330,6 +436,12 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = env('EMAIL_HOST_USER')
+EMAIL_FLUSH_WINDOW = 2
+EMAIL_FLUSH_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 5
+EMAIL_FLUSH_MAX_BACKOFF = 60
+EMAIL_FLUSH_LOCK_TIMEOUT = 60 * 5
+EMAIL_OUTBOX_QUEUES = {'otp': 'otp', 'bulk': 'notifications'}
 
 CSRF_COOKIE_HTTPONLY = False
 CSRF_COOKIE_SAMESITE = 'Lax'
@@ -1,8 +1,15 @@
 from django.contrib import admin
-from .models import SiteSetting
+from .models import SiteSetting, ReportJob
 
 # Register your models here.
 @admin.register(SiteSetting)
 class SiteSettingAdmin(admin.ModelAdmin):
     list_display = ('key', 'value')
-    list_editable = ('value',)
\ No newline at end of file
+    list_editable = ('value',)
+
+
+@admin.register(ReportJob)
+class ReportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'owner', 'status', 'created_at', 'completed_at')
+    list_filter = ('kind', 'status')
+    readonly_fields = ('artifact_key', 'file_path', 'error')
@@ -0,0 +1,42 @@
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+
+def get_request_token(request):
+    """
+    Validate the request's bearer token once and memoise the result on the
+    underlying HttpRequest, so BlockedUserMiddleware and DRF authentication
+    share a single signature check. Returns None when no token was sent.
+    """
+    http_request = getattr(request, '_request', request)
+
+    if not hasattr(http_request, '_jwt_validated_token'):
+        jwt_auth = JWTAuthentication()
+        header = jwt_auth.get_header(http_request)
+        raw_token = jwt_auth.get_raw_token(header) if header else None
+
+        http_request._jwt_validated_token = None
+        http_request._jwt_error = None
+        if raw_token is not None:
+            try:
+                http_request._jwt_validated_token = jwt_auth.get_validated_token(raw_token)
+            except InvalidToken as e:
+                http_request._jwt_error = e
+
+    if http_request._jwt_error is not None:
+        raise http_request._jwt_error
+    return http_request._jwt_validated_token
+
+
+class RequestScopedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that reuses the token and user already resolved for this request."""
+
+    def authenticate(self, request):
+        validated_token = get_request_token(request)
+        if validated_token is None:
+            return None
+
+        http_request = getattr(request, '_request', request)
+        if not hasattr(http_request, '_jwt_user'):
+            http_request._jwt_user = self.get_user(validated_token)
+        return http_request._jwt_user, validated_token
@@ -0,0 +1,323 @@
+import hashlib
+import threading
+import time
+import logging
+from functools import wraps
+from cachetools import TTLCache
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class UserStatusCache:
+    """
+    Versioned cache of ``User.is_active`` used by BlockedUserMiddleware.
+
+    Entries live in Redis as ``(version, is_active)`` next to a per-user version
+    counter. Invalidation bumps the counter, so an entry written by a request that
+    raced with a block/unblock is ignored on the next read. A small per-process
+    LRU sits in front of Redis to keep the hot path off the network entirely.
+    """
+    _local = TTLCache(
+        maxsize=settings.USER_STATUS_LOCAL_CACHE_SIZE,
+        ttl=settings.USER_STATUS_LOCAL_CACHE_TTL,
+    )
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _keys(user_id):
+        return f'user_status:{user_id}', f'user_status:{user_id}:version'
+
+    @classmethod
+    def is_active(cls, user_id):
+        """Return the user's active flag, or None if the user does not exist."""
+        with cls._lock:
+            is_active = cls._local.get(user_id)
+        if is_active is not None:
+            return is_active
+
+        value_key, version_key = cls._keys(user_id)
+        try:
+            cached = cache.get_many([value_key, version_key])
+        except Exception as e:
+            logger.warning(f"User status cache unavailable: {e}")
+            cached = {}
+
+        version = cached.get(version_key, 0)
+        entry = cached.get(value_key)
+
+        if entry is not None and entry[0] == version:
+            is_active = entry[1]
+        else:
+            is_active = User.objects.filter(id=user_id).values_list('is_active', flat=True).first()
+            if is_active is None:
+                return None
+            try:
+                cache.set(value_key, (version, is_active), timeout=settings.USER_STATUS_CACHE_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"Failed to cache status for user {user_id}: {e}")
+
+        with cls._lock:
+            cls._local[user_id] = is_active
+        return is_active
+
+    @classmethod
+    def invalidate(cls, user_id):
+        # Bumped after commit: bumping earlier would let a concurrent miss cache
+        # the old is_active under the new version.
+        def _invalidate():
+            with cls._lock:
+                cls._local.pop(user_id, None)
+
+            value_key, version_key = cls._keys(user_id)
+            try:
+                try:
+                    cache.incr(version_key)
+                except ValueError:
+                    if not cache.add(version_key, 1, timeout=None):
+                        cache.incr(version_key)
+                cache.delete(value_key)
+            except Exception as e:
+                logger.error(f"Failed to invalidate status cache for user {user_id}: {e}")
+
+        transaction.on_commit(_invalidate)
+
+
+class TaggedResponseCache:
+    """
+    Response cache whose entries are invalidated through tags rather than TTLs.
+
+    Every tag has a version counter; an entry records the versions it was built
+    against and is discarded as soon as one of them moves. Entries that merely
+    outlived their ``timeout`` are still served for ``stale_timeout`` while a
+    single request rebuilds them. Rebuilds are single-flight: one request holds
+    the lock and the rest either serve the stale copy or wait briefly for it.
+    """
+    @staticmethod
+    def _tag_key(tag):
+        return f'cache_tag:{tag}:version'
+
+    @staticmethod
+    def _response_key(request):
+        # Entries hold rendered content, so they vary on Accept like cache_page
+        # did; otherwise a browsable API page could be served to JSON clients.
+        params = sorted(request.GET.lists())
+        accept = request.META.get('HTTP_ACCEPT', '')
+        digest = hashlib.md5(f'{request.path}?{params}|{accept}'.encode()).hexdigest()
+        return f'tagged_response:{digest}'
+
+    @classmethod
+    def get_versions(cls, tags):
+        keys = [cls._tag_key(tag) for tag in tags]
+        versions = cache.get_many(keys)
+        for key in keys:
+            if key not in versions:
+                # Seed from the clock so an evicted counter can never fall back
+                # to a value an old entry was built against.
+                cache.add(key, time.time_ns(), timeout=None)
+                versions[key] = cache.get(key)
+        return tuple(versions[key] for key in keys)
+
+    @classmethod
+    def invalidate(cls, *tags):
+        for tag in tags:
+            key = cls._tag_key(tag)
+            try:
+                try:
+                    cache.incr(key)
+                except ValueError:
+                    cache.add(key, time.time_ns(), timeout=None)
+            except Exception as e:
+                logger.error(f"Failed to invalidate cache tag {tag}: {e}")
+
+    @staticmethod
+    def _to_response(entry):
+        return HttpResponse(entry['content'], status=entry['status'], content_type=entry['content_type'])
+
+    @classmethod
+    def _wait_for_rebuild(cls, key, versions):
+        deadline = time.monotonic() + settings.TAGGED_CACHE_WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(settings.TAGGED_CACHE_POLL_INTERVAL)
+            entry = cache.get(key)
+            if entry is not None and entry['versions'] == versions:
+                return entry
+        return None
+
+    @classmethod
+    def _rebuild(cls, key, versions, timeout, stale_timeout, compute):
+        lock_key = f'{key}:lock'
+        try:
+            response = compute()
+            if response.status_code == 200:
+                if hasattr(response, 'render') and not response.is_rendered:
+                    response.render()
+                cache.set(key, {
+                    'versions': versions,
+                    'fresh_until': time.time() + timeout,
+                    'content': response.content,
+                    'status': response.status_code,
+                    'content_type': response['Content-Type'],
+                }, timeout=timeout + stale_timeout)
+            return response
+        finally:
+            cache.delete(lock_key)
+
+    @classmethod
+    def serve(cls, request, tags, timeout, stale_timeout, compute):
+        try:
+            versions = cls.get_versions(tags)
+            key = cls._response_key(request)
+            entry = cache.get(key)
+        except Exception as e:
+            logger.warning(f"Tagged response cache unavailable: {e}")
+            return compute()
+
+        current = entry is not None and entry['versions'] == versions
+        if current and time.time() < entry['fresh_until']:
+            return cls._to_response(entry)
+
+        if cache.add(f'{key}:lock', 1, timeout=settings.TAGGED_CACHE_LOCK_TIMEOUT):
+            return cls._rebuild(key, versions, timeout, stale_timeout, compute)
+
+        if current:
+            return cls._to_response(entry)
+
+        # Invalidated entries are never served; wait for the rebuild in flight.
+        entry = cls._wait_for_rebuild(key, versions)
+        if entry is not None:
+            return cls._to_response(entry)
+        return compute()
+
+
+def tagged_cache_page(timeout, tags, stale_timeout=None):
+    """
+    Drop-in replacement for ``cache_page`` backed by TaggedResponseCache.
+    ``tags`` is called with the view's URL kwargs and returns the tags the
+    response depends on.
+    """
+    if stale_timeout is None:
+        stale_timeout = settings.TAGGED_CACHE_STALE_TIMEOUT
+
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            return TaggedResponseCache.serve(
+                request, tags(**kwargs), timeout, stale_timeout,
+                lambda: view_func(request, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+
+class DoctorDirectoryCache:
+    """Cache tags for the public doctor directory endpoints."""
+    DIRECTORY_TAG = 'doctor_directory'
+
+    @staticmethod
+    def detail_tag(slug):
+        return f'doctor_detail:{slug}'
+
+    @staticmethod
+    def slots_tag(username):
+        return f'doctor_slots:{username}'
+
+    @classmethod
+    def invalidate(cls, slug=None, username=None):
+        tags = [cls.DIRECTORY_TAG]
+        if slug:
+            tags.append(cls.detail_tag(slug))
+        if username:
+            tags.append(cls.slots_tag(username))
+        transaction.on_commit(lambda: TaggedResponseCache.invalidate(*tags))
+
+    @classmethod
+    def invalidate_doctor(cls, doctor_id):
+        from doctor.models import DoctorProfile
+
+        doctor = DoctorProfile.objects.filter(id=doctor_id).values_list('slug', 'user__username').first()
+        if doctor:
+            cls.invalidate(*doctor)
+        else:
+            cls.invalidate()
+
+
+class UserResponseCache:
+    """
+    Per-user response cache for authenticated views. Keys embed a version
+    counter for the user, so bumping it drops every cached response for that
+    user at once without having to know which keys exist.
+    """
+    @staticmethod
+    def _version_key(user_id):
+        return f'user_response:{user_id}:version'
+
+    @classmethod
+    def get_version(cls, user_id):
+        key = cls._version_key(user_id)
+        version = cache.get(key)
+        if version is None:
+            cache.add(key, time.time_ns(), timeout=None)
+            version = cache.get(key)
+        return version
+
+    @classmethod
+    def bump(cls, *user_ids):
+        def _bump():
+            for user_id in user_ids:
+                key = cls._version_key(user_id)
+                try:
+                    try:
+                        cache.incr(key)
+                    except ValueError:
+                        cache.add(key, time.time_ns(), timeout=None)
+                except Exception as e:
+                    logger.error(f"Failed to bump response cache version for user {user_id}: {e}")
+        transaction.on_commit(_bump)
+
+    @classmethod
+    def response_key(cls, request, user_id):
+        params = sorted(request.GET.lists())
+        digest = hashlib.md5(f'{request.path}?{params}'.encode()).hexdigest()
+        return f'user_response:{user_id}:{cls.get_version(user_id)}:{digest}'
+
+
+def user_cache_page(timeout):
+    """
+    Cache a DRF handler's response per authenticated user. Apply it to the
+    handler method (``name='get'``) so authentication and permissions have
+    already run; only the response data is cached, rendering still happens
+    per request.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            user = request.user
+            if not user.is_authenticated:
+                return view_func(request, *args, **kwargs)
+
+            try:
+                key = UserResponseCache.response_key(request, user.id)
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"User response cache unavailable: {e}")
+                return view_func(request, *args, **kwargs)
+
+            if cached is not None:
+                return Response(cached['data'], status=cached['status'])
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code == 200 and isinstance(response, Response):
+                cache.set(key, {'data': response.data, 'status': response.status_code}, timeout=timeout)
+            return response
+        return wrapper
+    return decorator
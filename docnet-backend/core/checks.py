@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def trusted_proxy_check(app_configs, **kwargs):
+    if settings.TRUSTED_PROXY_COUNT is not None:
+        return []
+    return [Warning(
+        'TRUSTED_PROXY_COUNT is not set, so client IPs are unknown and every OTP request '
+        'shares the OTP_UNKNOWN_IP_SEND_LIMIT bucket.',
+        hint='Set TRUSTED_PROXY_COUNT to the number of reverse proxies in front of Django, or 0 if there are none.',
+        id='core.W001',
+    )]
@@ -0,0 +1,239 @@
+import json
+import logging
+import smtplib
+from functools import lru_cache
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import get_template
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+# KEYS: outbox, processing list. ARGV: batch size.
+# Moves up to a batch from the head of the outbox to the processing list and returns it.
+TAKE_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[1]) - 1)
+if #items > 0 then
+    redis.call('LTRIM', KEYS[1], #items, -1)
+    redis.call('RPUSH', KEYS[2], unpack(items))
+end
+return items
+"""
+
+# KEYS: outbox, processing list. Puts an unfinished batch back at the head of the outbox.
+RECOVER_SCRIPT = """
+local items = redis.call('LRANGE', KEYS[2], 0, -1)
+for i = #items, 1, -1 do
+    redis.call('LPUSH', KEYS[1], items[i])
+end
+redis.call('DEL', KEYS[2])
+return #items
+"""
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    return get_template(name)
+
+
+class EmailDispatcher:
+    """
+    Outbox for transactional email. Messages are rendered when queued, pushed
+    onto a Redis list and drained by ``flush_email_outbox``, which sends a
+    whole burst over a single SMTP connection. A flush is scheduled at most
+    once per ``EMAIL_FLUSH_WINDOW``, so a spike of OTP requests turns into a
+    handful of SMTP sessions rather than one per message.
+
+    OTP mail and bulk mail use separate outboxes, each flushed on its own
+    Celery queue (``EMAIL_OUTBOX_QUEUES``), so a reminder blast never sits
+    in front of a login code.
+
+    A flush moves each batch to a processing list and removes it only once
+    the batch has been sent. If a worker is killed mid-flush, the next flush
+    puts its batch back on the outbox. A flush that can't reach the SMTP
+    server backs off exponentially up to ``EMAIL_FLUSH_MAX_BACKOFF``.
+    """
+    OTP = 'otp'
+    BULK = 'bulk'
+    _scripts = {}
+
+    @staticmethod
+    def outbox_key(outbox):
+        return f'email_outbox:{outbox}'
+
+    @staticmethod
+    def flush_scheduled_key(outbox):
+        return f'email_outbox:{outbox}:flush_scheduled'
+
+    @staticmethod
+    def processing_key(outbox):
+        return f'email_outbox:{outbox}:processing'
+
+    @staticmethod
+    def flush_lock_key(outbox):
+        return f'email_outbox:{outbox}:flush_lock'
+
+    @staticmethod
+    def failures_key(outbox):
+        return f'email_outbox:{outbox}:failures'
+
+    @staticmethod
+    def render(template_prefix, context):
+        subject = _template(f'emails/{template_prefix}_subject.txt').render(context).strip()
+        body = _template(f'emails/{template_prefix}_body.txt').render(context).strip()
+        return subject, body
+
+    @classmethod
+    def queue_template(cls, template_prefix, context, recipient_list, from_email=None, outbox=BULK):
+        subject, body = cls.render(template_prefix, context)
+        cls.queue(subject, body, recipient_list, from_email, outbox)
+
+    @classmethod
+    def queue(cls, subject, body, recipient_list, from_email=None, outbox=BULK):
+        message = {
+            'subject': subject,
+            'body': body,
+            'to': list(recipient_list),
+            'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+            'attempts': 0,
+        }
+        try:
+            get_redis_connection('default').rpush(cls.outbox_key(outbox), json.dumps(message))
+        except Exception as e:
+            logger.warning(f"Email outbox unavailable, sending directly: {e}")
+            with get_connection(fail_silently=False) as connection:
+                cls.send([message], connection)
+            return
+        cls.schedule_flush(outbox)
+
+    @classmethod
+    def schedule_flush(cls, outbox, countdown=None):
+        from accounts.tasks import flush_email_outbox
+
+        countdown = countdown or settings.EMAIL_FLUSH_WINDOW
+        if cache.add(cls.flush_scheduled_key(outbox), 1, timeout=countdown + settings.EMAIL_FLUSH_WINDOW * 10):
+            flush_email_outbox.apply_async(
+                args=[outbox], countdown=countdown, queue=settings.EMAIL_OUTBOX_QUEUES[outbox]
+            )
+
+    @classmethod
+    def _run(cls, client, name, source, keys, *args):
+        script = cls._scripts.get(name)
+        if script is None:
+            script = cls._scripts[name] = client.register_script(source)
+        return script(keys=keys, args=args, client=client)
+
+    @classmethod
+    def _take(cls, client, outbox, limit):
+        raw = cls._run(
+            client, 'take', TAKE_SCRIPT, [cls.outbox_key(outbox), cls.processing_key(outbox)], limit
+        )
+        return [json.loads(item) for item in raw]
+
+    @classmethod
+    def _finish(cls, client, outbox, failed):
+        """Drop the sent batch from the processing list and put ``failed`` back on the outbox."""
+        pipe = client.pipeline()
+        pipe.delete(cls.processing_key(outbox))
+        if failed:
+            pipe.rpush(cls.outbox_key(outbox), *[json.dumps(message) for message in failed])
+        pipe.execute()
+
+    @classmethod
+    def _retry_delay(cls, client, outbox):
+        """Back off exponentially while flushes keep failing, up to ``EMAIL_FLUSH_MAX_BACKOFF``."""
+        key = cls.failures_key(outbox)
+        failures = client.incr(key)
+        client.expire(key, settings.EMAIL_FLUSH_MAX_BACKOFF * 10)
+        return min(settings.EMAIL_FLUSH_WINDOW * 2 ** failures, settings.EMAIL_FLUSH_MAX_BACKOFF)
+
+    @classmethod
+    def flush(cls, outbox):
+        """Drain ``outbox`` over one connection; returns the number of messages sent."""
+        cache.delete(cls.flush_scheduled_key(outbox))
+        if not cache.add(cls.flush_lock_key(outbox), 1, timeout=settings.EMAIL_FLUSH_LOCK_TIMEOUT):
+            # Another worker is draining this outbox; check again once it is done.
+            cls.schedule_flush(outbox)
+            return 0
+
+        client = get_redis_connection('default')
+        sent, failed = 0, []
+        try:
+            recovered = cls._run(
+                client, 'recover', RECOVER_SCRIPT, [cls.outbox_key(outbox), cls.processing_key(outbox)]
+            )
+            if recovered:
+                logger.warning(f"Requeued {recovered} {outbox} emails left by an interrupted flush")
+            with get_connection(fail_silently=False) as connection:
+                while True:
+                    messages = cls._take(client, outbox, settings.EMAIL_FLUSH_BATCH_SIZE)
+                    if not messages:
+                        break
+                    delivered, failed = cls.send(messages, connection)
+                    sent += delivered
+                    cls._finish(client, outbox, failed)
+                    if failed:
+                        break
+        except Exception as e:
+            if not cls.connection_lost(e):
+                raise
+            # Nothing was taken, or the batch is still in the processing list for the next flush.
+            logger.warning(f"SMTP unavailable, postponing the {outbox} outbox flush: {e}")
+            failed = True
+        finally:
+            cache.delete(cls.flush_lock_key(outbox))
+
+        if failed:
+            cls.schedule_flush(outbox, countdown=cls._retry_delay(client, outbox))
+        else:
+            client.delete(cls.failures_key(outbox))
+        return sent
+
+    @staticmethod
+    def connection_lost(error):
+        """Whether ``error`` is about the SMTP connection rather than the message being sent."""
+        if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+            return True
+        return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+    @classmethod
+    def send(cls, messages, connection):
+        """
+        Send ``messages`` over an open ``connection``; returns ``(sent, messages
+        to retry)``. A dropped connection is reopened once without counting an
+        attempt. If it can't be reopened, the rest of the batch is handed back
+        as it is.
+        """
+        sent, retry = 0, []
+        for index, message in enumerate(messages):
+            email = EmailMessage(
+                subject=message['subject'],
+                body=message['body'],
+                from_email=message['from_email'],
+                to=message['to'],
+                connection=connection,
+            )
+            try:
+                # One message per call so a bad recipient only fails itself.
+                try:
+                    sent += connection.send_messages([email])
+                except Exception as e:
+                    if not cls.connection_lost(e):
+                        raise
+                    logger.warning(f"SMTP connection lost, reconnecting: {e}")
+                    connection.close()
+                    connection.open()
+                    sent += connection.send_messages([email])
+            except Exception as e:
+                if cls.connection_lost(e):
+                    logger.warning(f"SMTP unavailable, handing back {len(messages) - index} emails: {e}")
+                    retry.extend(messages[index:])
+                    break
+                message['attempts'] += 1
+                if message['attempts'] >= settings.EMAIL_MAX_ATTEMPTS:
+                    logger.error(f"Dropping email to {message['to']} after {message['attempts']} attempts: {e}")
+                else:
+                    logger.warning(f"Email to {message['to']} failed, will retry: {e}")
+                    retry.append(message)
+        return sent, retry
@@ -0,0 +1,287 @@
+import csv
+import hashlib
+import json
+import logging
+import tempfile
+from datetime import datetime, time, timedelta
+from itertools import islice
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from reportlab.lib.pagesizes import A4, landscape
+from reportlab.pdfgen import canvas
+from .cache import TaggedResponseCache
+from .models import PaymentLedgerEntry, ReportJob
+
+logger = logging.getLogger(__name__)
+
+
+class Echo:
+    """File-like object whose write() hands the formatted row back to csv.writer's caller."""
+    def write(self, value):
+        return value
+
+
+def parse_date_range(params, start_param='start_date', end_param='end_date'):
+    """
+    Read an inclusive local date range from query params and return aware
+    ``(start, end)`` datetimes, where ``end`` is exclusive. Either bound may be
+    None. Raises ValueError for malformed or inverted dates.
+    """
+    bounds = []
+    for param in (start_param, end_param):
+        value = params.get(param)
+        if not value:
+            bounds.append(None)
+            continue
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"{param} must be a date in YYYY-MM-DD format")
+        bounds.append(day)
+
+    start_day, end_day = bounds
+    if start_day and end_day and start_day > end_day:
+        raise ValueError(f"{start_param} must not be after {end_param}")
+
+    start = timezone.make_aware(datetime.combine(start_day, time.min)) if start_day else None
+    end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min)) if end_day else None
+    return start, end
+
+
+def filter_date_range(queryset, field, start, end):
+    if start:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end:
+        queryset = queryset.filter(**{f'{field}__lt': end})
+    return queryset
+
+
+def stream_csv(filename, header, rows):
+    """
+    Stream ``rows`` as a CSV attachment without buffering the file in memory.
+    The app is served over ASGI, where Django reads a sync iterator into a
+    list before sending it. So the response body is an async generator that
+    pulls ``CSV_EXPORT_CHUNK_SIZE`` rows at a time through sync_to_async.
+    """
+    writer = csv.writer(Echo())
+    rows = iter(rows)
+
+    def next_chunk():
+        return ''.join(writer.writerow(row) for row in islice(rows, settings.CSV_EXPORT_CHUNK_SIZE))
+
+    async def generate():
+        try:
+            yield writer.writerow(header)
+            while chunk := await sync_to_async(next_chunk)():
+                yield chunk
+        finally:
+            # Close the row generator, and with it the database cursor, on the thread that opened it.
+            if hasattr(rows, 'close'):
+                await sync_to_async(rows.close)()
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def iterate_values(queryset, fields):
+    return queryset.values_list(*fields).iterator(chunk_size=settings.CSV_EXPORT_CHUNK_SIZE)
+
+
+def wallet_history_tag(wallet_id):
+    return f'wallet_history:{wallet_id}'
+
+
+PAYMENT_HEADER = ['Payment ID', 'Patient', 'Doctor', 'Amount', 'Method', 'Date', 'Time', 'Status', 'Type']
+WALLET_HEADER = ['Date', 'Type', 'Amount', 'New Balance']
+
+
+def payment_rows(params):
+    """Ledger rows for the admin payment exports; ``params`` are the export query params."""
+    start, end = parse_date_range(params)
+    payments = filter_date_range(PaymentLedgerEntry.objects.all(), 'timestamp', start, end)
+    if params.get('status'):
+        payments = payments.filter(payment_status=params['status'].lower())
+    payments = payments.order_by('-timestamp', '-id')
+
+    fields = [
+        'payment_id', 'patient_username', 'doctor_username', 'amount',
+        'payment_method', 'timestamp', 'payment_status', 'source'
+    ]
+    for payment_id, patient, doctor, amount, method, timestamp, payment_status, source in iterate_values(payments, fields):
+        local = timezone.localtime(timestamp)
+        yield [
+            payment_id, patient, doctor, amount, method,
+            local.strftime('%Y-%m-%d'), local.strftime('%H:%M'), payment_status, source.title()
+        ]
+
+
+def wallet_rows(wallet, params):
+    start, end = parse_date_range(params)
+    transactions = filter_date_range(wallet.history.all(), 'updated_date', start, end).order_by('-updated_date')
+    for updated_date, txn_type, amount, new_balance in iterate_values(
+        transactions, ['updated_date', 'type', 'amount', 'new_balance']
+    ):
+        yield [timezone.localtime(updated_date).strftime('%Y-%m-%d %H:%M'), txn_type, amount, new_balance]
+
+
+def render_pdf(output, title, header, widths, rows, pagesize=A4):
+    """Draw ``rows`` as a table spanning as many pages as needed."""
+    width, height = pagesize
+    p = canvas.Canvas(output, pagesize=pagesize)
+    page = 0
+
+    def start_page():
+        nonlocal page
+        page += 1
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(40, height - 40, title)
+        p.setFont("Helvetica", 8)
+        p.drawRightString(width - 40, 25, f"Page {page}")
+        p.setFont("Helvetica-Bold", 9)
+        x = 40
+        for label, column_width in zip(header, widths):
+            p.drawString(x, height - 70, label)
+            x += column_width
+        p.setFont("Helvetica", 9)
+        return height - 88
+
+    y = start_page()
+    for row in rows:
+        if y < 45:
+            p.showPage()
+            y = start_page()
+        x = 40
+        for value, column_width in zip(row, widths):
+            text = '' if value is None else str(value)
+            while text and p.stringWidth(text, "Helvetica", 9) > column_width - 6:
+                text = text[:-1]
+            p.drawString(x, y, text)
+            x += column_width
+        y -= 16
+
+    p.showPage()
+    p.save()
+
+
+REPORTS = {
+    ReportJob.ADMIN_PAYMENTS: {
+        'filename': 'payment_history.pdf',
+        'tag': lambda params: PaymentLedgerEntry.VERSION_TAG,
+    },
+    ReportJob.DOCTOR_WALLET: {
+        'filename': 'wallet_report.pdf',
+        'tag': lambda params: wallet_history_tag(params['wallet_id']),
+    },
+}
+
+
+class ReportJobManager:
+    """
+    Queues PDF reports onto Celery and shares rendered files between requests.
+    Artifacts are stored under a hash of the report parameters and the version
+    of the data they were built from, so repeat requests are served from media
+    storage until the underlying rows change.
+    """
+    @staticmethod
+    def artifact_key(kind, params):
+        version = TaggedResponseCache.get_versions([REPORTS[kind]['tag'](params)])[0]
+        payload = json.dumps([kind, params, version], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    @staticmethod
+    def artifact_path(kind, key):
+        return f'{settings.REPORT_STORAGE_PREFIX}/{kind}/{key}.pdf'
+
+    @staticmethod
+    def request(user, kind, params):
+        """Return a job for the report, reusing a ready or in-flight one when possible."""
+        from .tasks import generate_report
+
+        key = ReportJobManager.artifact_key(kind, params)
+        path = ReportJobManager.artifact_path(kind, key)
+        stale_before = timezone.now() - timedelta(seconds=settings.REPORT_JOB_STALE_AFTER)
+
+        job = ReportJob.objects.filter(owner=user, kind=kind, artifact_key=key).exclude(
+            status=ReportJob.FAILED
+        ).order_by('-created_at').first()
+        if job and job.status == ReportJob.READY and default_storage.exists(job.file_path):
+            return job
+        if job and job.status != ReportJob.READY and job.created_at >= stale_before:
+            return job
+
+        if default_storage.exists(path):
+            return ReportJob.objects.create(
+                kind=kind, owner=user, params=params, artifact_key=key, file_path=path,
+                status=ReportJob.READY, completed_at=timezone.now()
+            )
+
+        job = ReportJob.objects.create(kind=kind, owner=user, params=params, artifact_key=key)
+        transaction.on_commit(lambda: generate_report.delay(str(job.id)))
+        return job
+
+    @staticmethod
+    def rows(job):
+        if job.kind == ReportJob.ADMIN_PAYMENTS:
+            return {
+                'title': "Admin Payment History",
+                'header': PAYMENT_HEADER,
+                'widths': [150, 90, 90, 70, 70, 65, 45, 65, 80],
+                'rows': payment_rows(job.params),
+                'pagesize': landscape(A4),
+            }
+
+        from doctor.models import Wallet
+
+        wallet = Wallet.objects.select_related('doctor__user').get(id=job.params['wallet_id'])
+        return {
+            'title': f"Wallet Report for Dr. {wallet.doctor.user.username}",
+            'header': WALLET_HEADER,
+            'widths': [140, 90, 110, 130],
+            'rows': wallet_rows(wallet, job.params),
+        }
+
+    @staticmethod
+    def run(job_id):
+        job = ReportJob.objects.filter(id=job_id).first()
+        if job is None or job.status == ReportJob.READY:
+            return job
+
+        ReportJob.objects.filter(id=job.id).update(status=ReportJob.RUNNING)
+        path = ReportJobManager.artifact_path(job.kind, job.artifact_key)
+        try:
+            if not default_storage.exists(path):
+                with tempfile.SpooledTemporaryFile(max_size=settings.REPORT_SPOOL_MAX_SIZE) as output:
+                    render_pdf(output, **ReportJobManager.rows(job))
+                    output.seek(0)
+                    path = default_storage.save(path, File(output))
+        except Exception as e:
+            logger.error(f"Report job {job.id} failed: {e}")
+            ReportJob.objects.filter(id=job.id).update(
+                status=ReportJob.FAILED, error=str(e), completed_at=timezone.now()
+            )
+            raise
+
+        ReportJob.objects.filter(id=job.id).update(
+            status=ReportJob.READY, file_path=path, error='', completed_at=timezone.now()
+        )
+        return job
+
+    @staticmethod
+    def purge(before):
+        """Delete jobs created before ``before`` together with artifacts no newer job uses."""
+        expired = ReportJob.objects.filter(created_at__lt=before)
+        paths = set(expired.exclude(file_path='').values_list('file_path', flat=True))
+        in_use = set(ReportJob.objects.filter(created_at__gte=before, file_path__in=paths).values_list('file_path', flat=True))
+        for path in paths - in_use:
+            try:
+                default_storage.delete(path)
+            except Exception as e:
+                logger.warning(f"Failed to delete report artifact {path}: {e}")
+        deleted, _ = expired.delete()
+        return deleted
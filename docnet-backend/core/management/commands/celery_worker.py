@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from config.celery import app
+
+
+class Command(BaseCommand):
+    help = 'Start a Celery worker for one queue with its concurrency and prefetch from CELERY_WORKER_QUEUES'
+
+    def add_arguments(self, parser):
+        parser.add_argument('queue', choices=list(settings.CELERY_WORKER_QUEUES))
+        parser.add_argument('--loglevel', default='info')
+
+    def handle(self, *args, **options):
+        queue = options['queue']
+        worker = settings.CELERY_WORKER_QUEUES[queue]
+        app.worker_main([
+            'worker',
+            f'--queues={queue}',
+            f'--hostname={queue}@%h',
+            f"--concurrency={worker['concurrency']}",
+            f"--prefetch-multiplier={worker['prefetch_multiplier']}",
+            f"--loglevel={options['loglevel']}",
+        ])
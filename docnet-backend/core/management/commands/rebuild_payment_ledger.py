@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from core.utils import PaymentLedgerManager
+
+
+class Command(BaseCommand):
+    help = 'Upsert the admin payment ledger from Payment and EmergencyPayment'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        written = PaymentLedgerManager.rebuild(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} payment ledger rows'))
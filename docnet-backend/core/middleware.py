@@ -1,7 +1,8 @@
 from django.http import JsonResponse
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
-from accounts.models import User
+from rest_framework_simplejwt.settings import api_settings
+from .authentication import get_request_token
+from .cache import UserStatusCache
 import logging
 
 logger = logging.getLogger('authentication')
@@ -23,14 +24,12 @@ class BlockedUserMiddleware:
             return self.get_response(request)
 
         try:
-            jwt_auth = JWTAuthentication()
-            auth_result = jwt_auth.authenticate(request)
-
-            if auth_result is not None:
-                user, token = auth_result
-                # Always get the latest user object from DB
-                fresh_user = User.objects.get(id=user.id)
-                if not fresh_user.is_active:
+            validated_token = get_request_token(request)
+
+            if validated_token is not None:
+                user_id = validated_token[api_settings.USER_ID_CLAIM]
+                # Served from the status cache; the DB is only hit on a cold miss
+                if UserStatusCache.is_active(user_id) is False:
                     return JsonResponse({
                         'detail': 'Your account has been deactivated by admin.',
                         'message': 'Your account has been deactivated by admin.',
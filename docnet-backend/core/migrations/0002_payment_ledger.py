@@ -0,0 +1,76 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:53
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ledger(apps, schema_editor):
+    PaymentLedgerEntry = apps.get_model('core', 'PaymentLedgerEntry')
+    Payment = apps.get_model('accounts', 'Payment')
+    EmergencyPayment = apps.get_model('accounts', 'EmergencyPayment')
+
+    def entries():
+        for payment in Payment.objects.select_related('patient', 'slot__doctor__user').iterator(chunk_size=2000):
+            doctor_user = payment.slot.doctor.user if payment.slot_id else None
+            yield PaymentLedgerEntry(
+                source='consultation', source_id=payment.id, payment_id=payment.payment_id,
+                amount=payment.amount, payment_status=payment.payment_status,
+                payment_method=payment.payment_method, timestamp=payment.timestamp,
+                patient_id=payment.patient_id, patient_username=payment.patient.username,
+                patient_avatar=payment.patient.profile_image,
+                doctor_user=doctor_user, doctor_username=doctor_user.username if doctor_user else None,
+            )
+        for payment in EmergencyPayment.objects.select_related('patient', 'doctor__user').iterator(chunk_size=2000):
+            yield PaymentLedgerEntry(
+                source='emergency', source_id=payment.id, payment_id=payment.payment_id,
+                amount=payment.amount, payment_status=payment.payment_status,
+                payment_method=payment.payment_method, timestamp=payment.timestamp,
+                patient_id=payment.patient_id, patient_username=payment.patient.username,
+                patient_avatar=payment.patient.profile_image,
+                doctor_user=payment.doctor.user, doctor_username=payment.doctor.user.username,
+            )
+
+    batch = []
+    for entry in entries():
+        batch.append(entry)
+        if len(batch) == 2000:
+            PaymentLedgerEntry.objects.bulk_create(batch)
+            batch = []
+    PaymentLedgerEntry.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('accounts', '0038_remove_patientprofile_accounts_pa_blood_g_af6665_idx_and_more'),
+        ('doctor', '0040_wallet_history_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('consultation', 'Consultation'), ('emergency', 'Emergency')], max_length=20)),
+                ('source_id', models.PositiveBigIntegerField()),
+                ('payment_id', models.CharField(blank=True, max_length=255, null=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('payment_status', models.CharField(max_length=20)),
+                ('payment_method', models.CharField(blank=True, max_length=50, null=True)),
+                ('timestamp', models.DateTimeField()),
+                ('patient_username', models.CharField(max_length=150)),
+                ('patient_avatar', models.CharField(blank=True, max_length=500, null=True)),
+                ('doctor_username', models.CharField(blank=True, max_length=150, null=True)),
+                ('doctor_user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-timestamp', '-id'], name='payment_ledger_cursor_idx'), models.Index(fields=['payment_status', '-timestamp', '-id'], name='payment_ledger_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('source', 'source_id'), name='unique_payment_ledger_source')],
+            },
+        ),
+        migrations.RunPython(backfill_ledger, migrations.RunPython.noop),
+    ]
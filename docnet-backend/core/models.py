@@ -1,3 +1,5 @@
+import uuid
+from django.conf import settings
 from django.db import models
 
 
@@ -18,3 +20,84 @@ class SiteSetting(models.Model):
     @staticmethod
     def is_test_mode():
         return SiteSetting.get("TEST_MODE", "false").lower() == "true"
+
+
+class PaymentLedgerEntry(models.Model):
+    """
+    Denormalized read model combining consultation and emergency payments for
+    the admin payment history. Rows are upserted whenever a source payment is
+    saved; never write to it directly.
+    """
+    CONSULTATION = 'consultation'
+    EMERGENCY = 'emergency'
+    VERSION_TAG = 'payment_ledger'
+    SOURCE_CHOICES = (
+        (CONSULTATION, 'Consultation'),
+        (EMERGENCY, 'Emergency'),
+    )
+
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    source_id = models.PositiveBigIntegerField()
+    payment_id = models.CharField(max_length=255, blank=True, null=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    payment_status = models.CharField(max_length=20)
+    payment_method = models.CharField(max_length=50, blank=True, null=True)
+    timestamp = models.DateTimeField()
+    patient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    patient_username = models.CharField(max_length=150)
+    patient_avatar = models.CharField(max_length=500, blank=True, null=True)
+    doctor_user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    doctor_username = models.CharField(max_length=150, blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'source_id'], name='unique_payment_ledger_source'),
+        ]
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='payment_ledger_cursor_idx'),
+            models.Index(fields=['payment_status', '-timestamp', '-id'], name='payment_ledger_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_source_display()} payment #{self.source_id} - {self.payment_status}"
+
+
+class ReportJob(models.Model):
+    """A PDF report rendered in the background; artifacts are shared across jobs by ``artifact_key``."""
+    ADMIN_PAYMENTS = 'admin_payments'
+    DOCTOR_WALLET = 'doctor_wallet'
+    KIND_CHOICES = (
+        (ADMIN_PAYMENTS, 'Admin payment history'),
+        (DOCTOR_WALLET, 'Doctor wallet report'),
+    )
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='report_jobs')
+    params = models.JSONField(default=dict)
+    artifact_key = models.CharField(max_length=64)
+    file_path = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'artifact_key'], name='report_job_artifact_idx'),
+            models.Index(fields=['created_at'], name='report_job_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.owner} - {self.status}"
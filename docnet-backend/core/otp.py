@@ -0,0 +1,122 @@
+import math
+from django.conf import settings
+from django.utils.crypto import salted_hmac
+from django_redis import get_redis_connection
+
+
+# KEYS: otp hash, email send counter, ip send counter, email cooldown.
+# ARGV: code digest, ttl ms, send window ms, email limit, ip limit (0 = skip), cooldown ms.
+# Returns 0 once the code is stored, otherwise the milliseconds until a send is allowed again.
+ISSUE_SCRIPT = """
+local cooldown = redis.call('PTTL', KEYS[4])
+if cooldown > 0 then
+    return cooldown
+end
+local counters = {{KEYS[2], tonumber(ARGV[4])}, {KEYS[3], tonumber(ARGV[5])}}
+for _, counter in ipairs(counters) do
+    if counter[2] > 0 and tonumber(redis.call('GET', counter[1]) or '0') >= counter[2] then
+        return math.max(redis.call('PTTL', counter[1]), 1)
+    end
+end
+for _, counter in ipairs(counters) do
+    if counter[2] > 0 and redis.call('INCR', counter[1]) == 1 then
+        redis.call('PEXPIRE', counter[1], ARGV[3])
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], 'code', ARGV[1], 'attempts', 0)
+redis.call('PEXPIRE', KEYS[1], ARGV[2])
+if tonumber(ARGV[6]) > 0 then
+    redis.call('SET', KEYS[4], 1, 'PX', ARGV[6])
+end
+return 0
+"""
+
+# KEYS: otp hash. ARGV: code digest, max attempts, consume (1/0).
+VERIFY_SCRIPT = """
+local code = redis.call('HGET', KEYS[1], 'code')
+if not code then
+    return 'missing'
+end
+if code == ARGV[1] then
+    if ARGV[3] == '1' then
+        redis.call('DEL', KEYS[1])
+    end
+    return 'ok'
+end
+if redis.call('HINCRBY', KEYS[1], 'attempts', 1) >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1])
+    return 'locked'
+end
+return 'invalid'
+"""
+
+
+class OTPRateLimited(Exception):
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        super().__init__(f'Too many OTP requests, try again in {retry_after} seconds')
+
+
+class OTPStore:
+    """
+    One-time codes kept in Redis instead of the OTPVerification table. A code
+    lives in a hash that expires with the code, so issue and verify are each
+    a single script call. Issuing also enforces a per-email cooldown and
+    per-email/per-IP send counts over ``OTP_SEND_WINDOW``. Wrong guesses
+    are counted, and the code is burned after ``OTP_MAX_ATTEMPTS``.
+    """
+    _scripts = {}
+
+    @staticmethod
+    def _key(user_id, purpose):
+        return f'otp:{purpose}:{user_id}'
+
+    @staticmethod
+    def _digest(code):
+        return salted_hmac('core.otp.OTPStore', str(code).strip()).hexdigest()
+
+    @classmethod
+    def _run(cls, name, source, keys, *args):
+        client = get_redis_connection('default')
+        script = cls._scripts.get(name)
+        if script is None:
+            script = cls._scripts[name] = client.register_script(source)
+        return script(keys=keys, args=args, client=client)
+
+    @classmethod
+    def issue(cls, user, purpose, code, ttl, client_ip=None):
+        """
+        Store ``code`` for ``ttl`` seconds, or raise OTPRateLimited if the email
+        or IP is over its limit. Requests without a known client IP share one
+        ``OTP_UNKNOWN_IP_SEND_LIMIT`` bucket.
+        """
+        email = user.email.lower()
+        keys = [
+            cls._key(user.id, purpose),
+            f'otp_send:email:{email}',
+            f'otp_send:ip:{client_ip or "unknown"}',
+            f'otp_send:cooldown:{email}',
+        ]
+        wait_ms = cls._run(
+            'issue', ISSUE_SCRIPT, keys,
+            cls._digest(code), ttl * 1000, settings.OTP_SEND_WINDOW * 1000,
+            settings.OTP_EMAIL_SEND_LIMIT,
+            settings.OTP_IP_SEND_LIMIT if client_ip else settings.OTP_UNKNOWN_IP_SEND_LIMIT,
+            settings.OTP_RESEND_COOLDOWN * 1000,
+        )
+        if wait_ms:
+            raise OTPRateLimited(math.ceil(wait_ms / 1000))
+
+    @classmethod
+    def verify(cls, user_id, purpose, code, consume=False):
+        """Return one of 'ok', 'invalid', 'locked' (too many attempts) or 'missing' (expired or never issued)."""
+        result = cls._run(
+            'verify', VERIFY_SCRIPT, [cls._key(user_id, purpose)],
+            cls._digest(code), settings.OTP_MAX_ATTEMPTS, 1 if consume else 0,
+        )
+        return result.decode() if isinstance(result, bytes) else result
+
+    @classmethod
+    def discard(cls, user_id, purpose):
+        get_redis_connection('default').delete(cls._key(user_id, purpose))
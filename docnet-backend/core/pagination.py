@@ -0,0 +1,95 @@
+import base64
+import json
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetCursor:
+    """
+    Opaque cursors for keyset pagination over ``(timestamp, *tiebreakers)``
+    in descending order. A cursor is the sort key of the last row served.
+    """
+    @staticmethod
+    def encode(timestamp, *tiebreakers):
+        raw = json.dumps([timestamp.isoformat(), *tiebreakers])
+        return base64.urlsafe_b64encode(raw.encode()).decode()
+
+    @staticmethod
+    def decode(cursor, tiebreakers=1):
+        """
+        Return ``(timestamp, *tiebreakers)``, or None if the cursor is malformed
+        or doesn't carry exactly ``tiebreakers`` integer tiebreakers.
+        """
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != tiebreakers + 1:
+                return None
+            timestamp = parse_datetime(values[0])
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError, UnicodeDecodeError):
+            return None
+        if timestamp is None:
+            return None
+        if not all(isinstance(value, int) and not isinstance(value, bool) for value in values[1:]):
+            return None
+        return (timestamp, *values[1:])
+
+    @staticmethod
+    def before(timestamp_field, timestamp, id_field='id', id_value=None):
+        """Filter for rows sorting after ``(timestamp, id)`` in ``-timestamp, -id`` order."""
+        condition = Q(**{f'{timestamp_field}__lt': timestamp})
+        if id_value is not None:
+            condition |= Q(**{timestamp_field: timestamp, f'{id_field}__lt': id_value})
+        return condition
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over ``(timestamp_field, id)`` descending. Unlike DRF's
+    CursorPagination the position is the full sort key, so ties on the
+    timestamp never need an OFFSET.
+    """
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    timestamp_field = 'timestamp'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            size = self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = KeysetCursor.decode(cursor)
+            if position is None:
+                raise NotFound('Invalid cursor')
+            queryset = queryset.filter(KeysetCursor.before(self.timestamp_field, position[0], id_value=position[1]))
+
+        rows = list(queryset.order_by(f'-{self.timestamp_field}', '-id')[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        cursor = KeysetCursor.encode(getattr(self.last, self.timestamp_field), self.last.id)
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
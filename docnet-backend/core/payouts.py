@@ -0,0 +1,213 @@
+import logging
+from datetime import timedelta
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from doctor.models import DoctorProfile, Wallet, WalletHistory, Withdrawal
+from utilities.cashfree_payout import (
+    TransferRejected, create_beneficiary_v2, get_beneficiary_v2, get_transfer_status_v2, standard_transfer_v2
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PayoutManager:
+    """
+    Doctor withdrawal payouts as a state machine on ``Withdrawal.payout_state``:
+    queued -> submitted -> settled or failed. A failed payout can be queued
+    again. Approval only records the queued state. ``process_withdrawal_payout``
+    makes the Cashfree calls outside any transaction. Every transition is a
+    conditional UPDATE, so a duplicate task or a second admin click can't move
+    a payout twice. A resubmitted transfer reuses its transfer_id, so Cashfree
+    answers 409 instead of paying again.
+    """
+    SETTLED_STATUSES = {'SUCCESS', 'RECEIVED', 'ACCEPTED'}
+    FAILED_STATUSES = {'FAILED', 'REJECTED', 'REVERSED'}
+    QUEUEABLE_STATES = ['', Withdrawal.PAYOUT_FAILED]
+    IN_FLIGHT_STATES = [Withdrawal.PAYOUT_QUEUED, Withdrawal.PAYOUT_SUBMITTED]
+
+    @staticmethod
+    def transition(withdrawal_id, from_states, to_state, **fields):
+        """Move the payout to ``to_state`` if it is in one of ``from_states``; returns whether it moved."""
+        return bool(Withdrawal.objects.filter(id=withdrawal_id, payout_state__in=from_states).update(
+            payout_state=to_state, payout_updated_at=timezone.now(), **fields
+        ))
+
+    @classmethod
+    def in_flight_amount(cls, doctor_id, exclude_id=None):
+        """Total of the doctor's queued and submitted payouts, which the wallet has not been debited for yet."""
+        withdrawals = Withdrawal.objects.filter(doctor_id=doctor_id, payout_state__in=cls.IN_FLIGHT_STATES)
+        if exclude_id is not None:
+            withdrawals = withdrawals.exclude(id=exclude_id)
+        return withdrawals.aggregate(total=Sum('amount'))['total'] or 0
+
+    @classmethod
+    def queue(cls, withdrawal, remarks=''):
+        """Queue an approved withdrawal for payout; returns False if a payout is already in flight."""
+        from .tasks import process_withdrawal_payout
+
+        queued = Withdrawal.objects.filter(
+            id=withdrawal.id, status='pending', payout_state__in=cls.QUEUEABLE_STATES
+        ).update(
+            payout_state=Withdrawal.PAYOUT_QUEUED,
+            payout_updated_at=timezone.now(),
+            payout_attempts=F('payout_attempts') + 1,
+            # A retry after a failure needs a fresh transfer_id; retries within one attempt reuse this one.
+            payout_reference_id=f'wd_{withdrawal.id}_{withdrawal.payout_attempts + 1}',
+            payout_status=None,
+            remarks=remarks or f'Withdrawal for {withdrawal.doctor.user.username}',
+        )
+        if queued:
+            transaction.on_commit(lambda: process_withdrawal_payout.delay(withdrawal.id))
+        return bool(queued)
+
+    @staticmethod
+    def ensure_beneficiary(doctor):
+        beneficiary_id = doctor.beneficiary_id or f'dr_{doctor.id}'
+        try:
+            if get_beneficiary_v2(beneficiary_id=beneficiary_id):
+                return beneficiary_id
+        except Exception as e:
+            logger.warning(f"Beneficiary lookup for {beneficiary_id} failed, creating it: {e}")
+
+        create_beneficiary_v2({
+            'beneficiary_id': beneficiary_id,
+            'beneficiary_name': doctor.user.get_full_name() or doctor.user.username,
+            'bank_account_number': doctor.bank_account,
+            'bank_ifsc': doctor.ifsc_code,
+            'beneficiary_email': doctor.user.email or '',
+            'beneficiary_phone': getattr(doctor, 'phone_number', '') or '',
+        })
+        if doctor.beneficiary_id != beneficiary_id:
+            DoctorProfile.objects.filter(id=doctor.id).update(beneficiary_id=beneficiary_id)
+        return beneficiary_id
+
+    @classmethod
+    def process(cls, withdrawal_id):
+        """Submit the transfer for a queued (or resubmit a submitted) payout; returns the resulting state."""
+        withdrawal = Withdrawal.objects.select_related('doctor__user').get(id=withdrawal_id)
+        if withdrawal.payout_state not in cls.IN_FLIGHT_STATES:
+            return withdrawal.payout_state
+
+        beneficiary_id = cls.ensure_beneficiary(withdrawal.doctor)
+        if withdrawal.payout_state == Withdrawal.PAYOUT_QUEUED:
+            if not cls.transition(withdrawal.id, [Withdrawal.PAYOUT_QUEUED], Withdrawal.PAYOUT_SUBMITTED):
+                return Withdrawal.objects.values_list('payout_state', flat=True).get(id=withdrawal.id)
+
+        transfer_id = withdrawal.payout_reference_id
+        try:
+            response = standard_transfer_v2(
+                transfer_id=transfer_id,
+                amount=withdrawal.amount,
+                beneficiary_id=beneficiary_id,
+                remarks=withdrawal.remarks,
+            )
+        except TransferRejected as e:
+            return cls.fail(withdrawal.id, str(e))
+        except requests.HTTPError as e:
+            if e.response is not None and e.response.status_code < 500:
+                return cls.fail(withdrawal.id, f'Transfer rejected: {e}')
+            raise
+        except ValueError as e:
+            # The request went out but the reply was unreadable, so Cashfree may
+            # have accepted it. Leave it submitted for reconcile() to look up.
+            logger.warning(f"Unreadable transfer response for withdrawal {withdrawal.id}, leaving it for reconciliation: {e}")
+            return Withdrawal.PAYOUT_SUBMITTED
+
+        if not isinstance(response, dict):
+            raise ValueError('Invalid response from Cashfree')
+        if response.get('status') == 'DUPLICATE':
+            response = get_transfer_status_v2(transfer_id=transfer_id) or {}
+        return cls.apply_gateway_status(withdrawal, response)
+
+    @classmethod
+    def apply_gateway_status(cls, withdrawal, response):
+        payout_status = response.get('status', 'UNKNOWN')
+        payout_data = response.get('data') or {}
+        fields = {'payout_status': payout_status}
+        reference = (
+            response.get('cf_transfer_id') or
+            response.get('cfTransferId') or
+            response.get('referenceId') or
+            payout_data.get('cf_transfer_id') or
+            payout_data.get('referenceId') or
+            payout_data.get('utr')
+        )
+        if reference:
+            fields['cashfree_reference_id'] = reference
+
+        if payout_status in cls.SETTLED_STATUSES:
+            return cls.settle(withdrawal, **fields)
+        if payout_status in cls.FAILED_STATUSES:
+            return cls.fail(withdrawal.id, f'Payout {payout_status.lower()} by Cashfree', **fields)
+        cls.transition(withdrawal.id, [Withdrawal.PAYOUT_SUBMITTED], Withdrawal.PAYOUT_SUBMITTED, **fields)
+        return Withdrawal.PAYOUT_SUBMITTED
+
+    @classmethod
+    def settle(cls, withdrawal, **fields):
+        with transaction.atomic():
+            # Lock the wallet before the withdrawal row, in the same order as approval.
+            wallet = Wallet.objects.select_for_update().get(doctor_id=withdrawal.doctor_id)
+            if wallet.balance < withdrawal.amount:
+                # Never drive the balance negative. The payout stays submitted,
+                # and reconcile() retries the debit on its next run.
+                logger.error(
+                    f"Wallet balance {wallet.balance} can't cover settled payout for withdrawal {withdrawal.id} "
+                    f"({withdrawal.amount}); leaving it submitted"
+                )
+                cls.transition(withdrawal.id, [Withdrawal.PAYOUT_SUBMITTED], Withdrawal.PAYOUT_SUBMITTED, **fields)
+                return Withdrawal.PAYOUT_SUBMITTED
+            settled = cls.transition(
+                withdrawal.id, [Withdrawal.PAYOUT_SUBMITTED], Withdrawal.PAYOUT_SETTLED,
+                status='completed', processed_at=timezone.now(), **fields
+            )
+            if settled:
+                wallet.balance -= withdrawal.amount
+                wallet.save()
+                WalletHistory.objects.create(
+                    wallet=wallet,
+                    type=WalletHistory.DEBIT,
+                    amount=withdrawal.amount,
+                    new_balance=wallet.balance
+                )
+        return Withdrawal.PAYOUT_SETTLED
+
+    @classmethod
+    def fail(cls, withdrawal_id, error, from_states=None, **fields):
+        logger.error(f"Payout for withdrawal {withdrawal_id} failed: {error}")
+        cls.transition(withdrawal_id, from_states or cls.IN_FLIGHT_STATES, Withdrawal.PAYOUT_FAILED, remarks=error, **fields)
+        return Withdrawal.PAYOUT_FAILED
+
+    @classmethod
+    def reconcile(cls):
+        """
+        Poll Cashfree for submitted payouts, and dispatch again the queued or
+        submitted payouts that have not moved for ``PAYOUT_REQUEUE_AFTER``
+        seconds, in case their task was lost.
+        """
+        from .tasks import process_withdrawal_payout
+
+        stale = timezone.now() - timedelta(seconds=settings.PAYOUT_REQUEUE_AFTER)
+        counts = {}
+        withdrawals = Withdrawal.objects.filter(
+            payout_state__in=cls.IN_FLIGHT_STATES
+        ).order_by('payout_updated_at')[:settings.PAYOUT_RECONCILE_BATCH_SIZE]
+        for withdrawal in withdrawals:
+            state = withdrawal.payout_state
+            if state == Withdrawal.PAYOUT_SUBMITTED:
+                try:
+                    response = get_transfer_status_v2(transfer_id=withdrawal.payout_reference_id)
+                except Exception as e:
+                    logger.warning(f"Transfer status lookup for {withdrawal.payout_reference_id} failed: {e}")
+                    continue
+                if response:
+                    state = cls.apply_gateway_status(withdrawal, response)
+                    counts[state] = counts.get(state, 0) + 1
+                    continue
+            # Queued with no worker progress, or submitted but unknown to Cashfree: run the payout again.
+            if withdrawal.payout_updated_at < stale:
+                process_withdrawal_payout.delay(withdrawal.id)
+                counts['redispatched'] = counts.get('redispatched', 0) + 1
+        return counts
@@ -0,0 +1,68 @@
+import re
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import F, Value
+from rest_framework.filters import BaseFilterBackend
+from doctor.models import DoctorProfile
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class DoctorSearchManager:
+    """
+    Maintains DoctorProfile.search_vector and builds queries against it.
+    Doctor names weigh most, then specialization, then hospital.
+    """
+    @staticmethod
+    def build_vector(profile):
+        user = profile.user
+        config = settings.DOCTOR_SEARCH_CONFIG
+        return (
+            SearchVector(Value(user.first_name or ''), Value(user.last_name or ''), weight='A', config=config) +
+            SearchVector(Value(profile.specialization or ''), weight='B', config=config) +
+            SearchVector(Value(profile.hospital or ''), weight='C', config=config)
+        )
+
+    @staticmethod
+    def update_profile(profile):
+        DoctorProfile.objects.filter(pk=profile.pk).update(
+            search_vector=DoctorSearchManager.build_vector(profile)
+        )
+
+    @staticmethod
+    def prefix_query(text):
+        """Match every typed word, treating the last one as an unfinished prefix."""
+        tokens = TOKEN_RE.findall(text.lower())
+        if not tokens:
+            return None
+        terms = tokens[:-1] + [f'{tokens[-1]}:*']
+        return SearchQuery(' & '.join(terms), search_type='raw', config=settings.DOCTOR_SEARCH_CONFIG)
+
+    @staticmethod
+    def rank(queryset, query):
+        return queryset.filter(search_vector=query).annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        )
+
+
+class DoctorSearchFilter(BaseFilterBackend):
+    """
+    Full-text replacement for SearchFilter on doctor listings. List it after
+    OrderingFilter: without an explicit ``ordering`` param results are ranked
+    by relevance, with the view's default ordering as the tie-breaker.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+
+        # Prefix matching, as in autocomplete: the list is queried on every keystroke.
+        query = DoctorSearchManager.prefix_query(text)
+        if query is None:
+            return queryset.none()
+        queryset = DoctorSearchManager.rank(queryset, query)
+        if request.query_params.get('ordering'):
+            return queryset
+        return queryset.order_by('-search_rank', *queryset.query.order_by)
@@ -2,6 +2,8 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from doctor.models import DoctorProfile, DoctorSlot, Wallet,Withdrawal
 from accounts.models import User, PatientProfile, Payment,Appointment,DoctorReport,EmergencyPayment
+from django.urls import reverse
+from .models import PaymentLedgerEntry, ReportJob
 
 
 User = get_user_model()
@@ -206,38 +208,24 @@ class PaymentListSerializer(serializers.ModelSerializer):
     def get_type(self, obj):
         return "Consultation"  
 
-class UnifiedPaymentSerializer(serializers.Serializer):
-    id = serializers.IntegerField()
-    payment_id = serializers.CharField()
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
-    payment_status = serializers.CharField()
-    payment_method = serializers.CharField()
+class PaymentLedgerSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='source_id')
     date = serializers.DateTimeField(source='timestamp', format='%b %d, %Y')
     time = serializers.DateTimeField(source='timestamp', format='%I:%M %p')
     type = serializers.SerializerMethodField()
-    patient_name = serializers.SerializerMethodField()
-    patient_id = serializers.SerializerMethodField()
-    patient_avatar = serializers.SerializerMethodField()
-    doctor_name = serializers.SerializerMethodField()
+    patient_name = serializers.CharField(source='patient_username')
+    patient_id = serializers.IntegerField()
+    doctor_name = serializers.CharField(source='doctor_username')
 
-    def get_type(self, obj):
-        return "Emergency" if isinstance(obj, EmergencyPayment) else "Consultation"
-
-    def get_patient_name(self, obj):
-        return obj.patient.username
-
-    def get_patient_id(self, obj):
-        return obj.patient.id
-
-    def get_patient_avatar(self, obj):
-        return obj.patient.profile_image
+    class Meta:
+        model = PaymentLedgerEntry
+        fields = [
+            'id', 'payment_id', 'amount', 'payment_status', 'payment_method', 'date', 'time',
+            'type', 'patient_name', 'patient_id', 'patient_avatar', 'doctor_name'
+        ]
 
-    def get_doctor_name(self, obj):
-        if isinstance(obj, Payment):
-            return obj.slot.doctor.user.username if obj.slot and obj.slot.doctor else None
-        elif isinstance(obj, EmergencyPayment):
-            return obj.doctor.user.username
-        return None
+    def get_type(self, obj):
+        return "Emergency" if obj.source == PaymentLedgerEntry.EMERGENCY else "Consultation"
 
 
 class DoctorEarningsSerializer(serializers.ModelSerializer):
@@ -276,6 +264,7 @@ class WithdrawalSerializer(serializers.ModelSerializer):
             'doctor_name',
             'doctor_email',
             'beneficiary_id',
+            'payout_state',
         ]
 
     def get_updated_date(self, obj):
@@ -291,3 +280,37 @@ class WithdrawalSerializer(serializers.ModelSerializer):
             return 'rejected'
         else:
             return None
+
+
+class WithdrawalPayoutSerializer(serializers.ModelSerializer):
+    withdrawal_id = serializers.IntegerField(source='id')
+    transfer_id = serializers.CharField(source='payout_reference_id')
+    status_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Withdrawal
+        fields = [
+            'withdrawal_id', 'status', 'payout_state', 'payout_status', 'transfer_id',
+            'cashfree_reference_id', 'payout_attempts', 'payout_updated_at', 'processed_at', 'remarks', 'status_url'
+        ]
+
+    def get_status_url(self, obj):
+        return self.context['request'].build_absolute_uri(reverse('withdrawal-payout', args=[obj.id]))
+
+
+class ReportJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id')
+    status_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ReportJob
+        fields = ['job_id', 'kind', 'status', 'error', 'created_at', 'completed_at', 'status_url', 'download_url']
+
+    def get_status_url(self, obj):
+        return self.context['request'].build_absolute_uri(reverse('report-job', args=[obj.id]))
+
+    def get_download_url(self, obj):
+        if obj.status != ReportJob.READY:
+            return None
+        return self.context['request'].build_absolute_uri(reverse('report-job-download', args=[obj.id]))
@@ -0,0 +1,174 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from accounts.models import User, DoctorReview, Payment, Appointment, EmergencyPayment
+from doctor.models import DoctorProfile, DoctorSlot, Wallet, WalletHistory
+from django.db import transaction
+from .cache import UserStatusCache, DoctorDirectoryCache, UserResponseCache, TaggedResponseCache
+from .exports import wallet_history_tag
+from .search import DoctorSearchManager
+from .utils import RatingManager, PaymentLedgerManager
+
+PROFILE_SEARCH_FIELDS = {'specialization', 'hospital'}
+USER_SEARCH_FIELDS = {'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_status_on_save(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is None or 'is_active' in update_fields:
+        UserStatusCache.invalidate(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_user_status_on_delete(sender, instance, **kwargs):
+    UserStatusCache.invalidate(instance.id)
+
+
+@receiver(pre_save, sender=DoctorReview)
+def remember_review_rating(sender, instance, raw=False, **kwargs):
+    if instance.pk and not raw:
+        instance._previous_rating = DoctorReview.objects.filter(pk=instance.pk).values_list('doctor_id', 'rating').first()
+
+
+@receiver(post_save, sender=DoctorReview)
+def add_review_to_doctor_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        RatingManager.add_review(instance.doctor_id, int(instance.rating))
+        return
+    previous = getattr(instance, '_previous_rating', None)
+    if previous and previous != (instance.doctor_id, instance.rating):
+        RatingManager.rebuild(DoctorProfile.objects.filter(id__in={previous[0], instance.doctor_id}))
+
+
+@receiver(post_delete, sender=DoctorReview)
+def remove_review_from_doctor_rating(sender, instance, **kwargs):
+    RatingManager.remove_review(instance.doctor_id, int(instance.rating))
+
+
+@receiver(post_save, sender=DoctorProfile)
+def update_doctor_search_vector(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if update_fields is None or PROFILE_SEARCH_FIELDS & set(update_fields):
+        DoctorSearchManager.update_profile(instance)
+
+
+@receiver(post_save, sender=User)
+def update_doctor_search_vector_for_user(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if created or raw or instance.role != 'doctor':
+        return
+    if update_fields is not None and not USER_SEARCH_FIELDS & set(update_fields):
+        return
+    profile = DoctorProfile.objects.filter(user=instance).first()
+    if profile:
+        profile.user = instance
+        DoctorSearchManager.update_profile(profile)
+
+
+@receiver(post_save, sender=DoctorProfile)
+@receiver(post_delete, sender=DoctorProfile)
+def invalidate_directory_for_profile(sender, instance, **kwargs):
+    DoctorDirectoryCache.invalidate(instance.slug, instance.user.username)
+
+
+@receiver(post_save, sender=User)
+def invalidate_directory_for_user(sender, instance, created, update_fields=None, **kwargs):
+    if created or instance.role != 'doctor':
+        return
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    slug = DoctorProfile.objects.filter(user=instance).values_list('slug', flat=True).first()
+    if slug:
+        DoctorDirectoryCache.invalidate(slug, instance.username)
+
+
+@receiver(post_save, sender=DoctorSlot)
+@receiver(post_delete, sender=DoctorSlot)
+@receiver(post_save, sender=DoctorReview)
+@receiver(post_delete, sender=DoctorReview)
+def invalidate_directory_for_doctor_change(sender, instance, **kwargs):
+    DoctorDirectoryCache.invalidate_doctor(instance.doctor_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_directory_for_payment(sender, instance, **kwargs):
+    if instance.slot_id:
+        doctor_id = DoctorSlot.objects.filter(id=instance.slot_id).values_list('doctor_id', flat=True).first()
+        if doctor_id:
+            DoctorDirectoryCache.invalidate_doctor(doctor_id)
+
+
+@receiver(post_save, sender=User)
+def bump_user_responses_for_user(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    UserResponseCache.bump(instance.id)
+
+
+@receiver(post_save, sender=DoctorProfile)
+def bump_user_responses_for_profile(sender, instance, **kwargs):
+    UserResponseCache.bump(instance.user_id)
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def bump_user_responses_for_payment(sender, instance, **kwargs):
+    doctor_user_id = DoctorSlot.objects.filter(id=instance.slot_id).values_list('doctor__user_id', flat=True).first()
+    UserResponseCache.bump(*filter(None, [instance.patient_id, doctor_user_id]))
+
+
+@receiver(post_save, sender=Appointment)
+@receiver(post_delete, sender=Appointment)
+def bump_user_responses_for_appointment(sender, instance, **kwargs):
+    users = Payment.objects.filter(id=instance.payment_id).values_list('patient_id', 'slot__doctor__user_id').first()
+    if users:
+        UserResponseCache.bump(*filter(None, users))
+
+
+@receiver(post_save, sender=EmergencyPayment)
+@receiver(post_delete, sender=EmergencyPayment)
+def bump_user_responses_for_emergency_payment(sender, instance, **kwargs):
+    doctor_user_id = DoctorProfile.objects.filter(id=instance.doctor_id).values_list('user_id', flat=True).first()
+    UserResponseCache.bump(*filter(None, [instance.patient_id, doctor_user_id]))
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_save, sender=WalletHistory)
+@receiver(post_delete, sender=WalletHistory)
+def bump_user_responses_for_wallet(sender, instance, **kwargs):
+    wallet_id = instance.id if sender is Wallet else instance.wallet_id
+    doctor_user_id = Wallet.objects.filter(id=wallet_id).values_list('doctor__user_id', flat=True).first()
+    if doctor_user_id:
+        UserResponseCache.bump(doctor_user_id)
+
+
+@receiver(post_save, sender=WalletHistory)
+@receiver(post_delete, sender=WalletHistory)
+def invalidate_wallet_reports(sender, instance, **kwargs):
+    tag = wallet_history_tag(instance.wallet_id)
+    transaction.on_commit(lambda: TaggedResponseCache.invalidate(tag))
+
+
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=EmergencyPayment)
+def sync_payment_ledger(sender, instance, raw=False, **kwargs):
+    if not raw:
+        PaymentLedgerManager.sync(instance)
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=EmergencyPayment)
+def remove_payment_ledger_entry(sender, instance, **kwargs):
+    PaymentLedgerManager.remove(instance)
+
+
+@receiver(post_save, sender=User)
+def sync_payment_ledger_names(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is None or {'username', 'profile_image'} & set(update_fields):
+        PaymentLedgerManager.sync_user(instance)
@@ -0,0 +1,57 @@
+from celery import shared_task
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from doctor.models import Withdrawal
+from .utils import AppointmentManager
+from .exports import ReportJobManager
+from .payouts import PayoutManager
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def complete_finished_appointments():
+    metrics = AppointmentManager.complete_finished(
+        batch_size=settings.APPOINTMENT_COMPLETION_BATCH_SIZE,
+        max_batches=settings.APPOINTMENT_COMPLETION_MAX_BATCHES,
+    )
+    logger.info(
+        f"Appointment completion sweep: scanned {metrics['scanned']} in {metrics['batches']} batches, "
+        f"completed {metrics['completed']}"
+    )
+    return metrics
+
+
+@shared_task(bind=True, queue='payouts', rate_limit='30/m', max_retries=3)
+def process_withdrawal_payout(self, withdrawal_id):
+    try:
+        return PayoutManager.process(withdrawal_id)
+    except Exception as e:
+        if self.request.retries >= self.max_retries:
+            # Nothing was sent if it never left queued; a submitted payout is left for reconciliation.
+            return PayoutManager.fail(
+                withdrawal_id, f'Payout could not be submitted: {e}', from_states=[Withdrawal.PAYOUT_QUEUED]
+            )
+        logger.warning(f"Payout for withdrawal {withdrawal_id} failed, retrying: {e}")
+        raise self.retry(exc=e, countdown=settings.PAYOUT_RETRY_BACKOFF * 2 ** self.request.retries)
+
+
+@shared_task(queue='payouts')
+def reconcile_withdrawal_payouts():
+    counts = PayoutManager.reconcile()
+    logger.info(f"Withdrawal payout reconciliation: {counts}")
+    return counts
+
+
+@shared_task(queue='reports', rate_limit='20/m')
+def generate_report(job_id):
+    ReportJobManager.run(job_id)
+
+
+@shared_task(queue='reports')
+def purge_expired_reports():
+    deleted = ReportJobManager.purge(timezone.now() - timedelta(days=settings.REPORT_RETENTION_DAYS))
+    logger.info(f"Purged {deleted} expired report jobs")
+    return deleted
@@ -1,3 +1,629 @@
-from django.test import TestCase
+import base64
+import json
+import requests
+import shutil
+import smtplib
+import tempfile
+import uuid
+from asgiref.sync import async_to_sync
+from datetime import datetime, time, timedelta
+from unittest import mock
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django_redis import get_redis_connection
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User, Payment, Appointment, EmergencyPayment
+from core.cache import UserStatusCache
+from core.emails import EmailDispatcher
+from core.exports import ReportJobManager
+from core.models import ReportJob
+from core.payouts import PayoutManager
+from core.utils import AppointmentManager, EmailManager
+from core.video import VideoRoomRegistry
+from utilities import cashfree_payout
+from utilities.cashfree_payout import CashfreeClient, TransferRejected
+from doctor.models import DoctorProfile, DoctorSlot, DoctorStats, Wallet, WalletHistory, Withdrawal
 
-# Create your tests here.
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def read_stream(response):
+    """Collect a streaming response whose body is an async iterator, as the ASGI handler would."""
+    async def read():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(read)()
+
+
+class AdminAppointmentListViewTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', email='admin@example.com', role='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+        doctor_user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        base = timezone.now() - timedelta(days=1)
+
+        self.expected = []
+        for n in range(7):
+            slot = DoctorSlot.objects.create(
+                doctor=doctor, date=timezone.now().date(), start_time=time(9, n),
+                duration=30, consultation_type='video', max_patients=1
+            )
+            payment = Payment.objects.create(slot=slot, patient=patient)
+            appointment = Appointment.objects.create(payment=payment, status='completed')
+            # Pairs of normal and emergency rows share a timestamp to exercise tie-breaking
+            stamp = base + timedelta(minutes=n // 2)
+            Appointment.objects.filter(id=appointment.id).update(created_at=stamp)
+            self.expected.append((stamp, 0, appointment.id))
+
+        for n in range(5):
+            emergency = EmergencyPayment.objects.create(doctor=doctor, patient=patient, payment_status='success')
+            stamp = base + timedelta(minutes=n)
+            EmergencyPayment.objects.filter(id=emergency.id).update(timestamp=stamp)
+            self.expected.append((stamp, 1, emergency.id))
+
+        self.expected = [(kind == 1, obj_id) for _, kind, obj_id in sorted(self.expected, reverse=True)]
+
+    def keys(self, results):
+        return [(row['is_emergency'], row['id']) for row in results]
+
+    def test_cursor_pages_follow_merged_order(self):
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 5}
+            if cursor:
+                params['cursor'] = cursor
+            data = self.client.get(reverse('admin-appointment-list'), params).json()
+            self.assertEqual(data['count'], 12)
+            seen += self.keys(data['results'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, self.expected)
+
+    def test_malformed_cursors_are_rejected(self):
+        timestamp = timezone.now().isoformat()
+        cursors = [
+            {'a': 1}, [timestamp, 'x', 1], [timestamp, 0], [timestamp, 0, 1.5], [timestamp, True, 1], 'not json',
+        ]
+        for value in cursors:
+            raw = value if isinstance(value, str) else json.dumps(value)
+            cursor = base64.urlsafe_b64encode(raw.encode()).decode()
+            response = self.client.get(reverse('admin-appointment-list'), {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, value)
+        self.assertEqual(self.client.get(reverse('admin-payments'), {'cursor': cursor}).status_code, 404)
+
+    def test_page_number_still_supported(self):
+        data = self.client.get(reverse('admin-appointment-list'), {'page_size': 5, 'page': 2}).json()
+        self.assertEqual(self.keys(data['results']), self.expected[5:10])
+
+    def test_non_positive_page_size_is_clamped(self):
+        for page_size in (0, -3):
+            response = self.client.get(reverse('admin-appointment-list'), {'page_size': page_size})
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(self.keys(data['results']), self.expected[:1])
+            self.assertIsNotNone(data['next_cursor'])
+
+    def test_invalid_page_params_fall_back_to_defaults(self):
+        response = self.client.get(reverse('admin-appointment-list'), {'page_size': 'abc', 'page': 'x'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.keys(response.json()['results']), self.expected[:10])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        with CaptureQueriesContext(connection) as small_page:
+            self.client.get(reverse('admin-appointment-list'), {'page_size': 3})
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(reverse('admin-appointment-list'), {'page_size': 12})
+        self.assertEqual(len(small_page), len(full_page))
+
+
+class CompleteFinishedAppointmentsTests(TestCase):
+    def setUp(self):
+        doctor_user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        self.patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.now = timezone.make_aware(datetime.combine(timezone.localdate(), time(12, 0)))
+
+    def book(self, date, start_time):
+        slot = DoctorSlot.objects.create(
+            doctor=self.doctor, date=date, start_time=start_time,
+            duration=30, consultation_type='video', max_patients=1
+        )
+        payment = Payment.objects.create(slot=slot, patient=self.patient)
+        return Appointment.objects.create(payment=payment, status='scheduled')
+
+    def test_completes_only_appointments_past_their_end_time(self):
+        today = self.now.date()
+        finished = [self.book(today - timedelta(days=1), time(9, 0)), self.book(today, time(11, 0))]
+        in_progress = self.book(today, time(11, 45))
+        upcoming = self.book(today + timedelta(days=1), time(9, 0))
+
+        metrics = AppointmentManager.complete_finished(now=self.now, batch_size=1)
+
+        self.assertEqual(metrics, {'batches': 3, 'scanned': 3, 'completed': 2})
+        for appointment in finished:
+            appointment.refresh_from_db()
+            self.assertEqual(appointment.status, 'completed')
+        for appointment in (in_progress, upcoming):
+            appointment.refresh_from_db()
+            self.assertEqual(appointment.status, 'scheduled')
+        self.assertEqual(DoctorStats.objects.get(doctor=self.doctor).completed_appointments, 2)
+
+    def test_max_batches_bounds_a_run(self):
+        for hour in range(9, 12):
+            self.book(self.now.date() - timedelta(days=1), time(hour, 0))
+        metrics = AppointmentManager.complete_finished(now=self.now, batch_size=1, max_batches=2)
+        self.assertEqual(metrics['completed'], 2)
+        self.assertEqual(Appointment.objects.filter(status='scheduled').count(), 1)
+
+
+class AdminPaymentHistoryTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', email='admin@example.com', role='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+        doctor_user = User.objects.create(username='drmeera', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        self.patient = User.objects.create(username='anita', email='patient@example.com', role='patient')
+        slot = DoctorSlot.objects.create(
+            doctor=doctor, date=timezone.now().date(), start_time=time(9, 0),
+            duration=30, consultation_type='video', max_patients=1
+        )
+        stamp = timezone.now() - timedelta(days=1)
+        for n in range(3):
+            payment = Payment.objects.create(slot=slot, patient=self.patient, payment_status='success', payment_id=f'order_{n}')
+            Payment.objects.filter(id=payment.id).update(timestamp=stamp)
+            payment.refresh_from_db()
+            payment.save()
+        emergency = EmergencyPayment.objects.create(doctor=doctor, patient=self.patient, payment_status='pending')
+        EmergencyPayment.objects.filter(id=emergency.id).update(timestamp=stamp)
+        emergency.refresh_from_db()
+        emergency.save()
+
+    def test_ledger_pages_by_timestamp_and_id(self):
+        url, rows = reverse('admin-payments') + '?page_size=3', []
+        while url:
+            data = self.client.get(url).json()
+            rows += data['results']
+            url = data['next']
+        self.assertEqual([(row['type'], row['doctor_name']) for row in rows[:1]], [('Emergency', 'drmeera')])
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(len({(row['type'], row['id']) for row in rows}), 4)
+
+    def test_ledger_follows_status_and_name_changes(self):
+        payment = Payment.objects.first()
+        payment.payment_status = 'refunded'
+        payment.save()
+        self.patient.username = 'anita.k'
+        self.patient.save()
+
+        data = self.client.get(reverse('admin-payments'), {'status': 'refunded', 'search': 'anita.k'}).json()
+        self.assertEqual([row['id'] for row in data['results']], [payment.id])
+
+    def test_csv_export_streams_ledger_within_date_range(self):
+        Payment.objects.filter(payment_id='order_0').update(timestamp=timezone.now() - timedelta(days=10))
+        Payment.objects.get(payment_id='order_0').save()
+        since = timezone.localdate() - timedelta(days=3)
+
+        response = self.client.get(reverse('admin-payments-csv'), {'start_date': since.isoformat()})
+        self.assertTrue(response.streaming)
+        self.assertTrue(response.is_async)
+        lines = read_stream(response).decode().splitlines()
+        self.assertEqual(lines[0].split(','), ['Payment ID', 'Patient', 'Doctor', 'Amount', 'Method', 'Date', 'Time', 'Status', 'Type'])
+        self.assertEqual(len(lines), 4)
+        self.assertNotIn('order_0', ''.join(lines))
+        self.assertIn('drmeera', lines[1])
+
+        response = self.client.get(reverse('admin-payments-csv'), {'start_date': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReportJobTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        admin = User.objects.create(username='admin', email='admin@example.com', role='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        doctor_user = User.objects.create(username='drmeera', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(user=doctor_user, registration_id='REG1')
+        patient = User.objects.create(username='anita', email='patient@example.com', role='patient')
+        slot = DoctorSlot.objects.create(
+            doctor=doctor, date=timezone.now().date(), start_time=time(9, 0),
+            duration=30, consultation_type='video', max_patients=1
+        )
+        Payment.objects.create(slot=slot, patient=patient, payment_status='success', payment_id='order_1')
+
+    def request_report(self):
+        with mock.patch('core.tasks.generate_report.delay', side_effect=ReportJobManager.run) as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse('admin-payments-pdf'))
+        return response, delay.call_count
+
+    def test_report_is_rendered_once_and_reused_until_data_changes(self):
+        response, renders = self.request_report()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(renders, 1)
+
+        job = self.client.get(reverse('report-job', args=[response.json()['job_id']])).json()
+        self.assertEqual(job['status'], ReportJob.READY)
+        download = self.client.get(job['download_url'])
+        self.assertTrue(b''.join(download.streaming_content).startswith(b'%PDF'))
+
+        response, renders = self.request_report()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(renders, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.first().save()
+        response, renders = self.request_report()
+        self.assertEqual(renders, 1)
+        self.assertEqual(ReportJob.objects.values('artifact_key').distinct().count(), 2)
+
+    def test_jobs_are_private_to_their_owner(self):
+        response, _ = self.request_report()
+        other = User.objects.create(username='admin2', email='admin2@example.com', role='admin', is_staff=True)
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('report-job', args=[response.json()['job_id']])).status_code, 404)
+
+
+class VideoRoomRegistryTests(TestCase):
+    def setUp(self):
+        self.room = f'test_{uuid.uuid4().hex}'
+        try:
+            VideoRoomRegistry.members(self.room)
+        except Exception as e:
+            self.skipTest(f'Redis is not available: {e}')
+        self.addCleanup(get_redis_connection('default').delete, VideoRoomRegistry._stats_key(self.room))
+
+    def test_join_leave_and_occupancy(self):
+        self.assertEqual(VideoRoomRegistry.join(self.room, 'channel.a', 1), [])
+        self.assertEqual(VideoRoomRegistry.join(self.room, 'channel.b', 2), ['channel.a'])
+        VideoRoomRegistry.record_relay(self.room, 3, 2)
+        self.assertEqual(VideoRoomRegistry.occupancy(self.room), {
+            'room': self.room, 'count': 2, 'participants': [1, 2],
+            'relay': {'messages': 3, 'channel_sends': 2},
+        })
+
+        self.assertEqual(VideoRoomRegistry.leave(self.room, 'channel.a'), 1)
+        self.assertEqual(VideoRoomRegistry.leave(self.room, 'channel.b'), 0)
+        self.assertEqual(VideoRoomRegistry.join(self.room, 'channel.c', 1), [])
+        VideoRoomRegistry.leave(self.room, 'channel.c')
+
+    def test_members_without_heartbeat_expire(self):
+        with override_settings(VIDEO_ROOM_MEMBER_TTL=-1):
+            VideoRoomRegistry.join(self.room, 'channel.crashed', 1)
+        self.assertFalse(VideoRoomRegistry.heartbeat(self.room, 'channel.gone'))
+        self.assertEqual(VideoRoomRegistry.join(self.room, 'channel.a', 2), [])
+        self.assertTrue(VideoRoomRegistry.heartbeat(self.room, 'channel.a'))
+        VideoRoomRegistry.leave(self.room, 'channel.a')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class EmailDispatcherTests(TestCase):
+    def setUp(self):
+        try:
+            self.redis = get_redis_connection('default')
+            for outbox in (EmailDispatcher.OTP, EmailDispatcher.BULK):
+                self.clear_outbox(outbox)
+                self.addCleanup(self.clear_outbox, outbox)
+        except Exception as e:
+            self.skipTest(f'Redis is not available: {e}')
+
+    def clear_outbox(self, outbox):
+        cache.delete_many([EmailDispatcher.flush_scheduled_key(outbox), EmailDispatcher.flush_lock_key(outbox)])
+        self.redis.delete(
+            EmailDispatcher.outbox_key(outbox), EmailDispatcher.processing_key(outbox), EmailDispatcher.failures_key(outbox)
+        )
+
+    def queued(self, outbox=EmailDispatcher.BULK):
+        return [json.loads(item) for item in self.redis.lrange(EmailDispatcher.outbox_key(outbox), 0, -1)]
+
+    def test_otp_burst_is_sent_over_one_connection_with_one_scheduled_flush(self):
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async') as schedule:
+            for n in range(3):
+                self.assertTrue(EmailManager.send_registration_otp(f'user{n}@example.com', f'12345{n}'))
+            EmailManager.send_password_reset_otp('user0@example.com', '654321')
+        self.assertEqual(schedule.call_count, 1)
+
+        with mock.patch('core.emails.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(EmailDispatcher.flush(EmailDispatcher.OTP), 4)
+        self.assertEqual(connect.call_count, 1)
+
+        self.assertEqual([m.to for m in mail.outbox[:3]], [[f'user{n}@example.com'] for n in range(3)])
+        self.assertIn('OTP: 123450', mail.outbox[0].body)
+        self.assertIn('valid for 2 minutes', mail.outbox[0].body)
+        self.assertEqual(mail.outbox[3].subject, 'DOCNET – Your Password Reset Code')
+
+    def test_bulk_mail_does_not_queue_in_front_of_otp_mail(self):
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async') as schedule:
+            for n in range(5):
+                EmailDispatcher.queue('Reminder', 'Body', [f'patient{n}@example.com'])
+            EmailManager.send_registration_otp('user@example.com', '123456')
+
+        self.assertEqual(
+            [(c.kwargs['args'], c.kwargs['queue']) for c in schedule.call_args_list],
+            [([EmailDispatcher.BULK], 'notifications'), ([EmailDispatcher.OTP], 'otp')],
+        )
+        self.assertEqual(EmailDispatcher.flush(EmailDispatcher.OTP), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['user@example.com']])
+        self.assertEqual(self.redis.llen(EmailDispatcher.outbox_key(EmailDispatcher.BULK)), 5)
+
+    def test_failed_messages_are_requeued_until_max_attempts(self):
+        rejected = smtplib.SMTPDataError(451, 'try again later')
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async'):
+            EmailDispatcher.queue('Hello', 'Body', ['user@example.com'])
+            with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=rejected):
+                self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 0)
+                self.assertEqual([m['attempts'] for m in self.queued()], [1])
+                with self.settings(EMAIL_MAX_ATTEMPTS=2):
+                    cache.delete(EmailDispatcher.flush_scheduled_key(EmailDispatcher.BULK))
+                    self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 0)
+        self.assertEqual(self.queued(), [])
+
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async'):
+            EmailDispatcher.queue('Hello', 'Body', ['user@example.com'])
+        self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 1)
+
+    def test_batch_interrupted_mid_flush_is_sent_by_the_next_flush(self):
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async'):
+            for n in range(3):
+                EmailDispatcher.queue('Hello', 'Body', [f'user{n}@example.com'])
+        with mock.patch('core.emails.EmailDispatcher.send', side_effect=RuntimeError('worker killed')):
+            with self.assertRaises(RuntimeError):
+                EmailDispatcher.flush(EmailDispatcher.BULK)
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(self.redis.llen(EmailDispatcher.processing_key(EmailDispatcher.BULK)), 3)
+
+        self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 3)
+        self.assertEqual([m.to for m in mail.outbox], [[f'user{n}@example.com'] for n in range(3)])
+        self.assertEqual(self.redis.llen(EmailDispatcher.processing_key(EmailDispatcher.BULK)), 0)
+
+    def test_dropped_connection_is_reopened_without_counting_an_attempt(self):
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async'):
+            for n in range(2):
+                EmailDispatcher.queue('Hello', 'Body', [f'user{n}@example.com'])
+        send = mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.send_messages',
+            side_effect=[smtplib.SMTPServerDisconnected('gone'), 1, 1],
+        )
+        with send as send_messages, mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as reopen:
+            self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 2)
+        self.assertEqual(send_messages.call_count, 3)
+        self.assertGreaterEqual(reopen.call_count, 1)
+        self.assertEqual(self.queued(), [])
+
+    def test_smtp_outage_keeps_the_batch_and_backs_off(self):
+        with mock.patch('accounts.tasks.flush_email_outbox.apply_async'):
+            for n in range(3):
+                EmailDispatcher.queue('Hello', 'Body', [f'user{n}@example.com'])
+        outage = ConnectionRefusedError('refused')
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages', side_effect=outage):
+            with mock.patch('accounts.tasks.flush_email_outbox.apply_async') as schedule:
+                for _ in range(6):
+                    cache.delete(EmailDispatcher.flush_scheduled_key(EmailDispatcher.BULK))
+                    self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 0)
+        self.assertEqual([c.kwargs['countdown'] for c in schedule.call_args_list], [4, 8, 16, 32, 60, 60])
+        self.assertEqual([m['attempts'] for m in self.queued()], [0, 0, 0])
+
+        self.assertEqual(EmailDispatcher.flush(EmailDispatcher.BULK), 3)
+        self.assertFalse(self.redis.exists(EmailDispatcher.failures_key(EmailDispatcher.BULK)))
+
+
+def gateway_response(status_code, payload=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(payload or {}).encode()
+    return response
+
+
+class CashfreeClientTests(TestCase):
+    def setUp(self):
+        try:
+            self.redis = get_redis_connection('default')
+            self.redis.delete(*[CashfreeClient._metrics_key(endpoint) for endpoint in CashfreeClient.ENDPOINTS])
+        except Exception as e:
+            self.skipTest(f'Redis is not available: {e}')
+        cashfree_payout._client = None
+        self.addCleanup(setattr, cashfree_payout, '_client', None)
+        sleep = mock.patch('utilities.cashfree_payout.time.sleep')
+        sleep.start()
+        self.addCleanup(sleep.stop)
+
+    def test_transfer_retries_with_the_same_request_id(self):
+        responses = [requests.Timeout('read timed out'), gateway_response(503), gateway_response(409)]
+        with mock.patch('requests.Session.request', side_effect=responses) as send:
+            result = cashfree_payout.standard_transfer_v2('wd_1', 100, 'dr_1')
+        self.assertEqual(result['status'], 'DUPLICATE')
+        self.assertEqual(send.call_count, 3)
+        request_ids = {call.kwargs['headers']['x-request-id'] for call in send.call_args_list}
+        self.assertEqual(request_ids, {CashfreeClient.idempotency_key('transfer', 'wd_1')})
+        self.assertEqual(send.call_args.kwargs['timeout'], (5, 60))
+
+        metrics = CashfreeClient.metrics()['transfer']
+        self.assertEqual((metrics['calls'], metrics['errors'], metrics['retries']), (3, 2, 2))
+
+    def test_unkeyed_post_is_not_retried(self):
+        with mock.patch('requests.Session.request', side_effect=requests.ConnectionError('reset')) as send:
+            with self.assertRaises(requests.ConnectionError):
+                cashfree_payout.get_cashfree_client().request('POST', '/transfers', 'transfer', json={})
+        self.assertEqual(send.call_count, 1)
+
+    def test_client_session_is_shared_between_calls(self):
+        with mock.patch('requests.Session.request', return_value=gateway_response(200, {'beneficiary_id': 'dr_1'})):
+            cashfree_payout.get_beneficiary_v2(beneficiary_id='dr_1')
+            session = cashfree_payout.get_cashfree_client().session
+            cashfree_payout.get_transfer_status_v2(transfer_id='wd_1')
+        self.assertIs(cashfree_payout.get_cashfree_client().session, session)
+        self.assertEqual(set(CashfreeClient.metrics()), {'get_beneficiary', 'transfer_status'})
+
+
+@mock.patch('core.payouts.get_beneficiary_v2', return_value={'beneficiary_id': 'dr_1'})
+class WithdrawalPayoutTests(TestCase):
+    def setUp(self):
+        admin = User.objects.create(username='admin', email='admin@example.com', role='admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+        doctor_user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        doctor = DoctorProfile.objects.create(
+            user=doctor_user, registration_id='REG1', bank_account='1234567890', ifsc_code='HDFC0000001'
+        )
+        self.wallet = Wallet.objects.create(doctor=doctor, balance=1000)
+        self.withdrawal = Withdrawal.objects.create(doctor=doctor, amount=400)
+
+    def approve(self, withdrawal=None):
+        withdrawal = withdrawal or self.withdrawal
+        with mock.patch('core.tasks.process_withdrawal_payout.delay') as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    reverse('withdrawal-action', args=[withdrawal.id]), {'action': 'approve'}, format='json'
+                )
+        return response, dispatch
+
+    def test_approval_queues_the_payout_without_calling_the_gateway(self, get_beneficiary):
+        with mock.patch('core.payouts.standard_transfer_v2') as transfer:
+            response, dispatch = self.approve()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual((response.data['payout_state'], response.data['transfer_id']), ('queued', f'wd_{self.withdrawal.id}_1'))
+        dispatch.assert_called_once_with(self.withdrawal.id)
+        transfer.assert_not_called()
+        get_beneficiary.assert_not_called()
+
+        self.assertEqual(self.approve()[0].status_code, 409)
+        rejected = self.client.post(reverse('withdrawal-action', args=[self.withdrawal.id]), {'action': 'reject'}, format='json')
+        self.assertEqual(rejected.status_code, 409)
+
+    def test_settled_payout_debits_the_wallet_once(self, get_beneficiary):
+        self.approve()
+        with mock.patch('core.payouts.standard_transfer_v2', return_value={'status': 'SUCCESS', 'cf_transfer_id': 'cf1'}) as transfer:
+            self.assertEqual(PayoutManager.process(self.withdrawal.id), Withdrawal.PAYOUT_SETTLED)
+            self.assertEqual(PayoutManager.process(self.withdrawal.id), Withdrawal.PAYOUT_SETTLED)
+        self.assertEqual(transfer.call_count, 1)
+
+        self.withdrawal.refresh_from_db()
+        self.wallet.refresh_from_db()
+        self.assertEqual((self.withdrawal.status, self.withdrawal.cashfree_reference_id), ('completed', 'cf1'))
+        self.assertEqual(self.wallet.balance, 600)
+        self.assertEqual(WalletHistory.objects.filter(wallet=self.wallet, type=WalletHistory.DEBIT).count(), 1)
+
+    def test_lost_transfer_response_is_reconciled_from_gateway_status(self, get_beneficiary):
+        self.approve()
+        with mock.patch('core.payouts.standard_transfer_v2', side_effect=requests.ConnectionError('reset')):
+            with self.assertRaises(requests.ConnectionError):
+                PayoutManager.process(self.withdrawal.id)
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.payout_state, Withdrawal.PAYOUT_SUBMITTED)
+
+        statuses = [{'status': 'PENDING'}, {'status': 'SUCCESS', 'cf_transfer_id': 'cf1'}]
+        with mock.patch('core.payouts.get_transfer_status_v2', side_effect=statuses) as lookup:
+            self.assertEqual(PayoutManager.reconcile(), {'submitted': 1})
+            self.assertEqual(PayoutManager.reconcile(), {'settled': 1})
+        lookup.assert_called_with(transfer_id=f'wd_{self.withdrawal.id}_1')
+
+        response = self.client.get(reverse('withdrawal-payout', args=[self.withdrawal.id]))
+        self.assertEqual((response.data['payout_state'], response.data['status']), ('settled', 'completed'))
+
+    def test_failed_payout_can_be_queued_again_with_a_new_transfer_id(self, get_beneficiary):
+        self.approve()
+        with mock.patch('core.payouts.standard_transfer_v2', side_effect=TransferRejected('Transfer failed: bad account')):
+            self.assertEqual(PayoutManager.process(self.withdrawal.id), Withdrawal.PAYOUT_FAILED)
+        self.withdrawal.refresh_from_db()
+        self.assertEqual((self.withdrawal.status, self.withdrawal.remarks), ('pending', 'Transfer failed: bad account'))
+
+        response, _ = self.approve()
+        self.assertEqual((response.status_code, response.data['transfer_id']), (202, f'wd_{self.withdrawal.id}_2'))
+
+    def test_unreadable_transfer_response_is_left_for_reconciliation(self, get_beneficiary):
+        self.approve()
+        with mock.patch('core.payouts.standard_transfer_v2', side_effect=requests.JSONDecodeError('Expecting value', '', 0)):
+            self.assertEqual(PayoutManager.process(self.withdrawal.id), Withdrawal.PAYOUT_SUBMITTED)
+        self.withdrawal.refresh_from_db()
+        self.assertEqual(self.withdrawal.payout_state, Withdrawal.PAYOUT_SUBMITTED)
+        self.assertEqual(self.approve()[0].status_code, 409)
+
+        with mock.patch('core.payouts.get_transfer_status_v2', return_value={'status': 'SUCCESS'}):
+            self.assertEqual(PayoutManager.reconcile(), {'settled': 1})
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 600)
+
+    def test_in_flight_payouts_count_against_the_balance(self, get_beneficiary):
+        second = Withdrawal.objects.create(doctor=self.withdrawal.doctor, amount=700)
+        self.assertEqual(self.approve()[0].status_code, 202)
+        response, dispatch = self.approve(second)
+        self.assertEqual((response.status_code, response.data['error']), (400, 'Insufficient wallet balance'))
+        dispatch.assert_not_called()
+
+    def test_settlement_never_drives_the_balance_negative(self, get_beneficiary):
+        self.approve()
+        Wallet.objects.filter(id=self.wallet.id).update(balance=100)
+        with mock.patch('core.payouts.standard_transfer_v2', return_value={'status': 'SUCCESS'}):
+            self.assertEqual(PayoutManager.process(self.withdrawal.id), Withdrawal.PAYOUT_SUBMITTED)
+        self.wallet.refresh_from_db()
+        self.withdrawal.refresh_from_db()
+        self.assertEqual((self.wallet.balance, self.withdrawal.status), (100, 'pending'))
+        self.assertEqual(self.withdrawal.payout_state, Withdrawal.PAYOUT_SUBMITTED)
+
+        Wallet.objects.filter(id=self.wallet.id).update(balance=500)
+        with mock.patch('core.payouts.get_transfer_status_v2', return_value={'status': 'SUCCESS'}):
+            self.assertEqual(PayoutManager.reconcile(), {'settled': 1})
+        self.wallet.refresh_from_db()
+        self.assertEqual(self.wallet.balance, 100)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BlockedUserMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        UserStatusCache._local.clear()
+        self.addCleanup(UserStatusCache._local.clear)
+        self.user = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def status_queries(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('SELECT "accounts_user"."is_active" ')]
+
+    def test_token_is_validated_once_and_status_is_served_from_cache(self):
+        with mock.patch.object(
+            JWTAuthentication, 'get_validated_token', autospec=True, side_effect=JWTAuthentication.get_validated_token
+        ) as validate:
+            with CaptureQueriesContext(connection) as first:
+                self.assertEqual(self.client.get(reverse('patient_profile')).status_code, 200)
+            self.assertEqual(validate.call_count, 1)
+            UserStatusCache._local.clear()
+            with CaptureQueriesContext(connection) as second:
+                self.assertEqual(self.client.get(reverse('patient_profile')).status_code, 200)
+        self.assertEqual(len(self.status_queries(first.captured_queries)), 1)
+        self.assertEqual(self.status_queries(second.captured_queries), [])
+
+    def test_block_takes_effect_only_after_commit(self):
+        self.client.get(reverse('patient_profile'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+            # Not committed yet: the cached status must not have been invalidated.
+            self.assertIs(UserStatusCache.is_active(self.user.id), True)
+        for callback in callbacks:
+            callback()
+
+        response = self.client.get(reverse('patient_profile'))
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'account_deactivated'))
@@ -1,6 +1,7 @@
 from django.urls import path
 from .views import AdminLoginView, AdminVerifyToken, DoctorListView, DoctorDetailView, DoctorApprovalView, DoctorBlockView, AdminPatientListView, PatientDetailView, PatientStatusToggleView,AdminAppointmentListView,AdminDashboardView
 from .views import AdminPaymentHistoryAPIView,DoctorEarningsReportAPIView,AdminPaymentCSVExportView,AdminPaymentPDFExportView,DoctorReportsView,MarkReportAsReadView,AdminWithdrawalActionView,AdminWithdrawalListAPIView
+from .views import ReportJobStatusView, ReportJobDownloadView, VideoRoomOccupancyView, PayoutGatewayMetricsView, AdminWithdrawalPayoutStatusView
 
 urlpatterns = [
     path('admin-login/', AdminLoginView.as_view(), name='admin_login'),
@@ -22,5 +23,10 @@ urlpatterns = [
     path('report/<int:report_id>/mark-read/', MarkReportAsReadView.as_view(), name='mark-report-read'),
     path('admin-withdrawals/', AdminWithdrawalListAPIView.as_view(), name='admin-withdrawal-list'),
     path('admin-withdrawal/<int:pk>/action/', AdminWithdrawalActionView.as_view(), name='withdrawal-action'),
+    path('admin-withdrawal/<int:pk>/payout/', AdminWithdrawalPayoutStatusView.as_view(), name='withdrawal-payout'),
+    path('reports/<uuid:job_id>/', ReportJobStatusView.as_view(), name='report-job'),
+    path('reports/<uuid:job_id>/download/', ReportJobDownloadView.as_view(), name='report-job-download'),
+    path('video-rooms/<str:room_name>/', VideoRoomOccupancyView.as_view(), name='video-room-occupancy'),
+    path('payout-gateway/metrics/', PayoutGatewayMetricsView.as_view(), name='payout-gateway-metrics'),
     
 ]
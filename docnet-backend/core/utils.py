@@ -2,6 +2,7 @@ import random
 import re
 import requests
 from django.core.mail import send_mail
+from django.core import signing
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
@@ -11,8 +12,17 @@ from django.contrib.auth.password_validation import validate_password
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import status
 from rest_framework.response import Response
-from accounts.models import OTPVerification
-from accounts.tasks import send_registration_otp_task, send_password_reset_otp_task
+from django.db import transaction
+from django.db.models import Avg, Case, Count, F, FloatField, IntegerField, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from accounts.models import DoctorReview, Appointment, Payment, EmergencyPayment, Message
+from doctor.models import DoctorProfile, DoctorStats, WalletHistory, WalletDailyRollup
+from .models import PaymentLedgerEntry
+from .cache import TaggedResponseCache, UserResponseCache
+from .emails import EmailDispatcher
+from .otp import OTPStore
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,54 +33,72 @@ class OTPManager:
     @staticmethod
     def generate_otp():
         return str(random.randint(100000,999999))
+
+    @staticmethod
+    def expiry_minutes(purpose):
+        if purpose == 'password_reset':
+            return settings.PASSWORD_RESET_OTP_EXPIRY_MINUTES
+        return settings.OTP_EXPIRY_MINUTES
     
     @staticmethod
-    def create_otp_verification(user, purpose='registration'):
+    def client_ip(request):
+        """The client address as seen by the outermost trusted proxy, or None if it can't be trusted."""
+        proxies = settings.TRUSTED_PROXY_COUNT
+        if proxies is None:
+            return None
+        if proxies == 0:
+            return request.META.get('REMOTE_ADDR')
+        hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+        if len(hops) < proxies:
+            return None
+        return hops[-proxies]
+
+    @staticmethod
+    def create_otp_verification(user, purpose='registration', client_ip=None):
+        """Issue a new OTP; raises OTPRateLimited when the email or client IP is sending too often."""
         otp = OTPManager.generate_otp()
-        OTPVerification.objects.update_or_create(
-            user = user,
-            defaults={
-                'otp': otp,
-                'created_at': timezone.now(),
-                'purpose': purpose
-            }
-        )
+        OTPStore.issue(user, purpose, otp, OTPManager.expiry_minutes(purpose) * 60, client_ip)
         return otp
     
     @staticmethod
-    def verify_otp(user, entered_otp, purpose='registration', expiry_minutes=5):
-        try:
-            otp_verification = OTPVerification.objects.get(
-                user = user,
-                purpose = purpose
-            )
+    def verify_otp(user, entered_otp, purpose='registration', consume=False):
+        result = OTPStore.verify(user.id, purpose, entered_otp, consume)
+        if result == 'ok':
+            return { 'success': True}
+        errors = {
+            'missing': 'OTP expired, please request a new one',
+            'locked': 'Too many incorrect attempts, please request a new OTP',
+            'invalid': 'Invalid OTP',
+        }
+        return { 'success': False, 'error': errors[result]}
 
-            if timezone.now() > otp_verification.created_at + timezone.timedelta(minutes=expiry_minutes):
-                return { 'success': False, 'error': 'OTP expired, please request a new one'}
-            
-            if str(otp_verification.otp) != str(entered_otp):
-                return { 'success': False, 'error': 'Invalid OTP'}
-            
-            return { 'success': True, 'otp_verification': otp_verification}
-        
-        except OTPVerification.DoesNotExist:
-            return { 'success': False, 'error': 'OTP record not found'}
+    @staticmethod
+    def discard(user, purpose):
+        OTPStore.discard(user.id, purpose)
         
 class EmailManager:
     @staticmethod
     def send_registration_otp(email, otp, user_type='user'):
         try:
-            task = send_registration_otp_task.delay(email,otp)
+            EmailDispatcher.queue_template(
+                'registration_otp', {'otp': otp, 'expiry_minutes': settings.OTP_EXPIRY_MINUTES}, [email],
+                outbox=EmailDispatcher.OTP,
+            )
             return True
         except Exception as e:
+            logger.error(f"Failed to queue registration OTP for {email}: {e}")
             return False
         
     @staticmethod
     def send_password_reset_otp(email, otp, user_type='user'):
         try:
-            task = send_password_reset_otp_task.delay(email, otp)
+            EmailDispatcher.queue_template(
+                'password_reset_otp', {'otp': otp, 'expiry_minutes': settings.PASSWORD_RESET_OTP_EXPIRY_MINUTES}, [email],
+                outbox=EmailDispatcher.OTP,
+            )
             return True
         except Exception as e:
+            logger.error(f"Failed to queue password reset OTP for {email}: {e}")
             return False
         
 class ValidationManager:
@@ -116,7 +144,7 @@ class PasswordManager:
         user.password = make_password(new_password)
         user.save()
 
-        OTPVerification.objects.filter(user=user, purpose='password_reset').delete()
+        OTPManager.discard(user, 'password_reset')
 
         return { 'success': True, 'message': 'Password reset successfully'}
     
@@ -193,4 +221,449 @@ class ResponseManager:
     
     @staticmethod
     def validation_error_response(errors):
-        return Response(errors, status=status.HTTP_400_BAD_REQUEST)         
\ No newline at end of file
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)         
+
+    @staticmethod
+    def rate_limited_response(error):
+        response = ResponseManager.error_response(
+            str(error), status.HTTP_429_TOO_MANY_REQUESTS, {'retry_after': error.retry_after}
+        )
+        response['Retry-After'] = str(error.retry_after)
+        return response
+
+
+class RatingManager:
+    """
+    Keeps DoctorProfile.rating_avg/rating_count in step with DoctorReview.
+    Updates are single UPDATE statements built from F() expressions, so
+    concurrent reviews for the same doctor cannot overwrite each other.
+    """
+    @staticmethod
+    def add_review(doctor_id, rating):
+        DoctorProfile.objects.filter(id=doctor_id).update(
+            rating_avg=(F('rating_avg') * F('rating_count') + rating) / (F('rating_count') + 1.0),
+            rating_count=F('rating_count') + 1,
+        )
+
+    @staticmethod
+    def remove_review(doctor_id, rating):
+        DoctorProfile.objects.filter(id=doctor_id).update(
+            rating_avg=Case(
+                When(rating_count__lte=1, then=Value(0.0)),
+                default=(F('rating_avg') * F('rating_count') - rating) / (F('rating_count') - 1.0),
+                output_field=FloatField(),
+            ),
+            rating_count=Case(
+                When(rating_count__lte=1, then=Value(0)),
+                default=F('rating_count') - 1,
+            ),
+        )
+
+    @staticmethod
+    def rebuild(queryset=None):
+        """Recompute the aggregates from DoctorReview; returns the number of profiles updated."""
+        if queryset is None:
+            queryset = DoctorProfile.objects.all()
+        reviews = DoctorReview.objects.filter(doctor=OuterRef('pk')).order_by().values('doctor')
+        return queryset.update(
+            rating_avg=Coalesce(
+                Subquery(reviews.annotate(avg=Avg('rating')).values('avg')[:1], output_field=FloatField()),
+                Value(0.0),
+            ),
+            rating_count=Coalesce(
+                Subquery(reviews.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()),
+                Value(0),
+            ),
+        )
+
+
+class DoctorStatsManager:
+    """
+    Maintains the DoctorStats summary row behind the doctor dashboard. The
+    booking, completion and emergency payment flows apply deltas inside their
+    own transactions; ``rebuild`` and ``check`` recompute from source tables.
+    """
+    COUNTER_FIELDS = ['total_appointments', 'completed_appointments', 'emergency_appointments', 'emergency_revenue']
+
+    @staticmethod
+    def _apply(doctor_id, **deltas):
+        updated = DoctorStats.objects.filter(doctor_id=doctor_id).update(
+            **{field: F(field) + delta for field, delta in deltas.items()}
+        )
+        if not updated:
+            # No row yet: build it from the source tables, which already
+            # include the change being recorded.
+            DoctorStatsManager.rebuild([doctor_id])
+
+    @staticmethod
+    def appointment_booked(doctor_id):
+        DoctorStatsManager._apply(doctor_id, total_appointments=1)
+
+    @staticmethod
+    def appointments_completed(doctor_counts):
+        for doctor_id, count in doctor_counts.items():
+            DoctorStatsManager._apply(doctor_id, completed_appointments=count)
+
+    @staticmethod
+    def emergency_payment_succeeded(doctor_id, amount):
+        DoctorStatsManager._apply(doctor_id, emergency_appointments=1, emergency_revenue=amount)
+
+    @staticmethod
+    def compute(doctor_ids=None):
+        """Return the expected counters per doctor id, aggregated from the source tables."""
+        doctors = DoctorProfile.objects.all()
+        appointments = Appointment.objects.filter(payment__slot__isnull=False)
+        emergency_payments = EmergencyPayment.objects.filter(payment_status='success')
+        if doctor_ids is not None:
+            doctors = doctors.filter(id__in=doctor_ids)
+            appointments = appointments.filter(payment__slot__doctor_id__in=doctor_ids)
+            emergency_payments = emergency_payments.filter(doctor_id__in=doctor_ids)
+
+        expected = {
+            doctor_id: {
+                'total_appointments': 0,
+                'completed_appointments': 0,
+                'emergency_appointments': 0,
+                'emergency_revenue': Decimal('0.00'),
+            }
+            for doctor_id in doctors.values_list('id', flat=True)
+        }
+        for row in appointments.values('payment__slot__doctor_id').annotate(
+            total=Count('id'), completed=Count('id', filter=Q(status='completed'))
+        ).order_by():
+            expected[row['payment__slot__doctor_id']].update(
+                total_appointments=row['total'], completed_appointments=row['completed']
+            )
+        for row in emergency_payments.values('doctor_id').annotate(
+            total=Count('id'), revenue=Sum('amount')
+        ).order_by():
+            expected[row['doctor_id']].update(
+                emergency_appointments=row['total'], emergency_revenue=row['revenue']
+            )
+        return expected
+
+    @staticmethod
+    def rebuild(doctor_ids=None):
+        expected = DoctorStatsManager.compute(doctor_ids)
+        DoctorStats.objects.bulk_create(
+            [DoctorStats(doctor_id=doctor_id, **values) for doctor_id, values in expected.items()],
+            update_conflicts=True,
+            unique_fields=['doctor'],
+            update_fields=DoctorStatsManager.COUNTER_FIELDS + ['updated_at'],
+        )
+        return len(expected)
+
+    @staticmethod
+    def check(doctor_ids=None):
+        """Return ``(doctor_id, field, stored, expected)`` for every counter that has drifted."""
+        expected = DoctorStatsManager.compute(doctor_ids)
+        stored = {
+            row['doctor_id']: row
+            for row in DoctorStats.objects.filter(doctor_id__in=expected).values('doctor_id', *DoctorStatsManager.COUNTER_FIELDS)
+        }
+        mismatches = []
+        for doctor_id, values in expected.items():
+            row = stored.get(doctor_id)
+            for field, value in values.items():
+                current = row[field] if row else None
+                if current != value:
+                    mismatches.append((doctor_id, field, current, value))
+        return mismatches
+
+    @staticmethod
+    def get(doctor):
+        stats = DoctorStats.objects.filter(doctor=doctor).first()
+        if stats is None:
+            DoctorStatsManager.rebuild([doctor.id])
+            stats = DoctorStats.objects.get(doctor=doctor)
+        return stats
+
+
+class AppointmentManager:
+    @staticmethod
+    def mark_completed(queryset):
+        """Complete the scheduled appointments in ``queryset`` and record them in DoctorStats."""
+        with transaction.atomic():
+            rows = list(
+                queryset.filter(status='scheduled').select_for_update(of=('self',))
+                .values_list('id', 'payment__slot__doctor_id', 'payment__patient_id', 'payment__slot__doctor__user_id')
+            )
+            if not rows:
+                return 0
+
+            Appointment.objects.filter(id__in=[row[0] for row in rows]).update(status='completed')
+
+            doctor_counts = {}
+            user_ids = set()
+            for _, doctor_id, patient_id, doctor_user_id in rows:
+                if doctor_id is not None:
+                    doctor_counts[doctor_id] = doctor_counts.get(doctor_id, 0) + 1
+                user_ids.update(filter(None, [patient_id, doctor_user_id]))
+            DoctorStatsManager.appointments_completed(doctor_counts)
+            # The bulk update skips post_save, so drop the cached responses here.
+            UserResponseCache.bump(*user_ids)
+        return len(rows)
+
+    @staticmethod
+    def complete_finished(now=None, batch_size=500, max_batches=20):
+        """
+        Complete scheduled appointments whose consultation_end_time has passed,
+        walking candidates in id order in batches of ``batch_size``. Returns
+        metrics for the run.
+        """
+        now = now or timezone.now()
+        local_now = timezone.localtime(now).replace(tzinfo=None)
+        candidates = Appointment.objects.filter(status='scheduled').filter(
+            Q(payment__slot__date__lte=local_now.date()) |
+            Q(payment__slot__isnull=True, created_at__lte=now - timedelta(minutes=30))
+        ).select_related('payment__slot').order_by('id')
+
+        metrics = {'batches': 0, 'scanned': 0, 'completed': 0}
+        last_id = 0
+        while metrics['batches'] < max_batches:
+            batch = list(candidates.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            metrics['batches'] += 1
+            metrics['scanned'] += len(batch)
+
+            due_ids = []
+            for appointment in batch:
+                end_time = appointment.consultation_end_time
+                # Slot-based end times are naive local times; the fallback is aware
+                reference = now if timezone.is_aware(end_time) else local_now
+                if end_time <= reference:
+                    due_ids.append(appointment.id)
+            if due_ids:
+                metrics['completed'] += AppointmentManager.mark_completed(Appointment.objects.filter(id__in=due_ids))
+        return metrics
+
+
+class WalletAnalyticsManager:
+    """
+    Revenue figures for DoctorAnalyticsView. Live WalletHistory is only read
+    for the current month (and any days not yet rolled up); older history is
+    summarised in WalletDailyRollup by the nightly rollup task.
+    """
+    @staticmethod
+    def _start_of(day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    @staticmethod
+    def month_start(day):
+        return day.replace(day=1)
+
+    @staticmethod
+    def rolled_up_until(wallet=None):
+        """
+        Last rolled-up day, for ``wallet`` or across all wallets. A wallet's own
+        watermark is read from the (wallet, date) unique index, so analytics
+        requests never scan the whole rollup table.
+        """
+        rollups = WalletDailyRollup.objects.all()
+        if wallet is not None:
+            rollups = rollups.filter(wallet=wallet)
+        return rollups.aggregate(last=Max('date'))['last']
+
+    @staticmethod
+    def period_totals(wallet, today):
+        """Credit totals for today, this week, this month and this year in one query."""
+        start_of = WalletAnalyticsManager._start_of
+        month_start = WalletAnalyticsManager.month_start(today)
+        week_start = today - timedelta(days=today.weekday())
+        year_start = today.replace(month=1, day=1)
+
+        # Days after the wallet's own watermark had no history for it when the
+        # rollup ran, so reading them live is exact.
+        rolled_up_until = WalletAnalyticsManager.rolled_up_until(wallet)
+        live_from = max(year_start, rolled_up_until + timedelta(days=1)) if rolled_up_until else year_start
+        live_from = min(live_from, month_start)
+        scan_from = min(live_from, week_start)
+
+        totals = WalletHistory.objects.filter(
+            wallet=wallet, type='credit', updated_date__gte=start_of(scan_from)
+        ).aggregate(
+            month=Sum('amount', filter=Q(updated_date__gte=start_of(month_start))),
+            week=Sum('amount', filter=Q(updated_date__gte=start_of(week_start))),
+            today=Sum('amount', filter=Q(updated_date__gte=start_of(today))),
+            year_live=Sum('amount', filter=Q(updated_date__gte=start_of(live_from))),
+        )
+        rolled_up = None
+        if live_from > year_start:
+            rolled_up = WalletDailyRollup.objects.filter(
+                wallet=wallet, date__gte=year_start, date__lt=live_from
+            ).aggregate(total=Sum('credit_total'))['total']
+
+        zero = Decimal('0.00')
+        return {
+            'month': totals['month'] or zero,
+            'week': totals['week'] or zero,
+            'today': totals['today'] or zero,
+            'year': (totals['year_live'] or zero) + (rolled_up or zero),
+        }
+
+    @staticmethod
+    def rollup(before, batch_days=31):
+        """
+        Summarise WalletHistory per wallet and local day for every day before
+        ``before`` that has not been rolled up yet. Idempotent; returns the
+        number of rollup rows written.
+        """
+        rolled_up_until = WalletAnalyticsManager.rolled_up_until()
+        if rolled_up_until:
+            start = rolled_up_until + timedelta(days=1)
+        else:
+            first = WalletHistory.objects.order_by('updated_date').values_list('updated_date', flat=True).first()
+            if first is None:
+                return 0
+            start = timezone.localdate(first)
+
+        written = 0
+        while start < before:
+            end = min(start + timedelta(days=batch_days), before)
+            rows = WalletHistory.objects.filter(
+                updated_date__gte=WalletAnalyticsManager._start_of(start),
+                updated_date__lt=WalletAnalyticsManager._start_of(end),
+            ).annotate(day=TruncDate('updated_date')).values('wallet_id', 'day').annotate(
+                credit_total=Coalesce(Sum('amount', filter=Q(type='credit')), Value(Decimal('0.00'))),
+                debit_total=Coalesce(Sum('amount', filter=Q(type='debit')), Value(Decimal('0.00'))),
+                transaction_count=Count('id'),
+            ).order_by()
+
+            WalletDailyRollup.objects.bulk_create(
+                [WalletDailyRollup(
+                    wallet_id=row['wallet_id'], date=row['day'], credit_total=row['credit_total'],
+                    debit_total=row['debit_total'], transaction_count=row['transaction_count'],
+                ) for row in rows],
+                update_conflicts=True,
+                unique_fields=['wallet', 'date'],
+                update_fields=['credit_total', 'debit_total', 'transaction_count'],
+                batch_size=1000,
+            )
+            written += len(rows)
+            start = end
+        return written
+
+
+class PaymentLedgerManager:
+    """Keeps PaymentLedgerEntry in step with Payment and EmergencyPayment."""
+    LEDGER_FIELDS = [
+        'payment_id', 'amount', 'payment_status', 'payment_method', 'timestamp', 'patient',
+        'patient_username', 'patient_avatar', 'doctor_user', 'doctor_username',
+    ]
+
+    @staticmethod
+    def build_entry(payment):
+        if isinstance(payment, EmergencyPayment):
+            source = PaymentLedgerEntry.EMERGENCY
+            doctor_user = payment.doctor.user
+        else:
+            source = PaymentLedgerEntry.CONSULTATION
+            doctor_user = payment.slot.doctor.user if payment.slot_id else None
+
+        return PaymentLedgerEntry(
+            source=source,
+            source_id=payment.id,
+            payment_id=payment.payment_id,
+            amount=payment.amount,
+            payment_status=payment.payment_status,
+            payment_method=payment.payment_method,
+            timestamp=payment.timestamp,
+            patient=payment.patient,
+            patient_username=payment.patient.username,
+            patient_avatar=payment.patient.profile_image,
+            doctor_user=doctor_user,
+            doctor_username=doctor_user.username if doctor_user else None,
+        )
+
+    @staticmethod
+    def changed():
+        transaction.on_commit(lambda: TaggedResponseCache.invalidate(PaymentLedgerEntry.VERSION_TAG))
+
+    @staticmethod
+    def upsert(entries):
+        PaymentLedgerEntry.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['source', 'source_id'],
+            update_fields=PaymentLedgerManager.LEDGER_FIELDS,
+        )
+        PaymentLedgerManager.changed()
+
+    @staticmethod
+    def sync(payment):
+        PaymentLedgerManager.upsert([PaymentLedgerManager.build_entry(payment)])
+
+    @staticmethod
+    def remove(payment):
+        source = PaymentLedgerEntry.EMERGENCY if isinstance(payment, EmergencyPayment) else PaymentLedgerEntry.CONSULTATION
+        PaymentLedgerEntry.objects.filter(source=source, source_id=payment.id).delete()
+        PaymentLedgerManager.changed()
+
+    @staticmethod
+    def sync_user(user):
+        PaymentLedgerEntry.objects.filter(patient=user).update(
+            patient_username=user.username, patient_avatar=user.profile_image
+        )
+        PaymentLedgerEntry.objects.filter(doctor_user=user).update(doctor_username=user.username)
+        PaymentLedgerManager.changed()
+
+    @staticmethod
+    def rebuild(chunk_size=2000):
+        """Upsert ledger rows for every payment; returns the number of rows written."""
+        sources = [
+            Payment.objects.select_related('patient', 'slot__doctor__user'),
+            EmergencyPayment.objects.select_related('patient', 'doctor__user'),
+        ]
+        written = 0
+        for queryset in sources:
+            batch = []
+            for payment in queryset.iterator(chunk_size=chunk_size):
+                batch.append(PaymentLedgerManager.build_entry(payment))
+                if len(batch) == chunk_size:
+                    PaymentLedgerManager.upsert(batch)
+                    written += len(batch)
+                    batch = []
+            if batch:
+                PaymentLedgerManager.upsert(batch)
+                written += len(batch)
+        return written
+
+
+class ChatAttachmentManager:
+    """
+    Stores chat attachments uploaded over HTTP and hands out signed references
+    that the chat socket exchanges for the stored file, so file bytes never
+    travel through WebSocket frames.
+    """
+    SALT = 'chat-attachment'
+
+    @staticmethod
+    def validate(upload):
+        if upload.size > settings.CHAT_ATTACHMENT_MAX_SIZE:
+            return f"File exceeds the {settings.CHAT_ATTACHMENT_MAX_SIZE // (1024 * 1024)}MB limit"
+        content_type = upload.content_type or ''
+        if not any(content_type.startswith(prefix) for prefix in settings.CHAT_ATTACHMENT_CONTENT_TYPES):
+            return "Unsupported file type"
+        return None
+
+    @staticmethod
+    def store(room, user, upload):
+        field = Message._meta.get_field('file')
+        ext = upload.name.rsplit('.', 1)[-1].lower() if '.' in upload.name else 'bin'
+        name = field.generate_filename(None, f"{user.username}_{timezone.now().timestamp()}.{ext}")
+        name = field.storage.save(name, upload, max_length=field.max_length)
+        ref = signing.dumps({'room': room.id, 'user': user.id, 'name': name}, salt=ChatAttachmentManager.SALT)
+        return name, ref
+
+    @staticmethod
+    def resolve(ref, room_id, user_id):
+        """Return the stored file name for ``ref`` if it was issued to this user and room."""
+        try:
+            data = signing.loads(ref, salt=ChatAttachmentManager.SALT, max_age=settings.CHAT_ATTACHMENT_REF_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        if str(data.get('room')) != str(room_id) or data.get('user') != user_id:
+            return None
+        return data.get('name')
@@ -0,0 +1,178 @@
+import logging
+import time
+from django.conf import settings
+from django.core import signing
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+# KEYS: members zset, users hash. ARGV: channel, user id, now, expires at, key ttl.
+# Returns the channels that were already in the room, oldest first.
+JOIN_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+end
+local peers = redis.call('ZRANGE', KEYS[1], 0, -1)
+redis.call('ZADD', KEYS[1], ARGV[4], ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[5])
+return peers
+"""
+
+# KEYS: members zset, users hash. ARGV: channel. Returns the remaining member count.
+LEAVE_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HDEL', KEYS[2], ARGV[1])
+local remaining = redis.call('ZCARD', KEYS[1])
+if remaining == 0 then
+    redis.call('DEL', KEYS[1], KEYS[2])
+end
+return remaining
+"""
+
+# KEYS: members zset, users hash. ARGV: channel, expires at, key ttl.
+# Returns 1 if the member was still registered, 0 if it had already expired.
+HEARTBEAT_SCRIPT = """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+return 1
+"""
+
+# KEYS: members zset, users hash. ARGV: now. Returns [channel, user id, ...] for live members.
+OCCUPANCY_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+if #expired > 0 then
+    redis.call('ZREM', KEYS[1], unpack(expired))
+    redis.call('HDEL', KEYS[2], unpack(expired))
+end
+local result = {}
+for _, channel in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    table.insert(result, channel)
+    table.insert(result, redis.call('HGET', KEYS[2], channel) or '')
+end
+return result
+"""
+
+
+class VideoRoomRegistry:
+    """
+    Video call room membership shared by every ASGI worker. Each room is a
+    Redis sorted set of channel names scored by their heartbeat deadline, plus
+    a hash of channel name to user id. Members that stop heartbeating (crashed
+    workers, dropped sockets) age out instead of holding the room forever.
+    """
+    _scripts = {}
+
+    @staticmethod
+    def _keys(room_name):
+        return [f'video_room:{room_name}:members', f'video_room:{room_name}:users']
+
+    @staticmethod
+    def _stats_key(room_name):
+        return f'video_room:{room_name}:stats'
+
+    @classmethod
+    def _run(cls, name, source, room_name, *args):
+        client = get_redis_connection('default')
+        script = cls._scripts.get(name)
+        if script is None:
+            script = cls._scripts[name] = client.register_script(source)
+        return script(keys=cls._keys(room_name), args=args, client=client)
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    @classmethod
+    def join(cls, room_name, channel_name, user_id):
+        """Register the channel and return the channels already in the room, oldest first."""
+        now = time.time()
+        peers = cls._run(
+            'join', JOIN_SCRIPT, room_name, channel_name, user_id, now,
+            now + settings.VIDEO_ROOM_MEMBER_TTL, settings.VIDEO_ROOM_KEY_TTL
+        )
+        return [cls._decode(peer) for peer in peers]
+
+    @classmethod
+    def leave(cls, room_name, channel_name):
+        return cls._run('leave', LEAVE_SCRIPT, room_name, channel_name)
+
+    @classmethod
+    def heartbeat(cls, room_name, channel_name):
+        """Extend the member's deadline; returns False if it had already been evicted."""
+        return bool(cls._run(
+            'heartbeat', HEARTBEAT_SCRIPT, room_name, channel_name,
+            time.time() + settings.VIDEO_ROOM_MEMBER_TTL, settings.VIDEO_ROOM_KEY_TTL
+        ))
+
+    @classmethod
+    def members(cls, room_name):
+        """Return ``[(channel_name, user_id), ...]`` for live members, oldest first."""
+        flat = [cls._decode(value) for value in cls._run('occupancy', OCCUPANCY_SCRIPT, room_name, time.time())]
+        return [
+            (channel, int(user_id) if user_id.isdigit() else None)
+            for channel, user_id in zip(flat[::2], flat[1::2])
+        ]
+
+    @classmethod
+    def record_relay(cls, room_name, messages, channel_sends):
+        """Add to the room's counters of signaling messages relayed and channel layer sends."""
+        key = cls._stats_key(room_name)
+        pipe = get_redis_connection('default').pipeline()
+        pipe.hincrby(key, 'messages', messages)
+        pipe.hincrby(key, 'channel_sends', channel_sends)
+        pipe.expire(key, settings.VIDEO_ROOM_KEY_TTL)
+        pipe.execute()
+
+    @classmethod
+    def stats(cls, room_name):
+        raw = get_redis_connection('default').hgetall(cls._stats_key(room_name))
+        return {cls._decode(field): int(value) for field, value in raw.items()}
+
+    @classmethod
+    def occupancy(cls, room_name):
+        members = cls.members(room_name)
+        return {
+            'room': room_name,
+            'count': len(members),
+            'participants': sorted({user_id for _, user_id in members if user_id is not None}),
+            'relay': cls.stats(room_name),
+        }
+
+
+class VideoRoomTicket:
+    """
+    Short-lived signed proof that a user may join a video room, issued by the
+    validate endpoints after their database checks so the consumer can admit
+    (re)connections without repeating them.
+    """
+    SALT = 'video-room-ticket'
+
+    @classmethod
+    def issue(cls, room_name, user_id, expires_at=None):
+        """Return ``(ticket, expires_in)``; ``expires_at`` can shorten the default lifetime."""
+        now = time.time()
+        expires = now + settings.VIDEO_ROOM_TICKET_MAX_AGE
+        if expires_at is not None and now < expires_at < expires:
+            expires = expires_at
+        ticket = signing.dumps({'room': room_name, 'user': user_id, 'exp': int(expires)}, salt=cls.SALT, compress=True)
+        return ticket, int(expires - now)
+
+    @classmethod
+    def verify(cls, ticket, room_name):
+        """Return the user id the ticket was issued to, or None if it is invalid for this room."""
+        try:
+            data = signing.loads(ticket, salt=cls.SALT, max_age=settings.VIDEO_ROOM_TICKET_MAX_AGE)
+        except signing.BadSignature:
+            return None
+        if data.get('room') != room_name or data.get('exp', 0) < time.time():
+            return None
+        return data.get('user')
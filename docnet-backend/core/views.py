@@ -6,9 +6,6 @@ from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth import authenticate
 from django.conf import settings
 from django.utils import timezone
-from itertools import chain
-from django.core.paginator import Paginator
-from itertools import chain
 from collections import OrderedDict
 from rest_framework.pagination import PageNumberPagination
 from django.db.models.functions import TruncMonth
@@ -18,10 +15,17 @@ from django.shortcuts import get_object_or_404
 from .serializers import DoctorProfileListSerializer, DoctorProfileDetailSerializer, AdminAppointmentListSerializer
 from accounts.models import User, PatientProfile,Appointment,Payment,DoctorReport
 from rest_framework_simplejwt.tokens import OutstandingToken, BlacklistedToken
-from .serializers import PatientListSerializer, PatientDetailSerializer,DoctorEarningsSerializer,DoctorReports,UnifiedPaymentSerializer,EmergencyAppointmentSerializer,WithdrawalSerializer
+from .serializers import PatientListSerializer, PatientDetailSerializer,DoctorEarningsSerializer,DoctorReports,PaymentLedgerSerializer,EmergencyAppointmentSerializer,WithdrawalSerializer,WithdrawalPayoutSerializer,ReportJobSerializer
 from rest_framework_simplejwt.exceptions import TokenError
-from django.db.models import Count, Sum, Q, F
+from django.db.models import Count, Sum, Q, F, Value, IntegerField
 from django.db import transaction
+from .pagination import KeysetCursor, KeysetPagination
+from .models import PaymentLedgerEntry, ReportJob
+from .video import VideoRoomRegistry
+from .payouts import PayoutManager
+from .exports import PAYMENT_HEADER, REPORTS, ReportJobManager, parse_date_range, payment_rows, stream_csv
+from django.core.files.storage import default_storage
+from django.http import FileResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
@@ -29,13 +33,10 @@ from accounts.models import User, Appointment, Payment, EmergencyPayment
 from doctor.models import DoctorProfile,Withdrawal,Wallet,WalletHistory
 from decimal import Decimal
 from datetime import timedelta
-from reportlab.pdfgen import canvas
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAdminUser
-from django.http import HttpResponse
-import csv
 from rest_framework.generics import ListAPIView
-from utilities.cashfree_payout import get_beneficiary_v2, create_beneficiary_v2, standard_transfer_v2
+from utilities.cashfree_payout import CashfreeClient
 import uuid,logging,requests
 
 
@@ -274,15 +275,12 @@ class StandardResultsSetPagination(PageNumberPagination):
 
 class AdminAppointmentListView(APIView):
     permission_classes = [IsAdminUser]
-    def get(self, request):
-        now = timezone.now()
-        threshold = now - timedelta(minutes=30)
-
-        Appointment.objects.filter(
-            status='scheduled',
-            created_at__lte=threshold
-        ).update(status='completed')
+    NORMAL = 0
+    EMERGENCY = 1
+    PAGE_SIZE = 10
+    MAX_PAGE_SIZE = 100
 
+    def get(self, request):
         search_term = request.query_params.get('search', '').strip()
         status_filter = request.query_params.get('status', '').strip().lower()
         date_filter = request.query_params.get('date_filter', '').strip().lower()
@@ -323,28 +321,72 @@ class AdminAppointmentListView(APIView):
                 normal_qs = normal_qs.filter(payment__slot__date__range=[today, next_week])
                 emergency_qs = emergency_qs.filter(timestamp__date__range=[today, next_week])
 
-        normal_data = AdminAppointmentListSerializer(normal_qs, many=True).data
-        emergency_data = EmergencyAppointmentSerializer(emergency_qs, many=True).data
-
-        for e in emergency_data:
-            e["is_emergency"] = True
-        for n in normal_data:
-            n["is_emergency"] = False
-
-        combined_data = sorted(
-            chain(normal_data, emergency_data),
-            key=lambda x: x.get("created_at", ""), reverse=True
+        page_size = max(1, min(self._int_param(request, "page_size", self.PAGE_SIZE), self.MAX_PAGE_SIZE))
+        count = normal_qs.count() + emergency_qs.count()
+        cursor = request.query_params.get("cursor")
+        if cursor:
+            position = KeysetCursor.decode(cursor, tiebreakers=2)
+            if position is None:
+                return Response({"error": "Invalid cursor"}, status=status.HTTP_400_BAD_REQUEST)
+            normal_qs = normal_qs.filter(self._after(position, 'created_at', self.NORMAL))
+            emergency_qs = emergency_qs.filter(self._after(position, 'timestamp', self.EMERGENCY))
+            offset = 0
+        else:
+            offset = (max(self._int_param(request, "page", 1), 1) - 1) * page_size
+
+        # Both sources are merged, sorted and limited in SQL; only the page's
+        # rows are loaded and serialized.
+        normal_keys = normal_qs.annotate(
+            sort_ts=F('created_at'), kind=Value(self.NORMAL, output_field=IntegerField())
+        ).order_by().values_list('sort_ts', 'kind', 'id')
+        emergency_keys = emergency_qs.annotate(
+            sort_ts=F('timestamp'), kind=Value(self.EMERGENCY, output_field=IntegerField())
+        ).order_by().values_list('sort_ts', 'kind', 'id')
+        keys = list(
+            normal_keys.union(emergency_keys, all=True)
+            .order_by('-sort_ts', '-kind', '-id')[offset:offset + page_size + 1]
         )
+        has_more = len(keys) > page_size
+        keys = keys[:page_size]
+
+        appointments = Appointment.objects.select_related(
+            'payment', 'payment__slot', 'payment__slot__doctor__user', 'payment__patient__patientprofile'
+        ).in_bulk([key[2] for key in keys if key[1] == self.NORMAL])
+        emergencies = EmergencyPayment.objects.select_related(
+            'doctor__user', 'patient'
+        ).in_bulk([key[2] for key in keys if key[1] == self.EMERGENCY])
 
-        page_size = int(request.query_params.get("page_size", 10))
-        page_number = int(request.query_params.get("page", 1))
-        paginator = Paginator(combined_data, page_size)
-        page = paginator.page(page_number)
+        results = []
+        for _, kind, obj_id in keys:
+            if kind == self.EMERGENCY:
+                data = EmergencyAppointmentSerializer(emergencies[obj_id]).data
+            else:
+                data = AdminAppointmentListSerializer(appointments[obj_id]).data
+            data["is_emergency"] = kind == self.EMERGENCY
+            results.append(data)
 
         return Response({
-            "count": paginator.count,
-            "results": list(page),
+            "count": count,
+            "results": results,
+            "next_cursor": KeysetCursor.encode(*keys[-1]) if has_more else None,
         })
+
+    @staticmethod
+    def _int_param(request, name, default):
+        try:
+            return int(request.query_params.get(name, default))
+        except ValueError:
+            return default
+
+    @staticmethod
+    def _after(position, timestamp_field, kind):
+        # Rows sort by (timestamp, kind, id) descending, emergencies first on ties
+        timestamp, cursor_kind, cursor_id = position
+        if kind < cursor_kind:
+            return KeysetCursor.before(timestamp_field, timestamp) | Q(**{timestamp_field: timestamp})
+        if kind == cursor_kind:
+            return KeysetCursor.before(timestamp_field, timestamp, id_value=cursor_id)
+        return KeysetCursor.before(timestamp_field, timestamp)
     
 class AdminDashboardView(APIView):
     permission_classes = [IsAuthenticated]
@@ -443,35 +485,19 @@ class AdminPaymentHistoryAPIView(APIView):
         status = request.query_params.get('status')
         search = request.query_params.get('search')
 
-        normal_qs = Payment.objects.select_related('patient', 'slot__doctor__user').all()
+        queryset = PaymentLedgerEntry.objects.all()
         if status:
-            normal_qs = normal_qs.filter(payment_status=status.lower())
+            queryset = queryset.filter(payment_status=status.lower())
         if search:
-            normal_qs = normal_qs.filter(
-                Q(patient__username__icontains=search) |
-                Q(payment_id__icontains=search) |
-                Q(slot__doctor__user__username__icontains=search)
-            )
-
-        emergency_qs = EmergencyPayment.objects.select_related('patient', 'doctor__user').all()
-        if status:
-            emergency_qs = emergency_qs.filter(payment_status=status.lower())
-        if search:
-            emergency_qs = emergency_qs.filter(
-                Q(patient__username__icontains=search) |
+            queryset = queryset.filter(
+                Q(patient_username__icontains=search) |
                 Q(payment_id__icontains=search) |
-                Q(doctor__user__username__icontains=search)
+                Q(doctor_username__icontains=search)
             )
 
-        combined = sorted(
-            chain(normal_qs, emergency_qs),
-            key=lambda x: x.timestamp,
-            reverse=True
-        )
-
-        paginator = StandardResultsSetPagination()
-        page = paginator.paginate_queryset(combined, request)
-        serializer = UnifiedPaymentSerializer(page, many=True)
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = PaymentLedgerSerializer(page, many=True)
 
         return paginator.get_paginated_response(serializer.data)
     
@@ -491,54 +517,58 @@ class AdminPaymentCSVExportView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        payments = Payment.objects.all().order_by('-created_at')
-
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="payment_history.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Payment ID', 'Patient', 'Doctor', 'Amount', 'Method', 'Date', 'Time', 'Status'])
+        try:
+            parse_date_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        for payment in payments:
-            writer.writerow([
-                payment.payment_id,
-                payment.patient.username,
-                payment.doctor.user.username,
-                payment.amount,
-                payment.payment_method,
-                payment.created_at.strftime('%Y-%m-%d'),
-                payment.created_at.strftime('%H:%M'),
-                payment.payment_status
-            ])
+        return stream_csv('payment_history.csv', PAYMENT_HEADER, payment_rows(request.query_params))
 
-        return response
 
 class AdminPaymentPDFExportView(APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
-        payments = Payment.objects.all().order_by('-created_at')[:50] 
+        try:
+            parse_date_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="payment_history.pdf"'
+        params = {
+            key: request.query_params[key]
+            for key in ('start_date', 'end_date', 'status') if request.query_params.get(key)
+        }
+        job = ReportJobManager.request(request.user, ReportJob.ADMIN_PAYMENTS, params)
+        return Response(
+            ReportJobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_200_OK if job.status == ReportJob.READY else status.HTTP_202_ACCEPTED
+        )
 
-        p = canvas.Canvas(response)
-        p.setFont("Helvetica-Bold", 14)
-        p.drawString(100, 800, "Admin Payment History")
 
-        y = 770
-        p.setFont("Helvetica", 10)
+class ReportJobStatusView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, id=job_id, owner=request.user)
+        return Response(ReportJobSerializer(job, context={'request': request}).data)
 
-        for payment in payments:
-            p.drawString(50, y, f"{payment.payment_id} | {payment.patient.username} | {payment.doctor.user.username} | Rs.{payment.amount} | {payment.payment_status}")
-            y -= 20
-            if y < 50:
-                p.showPage()
-                y = 800
 
-        p.showPage()
-        p.save()
-        return response
+class ReportJobDownloadView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        job = get_object_or_404(ReportJob, id=job_id, owner=request.user)
+        if job.status != ReportJob.READY:
+            return Response({"error": "Report is not ready yet"}, status=status.HTTP_409_CONFLICT)
+        if not default_storage.exists(job.file_path):
+            return Response({"error": "Report has expired, please request it again"}, status=status.HTTP_410_GONE)
+
+        return FileResponse(
+            default_storage.open(job.file_path, 'rb'),
+            as_attachment=True,
+            filename=REPORTS[job.kind]['filename'],
+            content_type='application/pdf'
+        )
 
 class DoctorReportsView(APIView):
     permission_classes = [IsAdminUser]
@@ -571,8 +601,6 @@ class AdminWithdrawalListAPIView(ListAPIView):
     pagination_class = AdminWithdrawalListPagination
 
     def get_queryset(self):
-        Withdrawal.objects.filter(status='pending', payout_status='RECEIVED').update(status='completed')
-
         queryset = Withdrawal.objects.select_related('doctor__user').order_by('-requested_at')
         status = self.request.query_params.get('status')
         search = self.request.query_params.get('search')
@@ -605,115 +633,70 @@ class AdminWithdrawalActionView(APIView):
         if withdrawal.status != 'pending':
             return Response({'error': 'Already processed'}, status=400)
 
+        if withdrawal.payout_state in PayoutManager.IN_FLIGHT_STATES:
+            return Response({'error': 'Payout already in progress'}, status=409)
+
         if action_type == 'reject':
-            withdrawal.status = 'rejected'
-            withdrawal.processed_at = timezone.now()
-            withdrawal.remarks = remarks or 'Rejected by admin'
-            withdrawal.save()
+            rejected = Withdrawal.objects.filter(
+                id=withdrawal.id, status='pending', payout_state__in=PayoutManager.QUEUEABLE_STATES
+            ).update(status='rejected', processed_at=timezone.now(), remarks=remarks or 'Rejected by admin')
+            if not rejected:
+                return Response({'error': 'Payout already in progress'}, status=409)
             return Response({'message': 'Withdrawal rejected successfully'})
 
         elif action_type == 'approve':
-            try:
-                wallet = withdrawal.doctor.wallet
-            except AttributeError:
-                return Response({'error': 'Doctor wallet not found'}, status=400)
-
-            if wallet.balance < withdrawal.amount:
-                return Response({'error': 'Insufficient wallet balance'}, status=400)
-
             if not withdrawal.doctor.bank_account or not withdrawal.doctor.ifsc_code:
                 return Response({'error': 'Doctor banking details not complete'}, status=400)
 
-            beneficiary_id = withdrawal.doctor.beneficiary_id or f"dr_{withdrawal.doctor.id}"
-            transfer_id = f"wd_{withdrawal.id}_{uuid.uuid4().hex[:6]}"
+            with transaction.atomic():
+                # The wallet lock serialises approvals for a doctor. Payouts still in
+                # flight have not been debited yet, so they count against the balance.
+                wallet = Wallet.objects.select_for_update().filter(doctor=withdrawal.doctor).first()
+                if wallet is None:
+                    return Response({'error': 'Doctor wallet not found'}, status=400)
 
-            try:
-                with transaction.atomic():
-                    beneficiary_exists = False
-                    try:
-                        if get_beneficiary_v2(beneficiary_id=beneficiary_id):
-                            beneficiary_exists = True
-                    except Exception:
-                        pass
-
-                    if not beneficiary_exists:
-                        doctor_name = withdrawal.doctor.user.get_full_name() or withdrawal.doctor.user.username
-                        beneficiary_data = {
-                            "beneficiary_id": beneficiary_id,
-                            "beneficiary_name": doctor_name,
-                            "bank_account_number": withdrawal.doctor.bank_account,
-                            "bank_ifsc": withdrawal.doctor.ifsc_code,
-                            "beneficiary_email": withdrawal.doctor.user.email or "",
-                            "beneficiary_phone": getattr(withdrawal.doctor, 'phone_number', "") or ""
-                        }
-                        try:
-                            create_beneficiary_v2(beneficiary_data)
-                            withdrawal.doctor.beneficiary_id = beneficiary_id
-                            withdrawal.doctor.save()
-                        except Exception as e:
-                            logger.error(f"Create beneficiary failed: {e}")
-                            return Response({'error': str(e)}, status=500)
-
-                    payout_response = standard_transfer_v2(
-                        transfer_id=transfer_id,
-                        amount=withdrawal.amount,
-                        beneficiary_id=beneficiary_id,
-                        remarks=remarks or f"Withdrawal for {withdrawal.doctor.user.username}"
-                    )
-
-                    if not isinstance(payout_response, dict):
-                        return Response({'error': 'Invalid response from Cashfree'}, status=500)
-
-                    payout_status = payout_response.get('status', 'UNKNOWN')
-                    payout_data = payout_response.get('data', {})
-
-                    cashfree_reference = (
-                        payout_response.get('cf_transfer_id') or
-                        payout_response.get('cfTransferId') or
-                        payout_response.get('referenceId') or
-                        payout_data.get('cf_transfer_id') or
-                        payout_data.get('referenceId') or
-                        payout_data.get('utr')
-                    )
-
-                    if payout_status in ['SUCCESS', 'RECEIVED', 'ACCEPTED']:
-                        final_status = 'completed'
-                    elif payout_status in ['PENDING', 'PROCESSING']:
-                        final_status = 'pending'
-                    else:
-                        return Response({
-                            'error': f"Payout failed or unknown status: {payout_status}",
-                            'payout_response': payout_response
-                        }, status=500)
-
-                    withdrawal.status = final_status
-                    withdrawal.processed_at = timezone.now()
-                    withdrawal.remarks = remarks or f'Processed via Cashfree ({payout_status})'
-                    withdrawal.payout_reference_id = transfer_id
-                    withdrawal.payout_status = payout_status
-                    if hasattr(withdrawal, 'cashfree_reference_id') and cashfree_reference:
-                        withdrawal.cashfree_reference_id = cashfree_reference
-                    withdrawal.save()
-
-                    if final_status == 'completed':
-                        wallet.balance -= withdrawal.amount
-                        wallet.save()
-                        WalletHistory.objects.create(
-                            wallet=wallet,
-                            type=WalletHistory.DEBIT,
-                            amount=withdrawal.amount,
-                            new_balance=wallet.balance
-                        )
-
-                    return Response({
-                        'message': f'Withdrawal {final_status} via Cashfree',
-                        'cashfree_status': payout_status,
-                        'transfer_id': transfer_id,
-                        'reference': cashfree_reference
-                    })
-
-            except Exception as e:
-                logger.exception(f"Withdrawal processing failed: {e}")
-                return Response({'error': str(e)}, status=500)
+                in_flight = PayoutManager.in_flight_amount(withdrawal.doctor_id, exclude_id=withdrawal.id)
+                if wallet.balance - in_flight < withdrawal.amount:
+                    return Response({'error': 'Insufficient wallet balance'}, status=400)
+
+                queued = PayoutManager.queue(withdrawal, remarks)
+            if not queued:
+                return Response({'error': 'Payout already in progress'}, status=409)
+
+            withdrawal.refresh_from_db()
+            return Response({
+                'message': 'Withdrawal payout queued',
+                **WithdrawalPayoutSerializer(withdrawal, context={'request': request}).data,
+            }, status=status.HTTP_202_ACCEPTED)
 
         return Response({'error': 'Invalid action type'}, status=400)
+
+
+class AdminWithdrawalPayoutStatusView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, pk):
+        withdrawal = get_object_or_404(Withdrawal, id=pk)
+        return Response(WithdrawalPayoutSerializer(withdrawal, context={'request': request}).data)
+
+
+class VideoRoomOccupancyView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, room_name):
+        try:
+            return Response(VideoRoomRegistry.occupancy(room_name))
+        except Exception as e:
+            logger.error(f"Failed to read occupancy for video room {room_name}: {e}")
+            return Response({"error": "Room registry unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class PayoutGatewayMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return Response(CashfreeClient.metrics())
+        except Exception as e:
+            logger.error(f"Failed to read payout gateway metrics: {e}")
+            return Response({"error": "Metrics store unavailable"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
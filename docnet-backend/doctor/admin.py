@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DoctorProfile,DoctorSlot, Wallet, WalletHistory,ContactMessage,Withdrawal
+from .models import DoctorProfile,DoctorSlot, Wallet, WalletHistory,ContactMessage,Withdrawal,DoctorStats
 
 @admin.register(DoctorProfile)
 class DoctorProfileAdmin(admin.ModelAdmin):
@@ -59,6 +59,13 @@ class WalletHistoryAdmin(admin.ModelAdmin):
         return obj.wallet.doctor.user.username
     wallet_doctor_username.short_description = 'Doctor Username'
 
+
+@admin.register(DoctorStats)
+class DoctorStatsAdmin(admin.ModelAdmin):
+    list_display = ('doctor', 'total_appointments', 'completed_appointments', 'emergency_appointments', 'emergency_revenue', 'updated_at')
+    search_fields = ('doctor__user__username',)
+    readonly_fields = ('total_appointments', 'completed_appointments', 'emergency_appointments', 'emergency_revenue', 'updated_at')
+
 @admin.register(Withdrawal)
 class WithdrawalAdmin(admin.ModelAdmin):
     list_display = (
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.utils import DoctorStatsManager
+
+
+class Command(BaseCommand):
+    help = 'Compare DoctorStats dashboard counters against the source tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', dest='doctor_ids',
+                            help='Only check the given doctor profile id (repeatable)')
+        parser.add_argument('--fix', action='store_true', help='Rebuild the doctors whose counters drifted')
+
+    def handle(self, *args, **options):
+        mismatches = DoctorStatsManager.check(options['doctor_ids'])
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Doctor stats are consistent'))
+            return
+
+        for doctor_id, field, stored, expected in mismatches:
+            self.stdout.write(f'Doctor {doctor_id}: {field} is {stored}, expected {expected}')
+
+        drifted = sorted({doctor_id for doctor_id, *_ in mismatches})
+        if options['fix']:
+            DoctorStatsManager.rebuild(drifted)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {len(drifted)} doctor profiles'))
+        else:
+            raise CommandError(f'{len(drifted)} doctor profiles have inconsistent stats')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from doctor.models import DoctorProfile
+from core.utils import RatingManager
+
+
+class Command(BaseCommand):
+    help = 'Recompute DoctorProfile.rating_avg and rating_count from DoctorReview'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', dest='doctor_ids',
+                            help='Only rebuild the given doctor profile id (repeatable)')
+
+    def handle(self, *args, **options):
+        queryset = DoctorProfile.objects.all()
+        if options['doctor_ids']:
+            queryset = queryset.filter(id__in=options['doctor_ids'])
+
+        updated = RatingManager.rebuild(queryset)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt ratings for {updated} doctor profiles'))
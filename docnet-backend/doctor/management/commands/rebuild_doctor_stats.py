@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from core.utils import DoctorStatsManager
+
+
+class Command(BaseCommand):
+    help = 'Recompute DoctorStats dashboard counters from appointments and emergency payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctor', type=int, action='append', dest='doctor_ids',
+                            help='Only rebuild the given doctor profile id (repeatable)')
+
+    def handle(self, *args, **options):
+        rebuilt = DoctorStatsManager.rebuild(options['doctor_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {rebuilt} doctor profiles'))
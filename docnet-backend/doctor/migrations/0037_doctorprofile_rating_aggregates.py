@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Avg, Count, FloatField, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_ratings(apps, schema_editor):
+    DoctorProfile = apps.get_model('doctor', 'DoctorProfile')
+    DoctorReview = apps.get_model('accounts', 'DoctorReview')
+    reviews = DoctorReview.objects.filter(doctor=OuterRef('pk')).order_by().values('doctor')
+    DoctorProfile.objects.update(
+        rating_avg=Coalesce(
+            Subquery(reviews.annotate(avg=Avg('rating')).values('avg')[:1], output_field=FloatField()),
+            Value(0.0),
+        ),
+        rating_count=Coalesce(
+            Subquery(reviews.annotate(total=Count('id')).values('total')[:1], output_field=IntegerField()),
+            Value(0),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0036_withdrawal_cashfree_reference_id'),
+        ('accounts', '0038_remove_patientprofile_accounts_pa_blood_g_af6665_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='rating_avg',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=models.Index(fields=['-rating_avg', '-rating_count'], name='doctor_rating_idx'),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:44
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0037_doctorprofile_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorprofile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='doctorprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='doctor_search_idx'),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE doctor_doctorprofile AS d SET search_vector =
+                    setweight(to_tsvector('simple', coalesce(u.first_name, '') || ' ' || coalesce(u.last_name, '')), 'A') ||
+                    setweight(to_tsvector('simple', coalesce(d.specialization, '')), 'B') ||
+                    setweight(to_tsvector('simple', coalesce(d.hospital, '')), 'C')
+                FROM accounts_user AS u
+                WHERE u.id = d.user_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0038_doctorprofile_search_vector'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorStats',
+            fields=[
+                ('doctor', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='doctor.doctorprofile')),
+                ('total_appointments', models.PositiveIntegerField(default=0)),
+                ('completed_appointments', models.PositiveIntegerField(default=0)),
+                ('emergency_appointments', models.PositiveIntegerField(default=0)),
+                ('emergency_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Doctor Stats',
+                'verbose_name_plural': 'Doctor Stats',
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 15:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0039_doctorstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='wallethistory',
+            index=models.Index(fields=['wallet', 'updated_date'], name='wallet_history_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='walletdailyrollup',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='doctor.wallet'),
+        ),
+        migrations.AddConstraint(
+            model_name='walletdailyrollup',
+            constraint=models.UniqueConstraint(fields=('wallet', 'date'), name='unique_wallet_daily_rollup'),
+        ),
+    ]
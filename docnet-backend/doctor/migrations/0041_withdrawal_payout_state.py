@@ -0,0 +1,28 @@
+# Generated by Django 5.2.1 on 2026-10-18 16:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctor', '0040_wallet_history_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='withdrawal',
+            name='payout_attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='withdrawal',
+            name='payout_state',
+            field=models.CharField(blank=True, choices=[('queued', 'Queued'), ('submitted', 'Submitted'), ('settled', 'Settled'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='withdrawal',
+            name='payout_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
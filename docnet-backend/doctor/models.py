@@ -1,4 +1,6 @@
 from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from datetime import timezone
 from accounts.models import Payment
 from django.contrib.auth import get_user_model
@@ -38,6 +40,9 @@ class DoctorProfile(models.Model):
     ifsc_code = models.CharField(max_length=20, blank=True, null=True)
     beneficiary_id = models.CharField(max_length=100, blank=True, null=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
+    rating_avg = models.FloatField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    search_vector = SearchVectorField(null=True, editable=False)
     class Meta:
         verbose_name = "Doctor Profile"
         verbose_name_plural = "Doctor Profiles"
@@ -46,7 +51,8 @@ class DoctorProfile(models.Model):
             models.Index(fields=['is_approved']),
             models.Index(fields=['gender']),
             models.Index(fields=['experience']),
-            
+            models.Index(fields=['-rating_avg', '-rating_count'], name='doctor_rating_idx'),
+            GinIndex(fields=['search_vector'], name='doctor_search_idx'),
         ]
     def save(self, *args, **kwargs):
         if not self.slug:
@@ -111,8 +117,45 @@ class WalletHistory(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     new_balance = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'updated_date'], name='wallet_history_date_idx'),
+        ]
+
     def __str__(self):
         return f'{self.wallet.doctor.user.username} - {self.type} - {self.amount}'
+
+
+class WalletDailyRollup(models.Model):
+    wallet = models.ForeignKey(Wallet, related_name='daily_rollups', on_delete=models.CASCADE)
+    date = models.DateField()
+    credit_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    debit_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    transaction_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'date'], name='unique_wallet_daily_rollup'),
+        ]
+
+    def __str__(self):
+        return f'{self.wallet.doctor.user.username} - {self.date}'
+
+
+class DoctorStats(models.Model):
+    doctor = models.OneToOneField(DoctorProfile, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    total_appointments = models.PositiveIntegerField(default=0)
+    completed_appointments = models.PositiveIntegerField(default=0)
+    emergency_appointments = models.PositiveIntegerField(default=0)
+    emergency_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Doctor Stats"
+        verbose_name_plural = "Doctor Stats"
+
+    def __str__(self):
+        return f'{self.doctor.user.username} - Stats'
     
 class Withdrawal(models.Model):
     STATUS_CHOICES = [
@@ -120,6 +163,16 @@ class Withdrawal(models.Model):
         ('completed', 'Completed'),
         ('rejected', 'Rejected')
     ]
+    PAYOUT_QUEUED = 'queued'
+    PAYOUT_SUBMITTED = 'submitted'
+    PAYOUT_SETTLED = 'settled'
+    PAYOUT_FAILED = 'failed'
+    PAYOUT_STATE_CHOICES = [
+        (PAYOUT_QUEUED, 'Queued'),
+        (PAYOUT_SUBMITTED, 'Submitted'),
+        (PAYOUT_SETTLED, 'Settled'),
+        (PAYOUT_FAILED, 'Failed'),
+    ]
 
     doctor = models.ForeignKey(DoctorProfile, on_delete=models.CASCADE, related_name='withdrawals')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -130,6 +183,9 @@ class Withdrawal(models.Model):
     payout_reference_id = models.CharField(max_length=100, blank=True, null=True)
     payout_status = models.CharField(max_length=50, blank=True, null=True)
     cashfree_reference_id = models.CharField(max_length=100, blank=True, null=True)
+    payout_state = models.CharField(max_length=10, choices=PAYOUT_STATE_CHOICES, blank=True, default='')
+    payout_attempts = models.PositiveSmallIntegerField(default=0)
+    payout_updated_at = models.DateTimeField(null=True, blank=True)
 
     class Meta:
         ordering = ['-requested_at']
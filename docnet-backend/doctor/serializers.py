@@ -10,7 +10,6 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.core.validators import MinValueValidator, MaxValueValidator, RegexValidator
-from django.db.models import Avg
 from django.conf import settings
 
 User = get_user_model()
@@ -177,8 +176,7 @@ class DoctorProfileSerializer(serializers.ModelSerializer):
     average_rating = serializers.SerializerMethodField()
 
     def get_average_rating(self, obj):
-        rating = obj.reviews.aggregate(avg=Avg('rating'))['avg']
-        return round(rating, 1) if rating else 0.0
+        return round(obj.rating_avg, 1)
 
     class Meta:
         model = DoctorProfile
@@ -0,0 +1,15 @@
+from celery import shared_task
+from django.utils.timezone import localdate
+from core.utils import WalletAnalyticsManager
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(queue='reports')
+def rollup_wallet_history():
+    """Roll up wallet history for every closed day before the current month."""
+    before = WalletAnalyticsManager.month_start(localdate())
+    written = WalletAnalyticsManager.rollup(before)
+    logger.info(f"Wrote {written} wallet daily rollup rows up to {before}")
+    return written
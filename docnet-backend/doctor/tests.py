@@ -1,3 +1,187 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.db.models import Max
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.timezone import localdate
+from rest_framework.test import APIClient
+from accounts.models import User, Payment, Appointment, EmergencyPayment
+from core.cache import UserResponseCache
+from core.utils import AppointmentManager, DoctorStatsManager, WalletAnalyticsManager
+from doctor.models import DoctorProfile, DoctorSlot, DoctorStats, Wallet, WalletDailyRollup, WalletHistory
 
-# Create your tests here.
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def read_stream(response):
+    """Collect a streaming response whose body is an async iterator, as the ASGI handler would."""
+    async def read():
+        return b''.join([chunk async for chunk in response.streaming_content])
+    return async_to_sync(read)()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class UserScopedResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctors = []
+        for n in range(2):
+            user = User.objects.create(username=f'doctor{n}', email=f'doctor{n}@example.com', role='doctor')
+            DoctorProfile.objects.create(user=user, registration_id=f'REG{n}', hospital=f'Hospital {n}')
+            self.doctors.append(user)
+
+    def get_profile(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse('doctor-profile'))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cached_profile_is_scoped_to_the_requesting_user(self):
+        self.assertEqual(self.get_profile(self.doctors[0])['hospital'], 'Hospital 0')
+        self.assertEqual(self.get_profile(self.doctors[1])['hospital'], 'Hospital 1')
+
+    def test_cached_data_is_rendered_for_each_request(self):
+        client = APIClient()
+        client.force_authenticate(self.doctors[0])
+        html = client.get(reverse('doctor-profile'), HTTP_ACCEPT='text/html')
+        self.assertTrue(html['Content-Type'].startswith('text/html'))
+        self.assertEqual(self.get_profile(self.doctors[0])['hospital'], 'Hospital 0')
+
+    def test_profile_change_invalidates_cached_response(self):
+        self.get_profile(self.doctors[0])
+        with self.assertNumQueries(0):
+            self.get_profile(self.doctors[0])
+
+        profile = self.doctors[0].doctor_profile
+        profile.hospital = 'New Hospital'
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+
+        self.assertEqual(self.get_profile(self.doctors[0])['hospital'], 'New Hospital')
+
+
+class DoctorStatsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=self.user, registration_id='REG1')
+        self.patient = User.objects.create(username='patient', email='patient@example.com', role='patient')
+        self.slot = DoctorSlot.objects.create(
+            doctor=self.doctor, date=localdate(), start_time=time(10, 0),
+            duration=30, consultation_type='video', max_patients=1
+        )
+
+    def book(self):
+        payment = Payment.objects.create(slot=self.slot, patient=self.patient, amount=500)
+        appointment = Appointment.objects.create(payment=payment, status='scheduled')
+        DoctorStatsManager.appointment_booked(self.doctor.id)
+        return appointment
+
+    def test_flows_keep_stats_consistent(self):
+        self.book()
+        self.book()
+        AppointmentManager.mark_completed(Appointment.objects.filter(id=Appointment.objects.first().id))
+        EmergencyPayment.objects.create(
+            doctor=self.doctor, patient=self.patient, amount=800, payment_status='success'
+        )
+        DoctorStatsManager.emergency_payment_succeeded(self.doctor.id, Decimal('800'))
+
+        stats = DoctorStats.objects.get(doctor=self.doctor)
+        self.assertEqual(stats.total_appointments, 2)
+        self.assertEqual(stats.completed_appointments, 1)
+        self.assertEqual(stats.emergency_appointments, 1)
+        self.assertEqual(stats.emergency_revenue, Decimal('800'))
+        self.assertEqual(DoctorStatsManager.check(), [])
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_completing_appointments_bumps_cached_responses(self):
+        cache.clear()
+        appointment = self.book()
+        versions = [UserResponseCache.get_version(user.id) for user in (self.user, self.patient)]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            AppointmentManager.mark_completed(Appointment.objects.filter(id=appointment.id))
+
+        for user, version in zip((self.user, self.patient), versions):
+            self.assertNotEqual(UserResponseCache.get_version(user.id), version)
+
+    def test_check_reports_and_fixes_drift(self):
+        self.book()
+        DoctorStats.objects.filter(doctor=self.doctor).update(total_appointments=7)
+
+        with self.assertRaises(CommandError):
+            call_command('check_doctor_stats', stdout=StringIO())
+        call_command('check_doctor_stats', '--fix', stdout=StringIO())
+        self.assertEqual(DoctorStats.objects.get(doctor=self.doctor).total_appointments, 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class DoctorAnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='doctor', email='doctor@example.com', role='doctor')
+        self.doctor = DoctorProfile.objects.create(user=self.user, registration_id='REG1')
+        self.wallet = Wallet.objects.create(doctor=self.doctor, balance=0)
+        self.today = localdate()
+
+    def credit(self, amount, day):
+        entry = WalletHistory.objects.create(wallet=self.wallet, type='credit', amount=amount, new_balance=0)
+        stamp = timezone.make_aware(datetime.combine(day, time(12, 0)))
+        WalletHistory.objects.filter(id=entry.id).update(updated_date=stamp)
+
+    def test_period_totals_combine_live_history_and_rollups(self):
+        year_start = self.today.replace(month=1, day=1)
+        month_start = self.today.replace(day=1)
+        self.credit(Decimal('100'), self.today)
+        if month_start > year_start:
+            self.credit(Decimal('40'), year_start)
+        self.credit(Decimal('999'), year_start - timedelta(days=1))
+
+        expected_year = Decimal('140') if month_start > year_start else Decimal('100')
+        self.assertEqual(WalletAnalyticsManager.period_totals(self.wallet, self.today)['year'], expected_year)
+
+        WalletAnalyticsManager.rollup(month_start)
+        self.assertEqual(WalletAnalyticsManager.rollup(month_start), 0)
+        other = Wallet.objects.create(
+            doctor=DoctorProfile.objects.create(
+                user=User.objects.create(username='other', email='other@example.com', role='doctor'), registration_id='REG2'
+            ),
+            balance=0,
+        )
+        WalletDailyRollup.objects.create(wallet=other, date=month_start - timedelta(days=1), credit_total=5)
+        self.assertEqual(
+            WalletAnalyticsManager.rolled_up_until(self.wallet),
+            WalletDailyRollup.objects.filter(wallet=self.wallet).aggregate(last=Max('date'))['last'],
+        )
+        totals = WalletAnalyticsManager.period_totals(self.wallet, self.today)
+        self.assertEqual(totals['today'], Decimal('100'))
+        self.assertEqual(totals['month'], Decimal('100'))
+        self.assertEqual(totals['year'], expected_year)
+
+    def test_analytics_view_reports_period_revenue(self):
+        self.credit(Decimal('250'), self.today)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(4):
+            data = client.get(reverse('doctor-analytics')).json()
+        self.assertEqual(Decimal(str(data['results']['today_revenue'])), Decimal('250'))
+        self.assertEqual(len(data['results']['transactions']), 1)
+
+    def test_csv_export_streams_history_within_date_range(self):
+        self.credit(Decimal('250'), self.today)
+        self.credit(Decimal('75'), self.today - timedelta(days=40))
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.get(reverse('doctor-csv'), {'start_date': (self.today - timedelta(days=7)).isoformat()})
+        lines = read_stream(response).decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Type,Amount,New Balance')
+        self.assertEqual(len(lines), 2)
+        self.assertIn('250', lines[1])
@@ -1,7 +1,5 @@
 from rest_framework import status, generics, permissions
 from rest_framework.response import Response
-from django.http import HttpResponse
-import csv
 from decimal import Decimal
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
@@ -13,7 +11,11 @@ from django.conf import settings
 import random, re,requests
 from datetime import datetime
 from django.utils.decorators import method_decorator
-from django.views.decorators.cache import cache_page
+from core.cache import user_cache_page
+from core.exports import WALLET_HEADER, ReportJobManager, parse_date_range, stream_csv, wallet_rows
+from core.models import ReportJob
+from core.otp import OTPRateLimited
+from core.serializers import ReportJobSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -24,7 +26,6 @@ from rest_framework.permissions import IsAuthenticated
 from accounts.models import EmergencyPayment, Appointment, Payment,Notification
 from django.utils.timezone import now, localdate, timedelta
 from decimal import Decimal
-from reportlab.pdfgen import canvas
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -35,7 +36,7 @@ from rest_framework.decorators import api_view, permission_classes
 from accounts.models import Appointment,MedicalRecord
 from .models import DoctorProfile, DoctorSlot, Wallet,WalletHistory,Withdrawal
 from .serializers import DoctorRegistrationSerializer, DoctorProfileSerializer, DoctorLoginSerializer, DoctorProfileUpdateSerializer, DoctorSlotSerializer, BookedPatientSerializer, EmergencyStatusSerializer, WalletSerializer, AppointmentDetailsSerializer,EmergencyConsultationDetailSerializer,EmergencyConsultationListSerializer,MedicalRecordSerializer,NotificationSerializer,NotificationMarkAsReadSerializer,WithdrawalSerializer
-from core.utils import OTPManager, EmailManager, ValidationManager, PasswordManager, GoogleAuthManager, UserManager, ResponseManager
+from core.utils import OTPManager, EmailManager, ValidationManager, PasswordManager, GoogleAuthManager, UserManager, ResponseManager, DoctorStatsManager, WalletAnalyticsManager
 
 doctor_logger = logging.getLogger('doctor')
 auth_logger = logging.getLogger('authentication')
@@ -47,22 +48,25 @@ class DoctorRegistrationView(APIView):
         serializer = DoctorRegistrationSerializer(data=request.data)
         
         if serializer.is_valid():
-            with transaction.atomic():
-                user = serializer.save()
-                otp = OTPManager.create_otp_verification(user)
-
-                email_queued = EmailManager.send_registration_otp(user.email, otp, 'doctor')
-                if not email_queued:
-                    doctor_logger.error(f"Failed to queue OTP email for {user.email}")
-
-                return ResponseManager.success_response(
-                    data={
-                        'user_id': user.id,
-                        'email': user.email,
-                    },
-                    message='Registration successful. Please verify your email with the OTP sent.',
-                    status_code=status.HTTP_201_CREATED
-                )
+            try:
+                with transaction.atomic():
+                    user = serializer.save()
+                    otp = OTPManager.create_otp_verification(user, client_ip=OTPManager.client_ip(request))
+
+                    email_queued = EmailManager.send_registration_otp(user.email, otp, 'doctor')
+                    if not email_queued:
+                        doctor_logger.error(f"Failed to queue OTP email for {user.email}")
+
+                    return ResponseManager.success_response(
+                        data={
+                            'user_id': user.id,
+                            'email': user.email,
+                        },
+                        message='Registration successful. Please verify your email with the OTP sent.',
+                        status_code=status.HTTP_201_CREATED
+                    )
+            except OTPRateLimited as e:
+                return ResponseManager.rate_limited_response(e)
         
         return ResponseManager.validation_error_response(serializer.errors)
 
@@ -84,14 +88,12 @@ class VerifyOTPView(APIView):
         try:
             user = User.objects.get(id=user_id)
             
-            result = OTPManager.verify_otp(user, entered_otp, 'registration', expiry_minutes=settings.OTP_EXPIRY_MINUTES)
+            result = OTPManager.verify_otp(user, entered_otp, 'registration', consume=True)
             
             if result['success']:
                 user.is_verified = True
                 user.save()
                 
-                result['otp_verification'].delete()
-                
                 return ResponseManager.success_response(
                     data={'success': True},
                     message='OTP verified successfully'
@@ -118,7 +120,7 @@ class ResendOTPView(APIView):
         try:
             user = User.objects.get(id=user_id)
             
-            otp = OTPManager.create_otp_verification(user)
+            otp = OTPManager.create_otp_verification(user, client_ip=OTPManager.client_ip(request))
             
             email_queued = EmailManager.send_registration_otp(user.email, otp, 'doctor')
             if not email_queued:
@@ -128,6 +130,8 @@ class ResendOTPView(APIView):
                 message='OTP resent successfully'
             )
             
+        except OTPRateLimited as e:
+            return ResponseManager.rate_limited_response(e)
         except User.DoesNotExist:
             return ResponseManager.error_response(
                 'User not found',
@@ -139,7 +143,7 @@ class ResendOTPView(APIView):
                 status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-@method_decorator(cache_page(60 * 15), name='get')
+@method_decorator(user_cache_page(60 * 15), name='get')
 class DoctorProfileRetrieveUpdateView(APIView): 
     permission_classes = [IsAuthenticated]
     
@@ -246,9 +250,9 @@ class DoctorSendPasswordResetOTPView(APIView):
                     'No doctor account found with this email address'
                 )
             
-            otp = OTPManager.create_otp_verification(user, 'password_reset')
+            otp = OTPManager.create_otp_verification(user, 'password_reset', OTPManager.client_ip(request))
             
-            email_queued = EmailManager.send_registration_otp(user.email, otp, 'doctor')
+            email_queued = EmailManager.send_password_reset_otp(user.email, otp, 'doctor')
             if not email_queued:
                 doctor_logger.error(f"Failed to queue OTP email for {user.email}")
             
@@ -257,6 +261,8 @@ class DoctorSendPasswordResetOTPView(APIView):
                 message='OTP sent successfully'
             )
             
+        except OTPRateLimited as e:
+            return ResponseManager.rate_limited_response(e)
         except Exception as e:
             return ResponseManager.error_response(
                 f'An error occurred: {str(e)}',
@@ -800,7 +806,7 @@ def end_emergency_consultation(request, consultation_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     
-@method_decorator(cache_page(60 * 15), name='get')
+@method_decorator(user_cache_page(60 * 15), name='get')
 class DoctorDashboardView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -817,14 +823,12 @@ class DoctorDashboardView(APIView):
         except:
             total_revenue = Decimal('0.00')
 
+        stats = DoctorStatsManager.get(doctor)
         appointments = Appointment.objects.filter(payment__slot__doctor=doctor)
-        total_appointments = appointments.count()
-        completed_appointments = appointments.filter(status='completed').count()
         today_appointments = appointments.filter(payment__slot__date=localdate()).count()
-        emergency_payments = EmergencyPayment.objects.filter(doctor=doctor, payment_status='success')
-        total_emergency_revenue = emergency_payments.aggregate(total=models.Sum('amount'))['total'] or Decimal('0.00')
-        emergency_appointments = emergency_payments.count()
-        recent_appointments = appointments.filter(status='completed').order_by('-created_at')[:3]
+        recent_appointments = appointments.filter(status='completed').select_related(
+            'payment__patient', 'payment__slot'
+        ).order_by('-created_at')[:3]
         recent_list = []
         for appt in recent_appointments:
             recent_list.append({
@@ -837,11 +841,11 @@ class DoctorDashboardView(APIView):
 
         return Response({
             "total_revenue": total_revenue, 
-            "emergency_revenue": total_emergency_revenue,
-            "total_appointments": total_appointments,
+            "emergency_revenue": stats.emergency_revenue,
+            "total_appointments": stats.total_appointments,
             "today_appointments": today_appointments,
-            "completed_appointments": completed_appointments,
-            "emergency_appointments": emergency_appointments,
+            "completed_appointments": stats.completed_appointments,
+            "emergency_appointments": stats.emergency_appointments,
             "recent_appointments": recent_list
         })
 
@@ -876,18 +880,18 @@ class DoctorAnalyticsView(APIView):
 
         transactions = wallet.history.all().order_by('-updated_date')
         today = localdate()
-        current_month = today.month
-        current_year = today.year
         week_start = today - timedelta(days=today.weekday())
 
-        if filter_type == 'daily':
-            transactions = transactions.filter(updated_date__date=today)
-        elif filter_type == 'weekly':
-            transactions = transactions.filter(updated_date__date__gte=week_start)
-        elif filter_type == 'monthly':
-            transactions = transactions.filter(updated_date__month=current_month, updated_date__year=current_year)
-        elif filter_type == 'yearly':
-            transactions = transactions.filter(updated_date__year=current_year)
+        # Range filters on local midnights keep the (wallet, updated_date) index usable
+        period_starts = {
+            'daily': today,
+            'weekly': week_start,
+            'monthly': today.replace(day=1),
+            'yearly': today.replace(month=1, day=1),
+        }
+        if filter_type in period_starts:
+            period_start = timezone.make_aware(datetime.combine(period_starts[filter_type], datetime.min.time()))
+            transactions = transactions.filter(updated_date__gte=period_start)
 
         paginator = self.AnalyticsPagination()
         page = paginator.paginate_queryset(transactions, request)
@@ -899,9 +903,10 @@ class DoctorAnalyticsView(APIView):
             "new_balance": txn.new_balance
         } for txn in page]
 
-        month_revenue = wallet.history.filter(updated_date__month=current_month, updated_date__year=current_year, type='credit').aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        week_revenue = wallet.history.filter(updated_date__date__gte=week_start, type='credit').aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-        today_revenue = wallet.history.filter(updated_date__date=today, type='credit').aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
+        revenue = WalletAnalyticsManager.period_totals(wallet, today)
+        month_revenue = revenue['month']
+        week_revenue = revenue['week']
+        today_revenue = revenue['today']
         expected_weekly_revenue = (month_revenue / today.day) * 7 if today.day else Decimal('0.00')
         expected_monthly_revenue = (month_revenue / today.day) * 30 if today.day else Decimal('0.00')
 
@@ -911,6 +916,7 @@ class DoctorAnalyticsView(APIView):
             "monthly_revenue": month_revenue,
             "weekly_revenue": week_revenue,
             "today_revenue": today_revenue,
+            "yearly_revenue": revenue['year'],
             "expected_weekly_revenue": expected_weekly_revenue,
             "expected_monthly_revenue": expected_monthly_revenue
         })
@@ -929,20 +935,15 @@ class DoctorCSVExportView(APIView):
 
         try:
             wallet = doctor.wallet
-            transactions = wallet.history.all().order_by('-updated_date')
         except:
             return Response({"detail": "Wallet not found."}, status=404)
 
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="wallet_transactions.csv"'
-
-        writer = csv.writer(response)
-        writer.writerow(['Date', 'Type', 'Amount', 'New Balance'])
-
-        for txn in transactions:
-            writer.writerow([txn.updated_date.strftime('%Y-%m-%d %H:%M'), txn.type, txn.amount, txn.new_balance])
+        try:
+            parse_date_range(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
 
-        return response
+        return stream_csv('wallet_transactions.csv', WALLET_HEADER, wallet_rows(wallet, request.query_params))
 
 class DoctorPDFExportView(APIView):
     permission_classes = [IsAuthenticated]
@@ -957,24 +958,24 @@ class DoctorPDFExportView(APIView):
 
         try:
             wallet = doctor.wallet
-            transactions = wallet.history.all().order_by('-updated_date')[:10]
         except:
             return Response({"detail": "Wallet not found."}, status=404)
 
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="wallet_report.pdf"'
-
-        p = canvas.Canvas(response)
-        p.drawString(100, 800, f"Wallet Report for Dr. {doctor.user.username}")
-
-        y = 750
-        for txn in transactions:
-            p.drawString(100, y, f"{txn.updated_date.strftime('%Y-%m-%d %H:%M')} - {txn.type} - {txn.amount} - New Balance: {txn.new_balance}")
-            y -= 20
-
-        p.showPage()
-        p.save()
-        return response
+        try:
+            parse_date_range(request.query_params)
+        except ValueError as e:
+            return Response({"detail": str(e)}, status=400)
+
+        params = {'wallet_id': wallet.id}
+        params.update({
+            key: request.query_params[key]
+            for key in ('start_date', 'end_date') if request.query_params.get(key)
+        })
+        job = ReportJobManager.request(user, ReportJob.DOCTOR_WALLET, params)
+        return Response(
+            ReportJobSerializer(job, context={'request': request}).data,
+            status=200 if job.status == ReportJob.READY else 202
+        )
     
 
 class MedicalRecordAPIView(APIView):
@@ -1,6 +1,10 @@
 import requests
+from requests.adapters import HTTPAdapter
 from django.conf import settings
+from django_redis import get_redis_connection
 import logging
+import random
+import time
 import uuid
 from datetime import datetime
 
@@ -44,15 +48,129 @@ def get_cashfree_headers(include_request_id=True):
     
     return headers
 
+
+class TransferRejected(ValueError):
+    """Cashfree refused a transfer request with HTTP 400, so no money moved."""
+
+
+class CashfreeClient:
+    """
+    Shared client for the Cashfree Payouts API. Every call goes through one
+    pooled ``requests.Session``, so TLS connections are reused between calls
+    instead of handshaking each time. GETs, and POSTs that carry an
+    idempotency key (the transfer or beneficiary id), are retried with
+    jittered exponential backoff on connection errors, timeouts, 429 and 5xx.
+    Each attempt's latency is recorded per endpoint in Redis (see ``metrics``).
+    """
+    ENDPOINTS = ('get_beneficiary', 'create_beneficiary', 'transfer', 'transfer_status', 'balance', 'connection_test')
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self):
+        validate_cashfree_settings()
+        self.base_url = settings.CASHFREE_PAYOUT_BASE_URL.rstrip('/')
+        self.timeout = (settings.CASHFREE_CONNECT_TIMEOUT, settings.CASHFREE_TIMEOUT)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=settings.CASHFREE_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(get_cashfree_headers(include_request_id=False))
+
+    @staticmethod
+    def idempotency_key(kind, value):
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'cashfree:{kind}:{value}'))
+
+    def request(self, method, path, endpoint, idempotency_key=None, **kwargs):
+        retryable = method == 'GET' or idempotency_key is not None
+        attempts = settings.CASHFREE_MAX_RETRIES + 1 if retryable else 1
+        headers = {}
+        if idempotency_key:
+            headers['x-idempotency-key'] = idempotency_key
+        for attempt in range(attempts):
+            # Every attempt of a keyed call carries the same request id, so the gateway sees one request.
+            headers['x-request-id'] = idempotency_key or str(uuid.uuid4())
+            res, error = None, None
+            started = time.monotonic()
+            try:
+                res = self.session.request(
+                    method, f'{self.base_url}{path}', headers=headers, timeout=self.timeout, **kwargs
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            failed = res is None or res.status_code in self.RETRY_STATUSES
+            self.record(endpoint, (time.monotonic() - started) * 1000, failed, attempt > 0)
+
+            if not failed:
+                return res
+            if attempt == attempts - 1:
+                if error:
+                    raise error
+                return res
+
+            delay = settings.CASHFREE_RETRY_BACKOFF * (2 ** attempt) * random.uniform(0.5, 1.5)
+            retry_after = res.headers.get('Retry-After') if res is not None else None
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+            logger.warning(
+                f"Cashfree {endpoint} attempt {attempt + 1} failed "
+                f"({error or res.status_code}), retrying in {delay:.2f}s"
+            )
+            time.sleep(delay)
+
+    @staticmethod
+    def _metrics_key(endpoint):
+        return f'cashfree:latency:{endpoint}'
+
+    @classmethod
+    def record(cls, endpoint, elapsed_ms, failed, retried):
+        bucket = next((f'le_{limit}' for limit in cls.LATENCY_BUCKETS_MS if elapsed_ms <= limit), 'le_inf')
+        try:
+            pipe = get_redis_connection('default').pipeline()
+            key = cls._metrics_key(endpoint)
+            pipe.hincrby(key, 'calls', 1)
+            pipe.hincrby(key, 'total_ms', int(elapsed_ms))
+            pipe.hincrby(key, bucket, 1)
+            if failed:
+                pipe.hincrby(key, 'errors', 1)
+            if retried:
+                pipe.hincrby(key, 'retries', 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record Cashfree latency for {endpoint}: {e}")
+
+    @classmethod
+    def metrics(cls):
+        """Return per-endpoint call, error and retry counts, mean latency and latency buckets in ms."""
+        pipe = get_redis_connection('default').pipeline()
+        for endpoint in cls.ENDPOINTS:
+            pipe.hgetall(cls._metrics_key(endpoint))
+        result = {}
+        for endpoint, raw in zip(cls.ENDPOINTS, pipe.execute()):
+            if not raw:
+                continue
+            stats = {
+                (field.decode() if isinstance(field, bytes) else field): int(value) for field, value in raw.items()
+            }
+            stats['avg_ms'] = round(stats['total_ms'] / stats['calls'], 1)
+            result[endpoint] = stats
+        return result
+
+
+_client = None
+
+
+def get_cashfree_client():
+    global _client
+    if _client is None:
+        _client = CashfreeClient()
+    return _client
+
+
 def test_cashfree_connection():
     try:
-        validate_cashfree_settings()
-        
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/beneficiary"
-        headers = get_cashfree_headers()
         params = {'beneficiary_id': 'test-connection-123'}
     
-        res = requests.get(url, headers=headers, params=params, timeout=30)
+        res = get_cashfree_client().request('GET', '/beneficiary', 'connection_test', params=params)
         
         
         if res.status_code in [401, 403]:
@@ -69,11 +187,6 @@ def test_cashfree_connection():
 
 def create_beneficiary_v2(beneficiary_data):
     try:
-        validate_cashfree_settings()
-        
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/beneficiary"
-        headers = get_cashfree_headers()
-        
         payload = {
             "beneficiary_id": beneficiary_data.get("beneficiary_id") or beneficiary_data.get("beneId"),
             "beneficiary_name": beneficiary_data.get("beneficiary_name") or beneficiary_data.get("name"),
@@ -92,7 +205,11 @@ def create_beneficiary_v2(beneficiary_data):
         }
 
         
-        res = requests.post(url, json=payload, headers=headers, timeout=30)
+        res = get_cashfree_client().request(
+            'POST', '/beneficiary', 'create_beneficiary',
+            idempotency_key=CashfreeClient.idempotency_key('beneficiary', payload['beneficiary_id']),
+            json=payload,
+        )
      
         
         if res.status_code == 409:
@@ -114,11 +231,6 @@ def create_beneficiary_v2(beneficiary_data):
 
 def get_beneficiary_v2(beneficiary_id=None, bank_account_number=None, bank_ifsc=None):
     try:
-        validate_cashfree_settings()
-        
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/beneficiary"
-        headers = get_cashfree_headers()
-        
         # Build query parameters based on what's provided
         params = {}
         if beneficiary_id:
@@ -129,7 +241,7 @@ def get_beneficiary_v2(beneficiary_id=None, bank_account_number=None, bank_ifsc=
         else:
             raise ValueError("Either beneficiary_id or both bank_account_number and bank_ifsc must be provided")
                 
-        res = requests.get(url, headers=headers, params=params, timeout=30)
+        res = get_cashfree_client().request('GET', '/beneficiary', 'get_beneficiary', params=params)
         
         if res.status_code == 404:
             return None
@@ -144,11 +256,6 @@ def get_beneficiary_v2(beneficiary_id=None, bank_account_number=None, bank_ifsc=
 
 def standard_transfer_v2(transfer_id, amount, beneficiary_id, remarks='Doctor Withdrawal'):
     try:
-        validate_cashfree_settings()
-        
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/transfers"
-        headers = get_cashfree_headers()
-        
         payload = {
             "transfer_id": str(transfer_id),
             "transfer_amount": float(amount),
@@ -161,16 +268,21 @@ def standard_transfer_v2(transfer_id, amount, beneficiary_id, remarks='Doctor Wi
         
      
         
-        res = requests.post(url, json=payload, headers=headers, timeout=60)
+        # Keyed on transfer_id: a retry after a lost response comes back as 409 instead of paying twice.
+        res = get_cashfree_client().request(
+            'POST', '/transfers', 'transfer',
+            idempotency_key=CashfreeClient.idempotency_key('transfer', transfer_id),
+            json=payload,
+        )
         
         
         # Handle specific error cases
         if res.status_code == 400:
             try:
                 error_data = res.json()
-                raise ValueError(f"Transfer validation failed: {error_data}")
             except ValueError:
-                raise ValueError(f"Transfer failed: {res.text}")
+                raise TransferRejected(f"Transfer failed: {res.text}")
+            raise TransferRejected(f"Transfer validation failed: {error_data}")
         
         if res.status_code == 409:
             return {
@@ -189,11 +301,6 @@ def standard_transfer_v2(transfer_id, amount, beneficiary_id, remarks='Doctor Wi
 
 def get_transfer_status_v2(transfer_id=None, cf_transfer_id=None):
     try:
-        validate_cashfree_settings()
-        
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/transfers"
-        headers = get_cashfree_headers()
-        
         # Build query parameters
         params = {}
         if transfer_id:
@@ -203,7 +310,7 @@ def get_transfer_status_v2(transfer_id=None, cf_transfer_id=None):
         else:
             raise ValueError("Either transfer_id or cf_transfer_id must be provided")
                 
-        res = requests.get(url, headers=headers, params=params, timeout=30)
+        res = get_cashfree_client().request('GET', '/transfers', 'transfer_status', params=params)
                 
         if res.status_code == 404:
             return None
@@ -219,13 +326,8 @@ def get_transfer_status_v2(transfer_id=None, cf_transfer_id=None):
 def get_account_balance_v2():
     """Get account balance using V2 API (if available)"""
     try:
-        validate_cashfree_settings()
-        
         # Note: Check if V2 has a balance endpoint
-        url = f"{settings.CASHFREE_PAYOUT_BASE_URL}/account/balance"
-        headers = get_cashfree_headers()
-                
-        res = requests.get(url, headers=headers, timeout=30)
+        res = get_cashfree_client().request('GET', '/account/balance', 'balance')
                 
         if res.status_code == 404:
             return None
@@ -99,14 +99,14 @@ const DoctorEarningsReport = () => {
 
     try {
       setActionLoadingId(id);
-      await adminAxios.post(`/admin-withdrawal/${id}/action/`, {
+      const res = await adminAxios.post(`/admin-withdrawal/${id}/action/`, {
         action: actionType,
         remarks: remarks,
       });
 
       await Swal.fire({
         icon: 'success',
-        title: `Request ${actionType === 'approve' ? 'approved' : 'rejected'} successfully`,
+        title: actionType === 'approve' ? 'Payout queued' : 'Request rejected successfully',
         showConfirmButton: false,
         timer: 1500,
         toast: true,
@@ -115,7 +115,11 @@ const DoctorEarningsReport = () => {
 
       setWithdrawals(prev =>
         prev.map(w =>
-          w.id === id ? { ...w, status: actionType } : w
+          w.id === id
+            ? actionType === 'approve'
+              ? { ...w, payout_state: res.data.payout_state }
+              : { ...w, status: 'rejected' }
+            : w
         )
       );
     } catch (error) {
@@ -123,7 +127,7 @@ const DoctorEarningsReport = () => {
       Swal.fire({
         icon: 'error',
         title: 'Error',
-        text: error.response?.data?.message || 'Action failed. Please try again.',
+        text: error.response?.data?.error || error.response?.data?.message || 'Action failed. Please try again.',
       });
     } finally {
       setActionLoadingId(null);
@@ -337,7 +341,9 @@ const WithdrawalsTable = ({ requests, getStatusBadge, handleAction, actionLoadin
                 <td className="px-6 py-4 text-sm">{new Date(req.request_date || req.updated_date).toLocaleDateString('en-IN')}</td>
                 <td className="px-6 py-4">{getStatusBadge(req.status)}</td>
                 <td className="px-6 py-4">
-                  {req.status === 'pending' ? (
+                  {req.status === 'pending' && ['queued', 'submitted'].includes(req.payout_state) ? (
+                    <span className="text-sm text-gray-600">Payout {req.payout_state}</span>
+                  ) : req.status === 'pending' ? (
                     <div className="flex gap-2">
                       <button
                         disabled={actionLoadingId === req.id}
@@ -10,8 +10,10 @@ const PaymentHistory = () => {
   const [searchTerm, setSearchTerm] = useState('');
   const [statusFilter, setStatusFilter] = useState('All Status');
   const [typeFilter, setTypeFilter] = useState('All');
+  // The payment history is cursor paginated: cursors[i] fetches page i + 1.
+  const [cursors, setCursors] = useState([null]);
   const [currentPage, setCurrentPage] = useState(1);
-  const [count, setCount] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
   const [sidebarOpen, setSidebarOpen] = useState(false);
   const { token } = useSelector((state) => state.auth);
 
@@ -26,23 +28,40 @@ const PaymentHistory = () => {
             status: statusFilter !== 'All Status' ? statusFilter.toLowerCase() : undefined,
             search: searchTerm || undefined,
             type: typeFilter !== 'All' ? typeFilter.toLowerCase() : undefined,
-            page: currentPage
+            page_size: pageSize,
+            cursor: cursors[currentPage - 1] || undefined
           }
         });
 
+        const next = response.data?.next;
         setPayments(response.data?.results || []);
-        setCount(response.data?.count || 0);
+        setNextCursor(next ? new URL(next).searchParams.get('cursor') : null);
       } catch (err) {
         console.error('Error fetching payments', err);
         setPayments([]);
-        setCount(0);
+        setNextCursor(null);
       } finally {
         setLoading(false);
       }
     };
 
     fetchPayments();
-  }, [searchTerm, statusFilter, typeFilter, currentPage]);
+  }, [searchTerm, statusFilter, typeFilter, currentPage, cursors]);
+
+  const resetPages = () => {
+    setCursors([null]);
+    setCurrentPage(1);
+  };
+
+  const goToNextPage = () => {
+    if (!nextCursor) return;
+    setCursors((prev) => [...prev.slice(0, currentPage), nextCursor]);
+    setCurrentPage((page) => page + 1);
+  };
+
+  const goToPreviousPage = () => {
+    setCurrentPage((page) => Math.max(page - 1, 1));
+  };
 
   const getStatusColor = (status = '') => {
     switch (status.toLowerCase()) {
@@ -75,8 +94,6 @@ const PaymentHistory = () => {
   const pendingPayments = payments.filter(p => p.payment_status === 'pending').length;
   const failedPayments = payments.filter(p => p.payment_status === 'failed').length;
 
-  const totalPages = Math.ceil(count / pageSize);
-
   return (
     <div className="flex h-screen bg-gray-50">
       <AdminSidebar sidebarOpen={sidebarOpen} setSidebarOpen={setSidebarOpen} />
@@ -145,7 +162,7 @@ const PaymentHistory = () => {
                   type="text"
                   placeholder="Search..."
                   value={searchTerm}
-                  onChange={(e) => { setSearchTerm(e.target.value); setCurrentPage(1); }}
+                  onChange={(e) => { setSearchTerm(e.target.value); resetPages(); }}
                   className="pl-10 pr-4 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 w-full"
                 />
               </div>
@@ -153,7 +170,7 @@ const PaymentHistory = () => {
                 <Filter className="absolute left-3 top-1/2 transform -translate-y-1/2 text-gray-400 w-5 h-5" />
                 <select
                   value={statusFilter}
-                  onChange={(e) => { setStatusFilter(e.target.value); setCurrentPage(1); }}
+                  onChange={(e) => { setStatusFilter(e.target.value); resetPages(); }}
                   className="pl-10 pr-8 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 bg-white"
                 >
                   <option>All Status</option>
@@ -165,7 +182,7 @@ const PaymentHistory = () => {
               <div className="relative">
                 <select
                   value={typeFilter}
-                  onChange={(e) => { setTypeFilter(e.target.value); setCurrentPage(1); }}
+                  onChange={(e) => { setTypeFilter(e.target.value); resetPages(); }}
                   className="pl-3 pr-8 py-2 border border-gray-300 rounded-lg focus:ring-2 focus:ring-blue-500 bg-white"
                 >
                   <option>All</option>
@@ -241,17 +258,22 @@ const PaymentHistory = () => {
           </div>
 
           <div className="mt-6 flex justify-between items-center">
-            <p className="text-sm text-gray-600">Showing {Math.min(count, pageSize * currentPage)} of {count} results</p>
+            <p className="text-sm text-gray-600">Page {currentPage}</p>
             <div className="flex space-x-2">
-              {[...Array(totalPages)].map((_, i) => (
-                <button
-                  key={i}
-                  onClick={() => setCurrentPage(i + 1)}
-                  className={`px-3 py-1 rounded ${currentPage === i + 1 ? 'bg-blue-600 text-white' : 'bg-gray-200 text-gray-700'}`}
-                >
-                  {i + 1}
-                </button>
-              ))}
+              <button
+                onClick={goToPreviousPage}
+                disabled={currentPage === 1 || loading}
+                className="px-3 py-1 rounded bg-gray-200 text-gray-700 disabled:opacity-50"
+              >
+                Previous
+              </button>
+              <button
+                onClick={goToNextPage}
+                disabled={!nextCursor || loading}
+                className="px-3 py-1 rounded bg-blue-600 text-white disabled:opacity-50"
+              >
+                Next
+              </button>
             </div>
           </div>
         </div>
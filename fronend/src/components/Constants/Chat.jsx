@@ -1,6 +1,7 @@
 import React, { useEffect, useState, useRef } from 'react';
 import { useSelector } from 'react-redux';
 import { useParams } from 'react-router-dom';
+import { userAxios } from '../../axios/UserAxios';
 
 const ChatRoom = () => {
   const [socket, setSocket] = useState(null);
@@ -16,6 +17,10 @@ const ChatRoom = () => {
   const [recording, setRecording] = useState(false);
   const mediaRecorderRef = useRef(null);
   const audioChunksRef = useRef([]);
+  // Cursor for the page of messages before the oldest one shown; null once the start is reached.
+  const [historyBefore, setHistoryBefore] = useState(null);
+  const [loadingEarlier, setLoadingEarlier] = useState(false);
+  const prependedRef = useRef(false);
 
   useEffect(() => {
     if (!token || !id) return;
@@ -30,6 +35,15 @@ const ChatRoom = () => {
         setTypingUser(data.is_typing ? data.user : null);
       } else if (data.type === 'history') {
         setMessages(data.messages);
+        setHistoryBefore(data.has_more ? data.before : null);
+      } else if (data.type === 'history_page') {
+        prependedRef.current = true;
+        setMessages((prev) => [...data.messages, ...prev]);
+        setHistoryBefore(data.has_more ? data.before : null);
+        setLoadingEarlier(false);
+      } else if (data.error) {
+        console.error(data.error);
+        setLoadingEarlier(false);
       } else {
         setMessages((prev) => [...prev, data]);
       }
@@ -40,9 +54,19 @@ const ChatRoom = () => {
   }, [id, token]);
 
   useEffect(() => {
+    if (prependedRef.current) {
+      prependedRef.current = false;
+      return;
+    }
     scrollRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
+  const loadEarlier = () => {
+    if (!historyBefore || loadingEarlier || socket?.readyState !== WebSocket.OPEN) return;
+    setLoadingEarlier(true);
+    socket.send(JSON.stringify({ type: 'load_before', before: historyBefore }));
+  };
+
   const sendTyping = (isTyping) => {
     if (socket?.readyState === WebSocket.OPEN) {
       socket.send(JSON.stringify({ type: 'typing', is_typing: isTyping }));
@@ -53,21 +77,32 @@ const ChatRoom = () => {
     const selected = e.target.files[0];
     if (!selected) return;
     if (selected.size > 5 * 1024 * 1024) return alert("Max 5MB file size allowed.");
-    const reader = new FileReader();
-    reader.onloadend = () => {
-      setFile(reader.result);
-      setFilePreview(selected.name);
-    };
-    reader.readAsDataURL(selected);
+    setFile(selected);
+    setFilePreview(selected.name);
   };
 
-  const sendMessage = () => {
+  const uploadAttachment = async () => {
+    const formData = new FormData();
+    formData.append('file', file, filePreview);
+    const response = await userAxios.post(`/chat/${id}/attachments/`, formData, {
+      headers: { 'Content-Type': 'multipart/form-data', Authorization: `Bearer ${token}` },
+    });
+    return response.data.file_ref;
+  };
+
+  const sendMessage = async () => {
     if (!input.trim() && !file) return;
     const payload = {
       type: 'message',
       message: input,
-      file: file,
     };
+    if (file) {
+      try {
+        payload.file_ref = await uploadAttachment();
+      } catch (error) {
+        return alert(error.response?.data?.error || "File upload failed.");
+      }
+    }
     if (socket?.readyState === WebSocket.OPEN) {
       socket.send(JSON.stringify(payload));
       setInput('');
@@ -88,12 +123,8 @@ const ChatRoom = () => {
 
     mediaRecorder.onstop = () => {
       const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setFile(reader.result);
-        setFilePreview("voice_message.webm");
-      };
-      reader.readAsDataURL(audioBlob);
+      setFile(audioBlob);
+      setFilePreview("voice_message.webm");
     };
 
     mediaRecorder.start();
@@ -110,6 +141,17 @@ const ChatRoom = () => {
       <div className="bg-blue-600 text-white px-4 py-3 font-bold text-lg">Chat Room #{id}</div>
 
       <div className="flex-1 overflow-y-auto p-4 space-y-3">
+        {historyBefore && (
+          <div className="flex justify-center">
+            <button
+              onClick={loadEarlier}
+              disabled={loadingEarlier}
+              className="text-sm text-blue-600 hover:underline disabled:opacity-50"
+            >
+              {loadingEarlier ? 'Loading...' : 'Load earlier messages'}
+            </button>
+          </div>
+        )}
         {messages.map((msg, i) => {
           const isSender = msg.sender === user?.username;
           return (
@@ -2,11 +2,12 @@ import React, { useRef, useEffect, useState } from 'react';
 import { FiVideo, FiMic } from 'react-icons/fi';
 import { MdMicOff, MdPhoneDisabled, MdVideocamOff } from 'react-icons/md';
 
-const EmergencyVideoCall = ({ emergencyId, token, onEndCall }) => {
+const EmergencyVideoCall = ({ emergencyId, token, ticket, onEndCall }) => {
   const localVideoRef = useRef(null);
   const remoteVideoRef = useRef(null);
   const pcRef = useRef(null);
   const wsRef = useRef(null);
+  const pingRef = useRef(null);
   const pendingCandidates = useRef([]);
   const isRemoteDescSet = useRef(false);
   const offerRetryRef = useRef(null);
@@ -76,13 +77,19 @@ const EmergencyVideoCall = ({ emergencyId, token, onEndCall }) => {
 
         const scheme = window.location.protocol === "https:" ? "wss" : "ws";
         const host = window.location.host;
-        const wsUrl = `${scheme}://${host}/ws/emergency/emergency_${emergencyId}/?token=${encodeURIComponent(token)}`;
+        const wsUrl = `${scheme}://${host}/ws/emergency/emergency_${emergencyId}/?token=${encodeURIComponent(token)}${ticket ? `&ticket=${encodeURIComponent(ticket)}` : ''}`;
         const ws = new WebSocket(wsUrl);
         wsRef.current = ws;
 
         ws.onopen = () => {
           addDebug('WebSocket connected');
           setStatus('Connected to server');
+          // Keeps our room membership alive on the server.
+          pingRef.current = setInterval(() => {
+            if (ws.readyState === WebSocket.OPEN) {
+              ws.send(JSON.stringify({ type: 'ping', timestamp: Date.now() }));
+            }
+          }, 25000);
         };
 
         ws.onerror = () => {
@@ -91,6 +98,7 @@ const EmergencyVideoCall = ({ emergencyId, token, onEndCall }) => {
         };
 
         ws.onclose = (event) => {
+          clearInterval(pingRef.current);
           addDebug(`WebSocket closed: ${event.code}`);
           setStatus('Disconnected');
         };
@@ -210,13 +218,14 @@ const EmergencyVideoCall = ({ emergencyId, token, onEndCall }) => {
 
     return () => {
       if (offerRetryRef.current) clearInterval(offerRetryRef.current);
+      if (pingRef.current) clearInterval(pingRef.current);
       if (pcRef.current) pcRef.current.close();
       if (wsRef.current) wsRef.current.close();
       if (localStreamRef.current) {
         localStreamRef.current.getTracks().forEach(track => track.stop());
       }
     };
-  }, [refsReady, emergencyId, token]);
+  }, [refsReady, emergencyId, token, ticket]);
 
   const toggleMute = () => {
     const tracks = localStreamRef.current?.getAudioTracks();
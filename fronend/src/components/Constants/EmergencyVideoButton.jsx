@@ -15,6 +15,7 @@ const EmergencyVideoCallButton = ({
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState(null);
     const [showVideoCall, setShowVideoCall] = useState(false);
+    const [ticket, setTicket] = useState(null);
     const [retryCount, setRetryCount] = useState(0);
 
     const handleVideoCall = async () => {
@@ -43,6 +44,7 @@ const EmergencyVideoCallButton = ({
             try {
                 const data = await response.json();
                 if (data?.valid) {
+                    setTicket(data.ticket);
                     setShowVideoCall(true);
                 } else {
                     throw new Error(data?.message || 'Video call access denied');
@@ -113,6 +115,7 @@ const EmergencyVideoCallButton = ({
             <EmergencyVideoCall
                 emergencyId={emergencyId}
                 token={token}
+                ticket={ticket}
                 onEndCall={handleEndCall}
             />
         );
@@ -4,11 +4,12 @@ import { ToastContainer, toast } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
 import { MdMicOff, MdPhoneDisabled, MdVideocamOff } from 'react-icons/md';
 
-const VideoCall = ({ slotId, token, onEndCall }) => {
+const VideoCall = ({ slotId, token, ticket, onEndCall }) => {
   const localVideoRef = useRef(null);
   const remoteVideoRef = useRef(null);
   const pcRef = useRef(null);
   const wsRef = useRef(null);
+  const pingRef = useRef(null);
   const pendingCandidates = useRef([]);
   const isRemoteDescSet = useRef(false);
   const offerRetryRef = useRef(null);
@@ -79,7 +80,7 @@ const VideoCall = ({ slotId, token, onEndCall }) => {
 
         const scheme = window.location.protocol === "https:" ? "wss" : "ws";
         const host = window.location.host;
-        const wsUrl = `${scheme}://${host}/ws/videocall/${slotId}/?token=${encodeURIComponent(token)}`;
+        const wsUrl = `${scheme}://${host}/ws/videocall/${slotId}/?token=${encodeURIComponent(token)}${ticket ? `&ticket=${encodeURIComponent(ticket)}` : ''}`;
 
         const ws = new WebSocket(wsUrl);
         wsRef.current = ws;
@@ -87,6 +88,12 @@ const VideoCall = ({ slotId, token, onEndCall }) => {
         ws.onopen = () => {
           addDebug('WebSocket connected');
           setStatus('Connected to server');
+          // Keeps our room membership alive on the server.
+          pingRef.current = setInterval(() => {
+            if (ws.readyState === WebSocket.OPEN) {
+              ws.send(JSON.stringify({ type: 'ping', timestamp: Date.now() }));
+            }
+          }, 25000);
         };
 
         ws.onerror = () => {
@@ -95,6 +102,7 @@ const VideoCall = ({ slotId, token, onEndCall }) => {
         };
 
         ws.onclose = (event) => {
+          clearInterval(pingRef.current);
           addDebug(`WebSocket closed: ${event.code}`);
           setStatus('Disconnected');
         };
@@ -223,13 +231,14 @@ const VideoCall = ({ slotId, token, onEndCall }) => {
 
     return () => {
       if (offerRetryRef.current) clearInterval(offerRetryRef.current);
+      if (pingRef.current) clearInterval(pingRef.current);
       if (pcRef.current) pcRef.current.close();
       if (wsRef.current) wsRef.current.close();
       if (localStreamRef.current) {
         localStreamRef.current.getTracks().forEach(track => track.stop());
       }
     };
-  }, [refsReady, slotId, token]);
+  }, [refsReady, slotId, token, ticket]);
 
   const toggleMute = () => {
     const tracks = localStreamRef.current?.getAudioTracks();
@@ -9,6 +9,7 @@ import 'react-toastify/dist/ReactToastify.css';
 
 const VideoCallButton = ({ slotId, token }) => {
   const [showVideoCall, setShowVideoCall] = useState(false);
+  const [ticket, setTicket] = useState(null);
   const [loading, setLoading] = useState(false);
 
   const handleVideoCall = async () => {
@@ -18,6 +19,7 @@ const VideoCallButton = ({ slotId, token }) => {
       const response = await userAxios.get(`/validate-videocall/${slotId}/`);
       
       if (response.data.valid) {
+        setTicket(response.data.ticket);
         setShowVideoCall(true);
       } else {
         toast.error(response.data.error || 'Video call not available');
@@ -45,6 +47,7 @@ const VideoCallButton = ({ slotId, token }) => {
         <VideoCall 
           slotId={slotId} 
           token={token} 
+          ticket={ticket}
           onEndCall={() => setShowVideoCall(false)} 
         />,
         document.body)
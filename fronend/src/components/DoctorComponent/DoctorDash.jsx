@@ -13,8 +13,14 @@ import {
 import DocSidebar from "./DocSidebar";
 import { doctorAxios } from "../../axios/DoctorAxios";
 import fileDownload from "js-file-download";
+import { toast, ToastContainer } from "react-toastify";
 import moment from "moment";
 
+const PDF_POLL_INTERVAL = 2000;
+// Matches REPORT_JOB_STALE_AFTER: past this the job was likely lost, and
+// requesting the report again replaces it.
+const PDF_POLL_TIMEOUT = 10 * 60 * 1000;
+
 const StatCard = ({ title, value, icon, color }) => {
   const colors = {
     emerald: "from-emerald-500 to-teal-600",
@@ -45,6 +51,7 @@ const DoctorDashboard = () => {
   const [analytics, setAnalytics] = useState(null);
   const [pagination, setPagination] = useState({ next: null, previous: null });
   const [filter, setFilter] = useState("all");
+  const [pdfGenerating, setPdfGenerating] = useState(false);
   const { user } = useSelector((state) => state.auth);
 
   useEffect(() => {
@@ -86,14 +93,31 @@ const DoctorDashboard = () => {
     }
   };
 
+  // The PDF is rendered by a background job: poll its status until the file is ready.
   const handlePDFDownload = async () => {
+    setPdfGenerating(true);
     try {
-      const response = await doctorAxios.get("doctor-pdf/", {
+      let { data: job } = await doctorAxios.get("doctor-pdf/");
+      const deadline = Date.now() + PDF_POLL_TIMEOUT;
+      while (job.status === "queued" || job.status === "running") {
+        if (Date.now() >= deadline) {
+          throw new Error("The report is taking too long. Please try again.");
+        }
+        await new Promise((resolve) => setTimeout(resolve, PDF_POLL_INTERVAL));
+        ({ data: job } = await doctorAxios.get(job.status_url));
+      }
+      if (job.status !== "ready" || !job.download_url) {
+        throw new Error(job.error || "Report generation failed");
+      }
+      const response = await doctorAxios.get(job.download_url, {
         responseType: "blob"
       });
       fileDownload(response.data, "wallet_report.pdf");
     } catch (error) {
       console.error("Error downloading PDF:", error);
+      toast.error(error.message || "Could not download the PDF report.");
+    } finally {
+      setPdfGenerating(false);
     }
   };
 
@@ -167,6 +191,7 @@ const DoctorDashboard = () => {
 
   return (
     <div className="min-h-screen bg-gradient-to-br from-slate-50 to-slate-100">
+      <ToastContainer />
       <div className="flex">
         <DocSidebar />
         <main className="flex-1 overflow-y-auto">
@@ -218,9 +243,10 @@ const DoctorDashboard = () => {
               </button>
               <button
                 onClick={handlePDFDownload}
-                className="bg-green-500 text-white px-4 py-2 rounded-lg"
+                disabled={pdfGenerating}
+                className="bg-green-500 text-white px-4 py-2 rounded-lg disabled:opacity-50"
               >
-                Download PDF
+                {pdfGenerating ? "Preparing PDF..." : "Download PDF"}
               </button>
             </div>
 